@@ -0,0 +1,141 @@
+"""
+Controlo de admissão dos endpoints públicos de votos.
+
+`POST /api/feedback` não tem autenticação e cada voto é um commit no SQLite (mais a
+outbox do Firestore). Um botão preso num kiosk, a rajada de reenvios depois de uma falha
+de rede ou um script podiam ocupar todos os threads do worker e deixar o dashboard sem
+resposta. O `AdmissionController` decide, em memória e por processo, antes do handler:
+
+1. limite por cliente (token bucket): `rate` votos/s em média, rajadas até `burst`.
+   Os buckets ficam num OrderedDict limitado a `max_clients` (sai o menos recente; um
+   bucket cheio é igual a um bucket que não existe);
+2. limite global de pedidos em curso (`max_concurrent`), com uma fila de espera limitada
+   (`max_queue` pedidos, no máximo `queue_timeout` segundos). Como quem espera também
+   ocupa um thread, `max_concurrent + max_queue` deve ficar abaixo dos threads do worker.
+
+Um pedido recusado recebe 429 com um `Retry-After` com jitter (os kiosks não voltam
+todos no mesmo segundo).
+"""
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+REASONS = ('rate', 'queue_full', 'queue_timeout')
+
+
+class TokenBuckets:
+    """Um token bucket por cliente (ex.: IP)."""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_clients = max(1, int(max_clients))
+        self._buckets = OrderedDict()  # cliente -> [tokens, última atualização]
+        self._lock = threading.Lock()
+
+    def take(self, client, now=None):
+        """Gasta um token. Devolve 0 se havia token, senão os segundos até haver um."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Token buckets por cliente + limite de pedidos em curso com fila de espera limitada."""
+
+    def __init__(self, rate=5.0, burst=30, max_concurrent=8, max_queue=8, queue_timeout=2.0,
+                 retry_after=1.0, jitter=1.0, max_clients=10000):
+        self.buckets = TokenBuckets(rate, burst, max_clients)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = max(0.0, float(queue_timeout))
+        self.retry_after = max(1.0, float(retry_after))
+        self.jitter = max(0.0, float(jitter))
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+
+        self.admitted = 0
+        self.queued = 0
+        self.shed = dict.fromkeys(REASONS, 0)
+        self.max_in_flight_seen = 0
+
+    def _com_jitter(self, segundos):
+        """Retry-After em segundos inteiros, ao acaso entre `segundos` e `segundos * (1 + jitter)`."""
+        return random.randint(math.ceil(segundos), math.ceil(segundos * (1 + self.jitter)))
+
+    def admit(self, client):
+        """Tenta admitir um pedido de `client`.
+
+        Devolve None se foi admitido (chamar `release()` no fim do pedido), senão
+        (motivo, Retry-After em segundos).
+        """
+        espera = self.buckets.take(client)
+        if espera:
+            return self._recusar('rate', max(espera, self.retry_after))
+
+        with self._cond:
+            if self.in_flight >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    return self._recusar('queue_full', self.retry_after)
+                self.waiting += 1
+                self.queued += 1
+                try:
+                    admitido = self._cond.wait_for(lambda: self.in_flight < self.max_concurrent,
+                                                   timeout=self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitido:
+                    return self._recusar('queue_timeout', self.retry_after)
+            self.in_flight += 1
+            self.admitted += 1
+            self.max_in_flight_seen = max(self.max_in_flight_seen, self.in_flight)
+        return None
+
+    def _recusar(self, motivo, segundos):
+        with self._cond:
+            self.shed[motivo] += 1
+        return motivo, self._com_jitter(segundos)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+                'queued': self.queued,
+                'inFlight': self.in_flight,
+                'waiting': self.waiting,
+                'maxInFlightSeen': self.max_in_flight_seen,
+                'clients': len(self.buckets),
+                'limits': {
+                    'rate': self.buckets.rate,
+                    'burst': self.buckets.burst,
+                    'maxConcurrent': self.max_concurrent,
+                    'maxQueue': self.max_queue,
+                    'queueTimeout': self.queue_timeout,
+                },
+            }
@@ -0,0 +1,279 @@
+"""
+Análises de tendência (médias móveis, índice de satisfação, anomalias) com NumPy.
+
+As contagens diárias (`feedback_daily_counts`) são carregadas para uma matriz densa
+dias × graus (uma linha por dia, do primeiro dia com dados até hoje, dias sem votos a 0).
+A matriz fica em memória por processo; quando a versão dos dados muda só são relidos os
+últimos `refresh_days` dias (votos offline podem chegar com alguns dias de atraso) e os
+dias novos são acrescentados. Se o total da matriz deixar de bater certo com o do SQLite
+(ex.: importação de dias antigos), a matriz é recarregada por inteiro.
+
+Os cálculos são vetorizados sobre a matriz inteira (somas acumuladas), por isso o custo
+não depende do número de votos e séries de vários anos respondem em milissegundos.
+
+NumPy é opcional: sem ele `available()` devolve False e os endpoints respondem 503.
+É importado na primeira chamada a `available()` e não no arranque da aplicação.
+"""
+import importlib.util
+import threading
+import time
+from datetime import date, timedelta
+
+import migrations
+
+np = None
+_numpy_em_falta = False
+
+# Colunas da matriz, pela ordem dos códigos do esquema compacto (0, 1, 2)
+GRAUS = tuple(sorted(migrations.GRAU_CODES, key=migrations.GRAU_CODES.get))
+
+# Peso de cada grau no índice de satisfação (0 a 100)
+PESOS_INDICE = (0.0, 50.0, 100.0)
+
+
+def available():
+    global np, _numpy_em_falta
+    if np is None and not _numpy_em_falta:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - depende do ambiente
+            _numpy_em_falta = True
+        else:
+            np = numpy
+    return np is not None
+
+
+class DailyCountsCache:
+    """Matriz de contagens diárias (dias × graus) mantida em memória e atualizada por incrementos."""
+
+    def __init__(self, connect, refresh_days=7, full_reload_seconds=600.0):
+        self._connect = connect
+        self.refresh_days = refresh_days
+        self.full_reload_seconds = full_reload_seconds
+        self._lock = threading.Lock()
+        self._start = None
+        self._counts = None
+        self._version = None
+        self._loaded_at = 0.0
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def snapshot(self):
+        """(primeiro dia, matriz int64 só de leitura) atualizados para a versão atual dos dados."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                # Uma transação de leitura: versão, contagens e total vêm do mesmo snapshot
+                conn.execute('BEGIN')
+                self._refresh(conn, date.today())
+            finally:
+                conn.close()
+            return self._start, self._counts
+
+    def _refresh(self, conn, hoje):
+        version = migrations.read_data_version(conn)
+        ultimo = self._start + timedelta(days=len(self._counts) - 1) if self._counts is not None else None
+        if version == self._version and ultimo == hoje:
+            return
+
+        epoch_mudou = self._version is None or version.split('.')[0] != self._version.split('.')[0]
+        expirada = time.monotonic() - self._loaded_at > self.full_reload_seconds
+        if self._counts is None or epoch_mudou or expirada or not self._atualizar_fim(conn, hoje):
+            self._carregar_tudo(conn, hoje)
+        self._version = version
+
+    def _linhas(self, conn, desde, hoje):
+        return conn.execute('''
+            SELECT data, grau_satisfacao, total
+            FROM feedback_daily_counts
+            WHERE data >= ? AND data <= ? AND total != 0
+        ''', (desde.isoformat(), hoje.isoformat())).fetchall()
+
+    def _preencher(self, counts, start, linhas):
+        coluna = {grau: i for i, grau in enumerate(GRAUS)}
+        for row in linhas:
+            j = coluna.get(row['grau_satisfacao'])
+            if j is not None:
+                counts[(date.fromisoformat(row['data']) - start).days, j] = row['total']
+
+    def _carregar_tudo(self, conn, hoje):
+        row = conn.execute(
+            'SELECT MIN(data) AS inicio FROM feedback_daily_counts WHERE total != 0 AND data <= ?',
+            (hoje.isoformat(),)
+        ).fetchone()
+        start = date.fromisoformat(row['inicio']) if row['inicio'] else hoje
+        counts = np.zeros(((hoje - start).days + 1, len(GRAUS)), dtype=np.int64)
+        self._preencher(counts, start, self._linhas(conn, start, hoje))
+        counts.flags.writeable = False
+
+        self._start, self._counts = start, counts
+        self._loaded_at = time.monotonic()
+        self.full_loads += 1
+
+    def _atualizar_fim(self, conn, hoje):
+        """Relê os últimos dias e acrescenta os novos. False se for preciso recarregar tudo."""
+        ultimo = self._start + timedelta(days=len(self._counts) - 1)
+        desde = max(self._start, ultimo - timedelta(days=self.refresh_days))
+        n = (hoje - self._start).days + 1
+        if n < len(self._counts):
+            return False  # relógio andou para trás
+
+        counts = np.zeros((n, len(GRAUS)), dtype=np.int64)
+        corte = (desde - self._start).days
+        counts[:corte] = self._counts[:corte]
+        self._preencher(counts, self._start, self._linhas(conn, desde, hoje))
+
+        total = conn.execute(
+            'SELECT COALESCE(SUM(total), 0) AS total FROM feedback_daily_counts WHERE data <= ?',
+            (hoje.isoformat(),)
+        ).fetchone()['total']
+        if int(counts.sum()) != total:
+            return False
+
+        counts.flags.writeable = False
+        self._counts = counts
+        self.incremental_loads += 1
+        return True
+
+    def stats(self):
+        return {
+            # Sem importar o NumPy (o health não deve pagar o import)
+            'available': np is not None or (not _numpy_em_falta and importlib.util.find_spec('numpy') is not None),
+            'loaded': np is not None,
+            'start': self._start.isoformat() if self._start else None,
+            'days': len(self._counts) if self._counts is not None else 0,
+            'version': self._version,
+            'fullLoads': self.full_loads,
+            'incrementalLoads': self.incremental_loads,
+        }
+
+
+# Cálculos vetorizados -------------------------------------------------------
+
+def rolling_sum(values, janela):
+    """Soma móvel (ao longo do eixo 0) dos últimos `janela` dias, incluindo o próprio.
+
+    Nos primeiros dias a janela é parcial (soma dos dias disponíveis).
+    """
+    acumulado = np.cumsum(values, axis=0, dtype=np.float64)
+    resultado = acumulado.copy()
+    resultado[janela:] = acumulado[janela:] - acumulado[:-janela]
+    return resultado
+
+
+def _dias_na_janela(n, janela):
+    return np.minimum(np.arange(1, n + 1), janela).astype(np.float64)
+
+
+def _percentagem(parte, total):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, parte * 100.0 / total, np.nan)
+
+
+def _indice(counts):
+    """Índice de satisfação (0 a 100): média dos pesos dos votos; NaN sem votos."""
+    total = counts.sum(axis=1)
+    return _percentagem(counts @ np.asarray(PESOS_INDICE) / 100.0, total)
+
+
+def _lista(values, casas=2):
+    """Array -> lista JSON (NaN -> None)."""
+    arredondado = np.round(values.astype(np.float64), casas)
+    return [None if v != v else v for v in arredondado.tolist()]
+
+
+def _intervalo(start, n, inicio, fim):
+    """Índices [i, j) da matriz para o intervalo de datas (recortado aos dias existentes)."""
+    i = max(0, (inicio - start).days)
+    j = min(n, (fim - start).days + 1)
+    return i, max(i, j)
+
+
+def _alargar(start, counts, inicio, fim):
+    """(start, counts) com zeros nos dias do intervalo fora da matriz (antes do primeiro voto ou futuros)."""
+    antes = max(0, (start - inicio).days)
+    depois = max(0, (fim - start).days + 1 - len(counts))
+    if antes or depois:
+        counts = np.pad(counts, ((antes, depois), (0, 0)))
+        start -= timedelta(days=antes)
+    return start, counts
+
+
+def tendencias(start, counts, inicio, fim, janela=7):
+    """Séries diárias do intervalo: totais, médias móveis, percentagens móveis e índice.
+
+    Um valor por dia de `inicio` a `fim` (dias sem votos a zero), como o
+    /api/admin/stats/timeseries com bucket=day.
+    """
+    start, counts = _alargar(start, counts, inicio, fim)
+    n = len(counts)
+    totais = counts.sum(axis=1)
+    somas = rolling_sum(counts, janela)
+    somas_total = somas.sum(axis=1)
+
+    i, j = _intervalo(start, n, inicio, fim)
+    dias = np.arange(i, j)
+    return {
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+        'janela': janela,
+        'dias': [(start + timedelta(days=int(d))).isoformat() for d in dias],
+        'total': totais[i:j].tolist(),
+        'contagens': {grau: counts[i:j, k].tolist() for k, grau in enumerate(GRAUS)},
+        'media_movel': _lista(somas_total[i:j] / _dias_na_janela(n, janela)[i:j]),
+        'percentagens_moveis': {
+            grau: _lista(_percentagem(somas[i:j, k], somas_total[i:j]))
+            for k, grau in enumerate(GRAUS)
+        },
+        'indice': _lista(_indice(counts[i:j])),
+        'indice_movel': _lista(_indice(somas[i:j])),
+    }
+
+
+def anomalias(start, counts, inicio, fim, janela=28, limiar=3.0):
+    """Dias do intervalo cujo total ou % de insatisfeitos se afasta da janela anterior.
+
+    O z-score de cada dia usa a média e o desvio padrão dos `janela` dias anteriores
+    (sem o próprio dia); dias com menos de 7 dias de histórico não são avaliados.
+    """
+    n = len(counts)
+    totais = counts.sum(axis=1).astype(np.float64)
+    pct_insatisfeitos = _percentagem(counts[:, GRAUS.index('insatisfeito')], totais)
+
+    resultado = {
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+        'janela': janela,
+        'limiar': limiar,
+        'anomalias': [],
+    }
+    i, j = _intervalo(start, n, inicio, fim)
+
+    for metrica, serie in (('total', totais), ('pct_insatisfeitos', pct_insatisfeitos)):
+        valido = ~np.isnan(serie)
+        valores = np.where(valido, serie, 0.0)
+
+        # Somas móveis dos dias anteriores (deslocadas um dia)
+        soma = np.concatenate(([0.0], rolling_sum(valores, janela)[:-1]))
+        soma_q = np.concatenate(([0.0], rolling_sum(valores ** 2, janela)[:-1]))
+        contagem = np.concatenate(([0.0], rolling_sum(valido.astype(np.float64), janela)[:-1]))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media = soma / contagem
+            desvio = np.sqrt(np.maximum(soma_q / contagem - media ** 2, 0.0))
+            z = (serie - media) / desvio
+        z[(contagem < 7) | (desvio == 0) | ~valido] = np.nan
+
+        janela_z = z[i:j]
+        for k in np.nonzero(np.abs(np.nan_to_num(janela_z)) >= limiar)[0]:
+            d = i + int(k)
+            resultado['anomalias'].append({
+                'data': (start + timedelta(days=d)).isoformat(),
+                'metrica': metrica,
+                'valor': round(float(serie[d]), 2),
+                'esperado': round(float(media[d]), 2),
+                'z': round(float(z[d]), 2),
+            })
+
+    resultado['anomalias'].sort(key=lambda a: (a['data'], a['metrica']))
+    return resultado
@@ -1,23 +1,58 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
-from datetime import datetime
+# Primeiro import: marca o início do arranque (fases medidas em /api/health, ver startup.py)
+import startup
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, send_file, stream_with_context, g, has_app_context
+from datetime import date, datetime, timedelta
 import sqlite3
 import os
 import csv
 import io
 from typing import Optional
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
 import sys
+import click
 import json
 import base64
+import time
+import tempfile
+import threading
+import zlib
+import firestore_outbox
+import ingest
+import sqlite_pool
+import migrations
+import response_cache
+import live_updates
+import export_jobs
+import analytics
+import hydrate
+import maintenance
+import admission
+import compression
+import json_provider
+import reconcile
+import csv_import
+import metrics
+import sql_profiler
+
+# STARTUP_MODE: eager (tudo no import), background (Firebase e módulos pesados numa
+# thread de warm-up) ou lazy (no primeiro uso). Por omissão lazy na Vercel, onde cada
+# cold start conta, e eager nos restantes ambientes.
+startup_timer = startup.StartupTimer(
+    os.environ.get('STARTUP_MODE', '').strip().lower() or ('lazy' if os.environ.get('VERCEL') else 'eager')
+)
+startup_timer.record('imports', time.perf_counter() - startup.T0)
 
 app = Flask(__name__)
 
 # Em produção, configure SECRET_KEY como variável de ambiente.
 app.secret_key = os.environ.get('SECRET_KEY', 'sua_chave_secreta_aqui_mude_para_producao')
 
+# Serialização JSON de jsonify/get_json (ver json_provider.py): orjson quando está instalado
+try:
+    JSON_BACKEND = json_provider.install(app, os.environ.get('JSON_BACKEND', 'auto').strip().lower())
+except (ImportError, ValueError) as e:
+    print(f"⚠ Aviso: JSON provider indisponível ({e}); a usar o módulo json")
+    JSON_BACKEND = json_provider.install(app, 'json')
+
 # Configurações
 # Em ambientes serverless/geridos (ex: Vercel/Cloud Run) é comum o filesystem do projeto ser read-only;
 # use /tmp para SQLite.
@@ -70,136 +105,546 @@ def _is_admin_email_allowed(email: Optional[str]) -> bool:
     return True
 
 # Inicializar Firebase
+# Importar o Admin SDK e inicializá-lo custa centenas de ms (sem credenciais, a procura de
+# Application Default Credentials pode levar segundos), por isso corre conforme o
+# STARTUP_MODE: no import (eager), na thread de warm-up (background) ou na primeira
+# chamada a get_firestore() (lazy).
 firebase_db = None
 firebase_init_error = None
 firebase_cred_source = None
 firebase_cred_tried_paths = []
-try:
-    if not firebase_admin._apps:
-        # Preferir credenciais por variável de ambiente em produção (Vercel/Preview)
-        # - FIREBASE_SERVICE_ACCOUNT_JSON: conteúdo JSON completo do service account
-        # - FIREBASE_SERVICE_ACCOUNT_JSON_B64: o mesmo JSON, mas em Base64 (mais fácil de colar em plataformas)
-        # - GOOGLE_APPLICATION_CREDENTIALS: path para um ficheiro com credenciais
-        # - FIREBASE_SERVICE_ACCOUNT_FILE: path alternativo para um ficheiro de credenciais
-        env_json_b64 = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON_B64', '').strip()
-        env_json = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON', '').strip()
-
-        # Preferir Base64 quando existir (evita conflitos com um FIREBASE_SERVICE_ACCOUNT_JSON mal definido)
-        if env_json_b64:
-            try:
-                env_json = base64.b64decode(env_json_b64).decode('utf-8', errors='strict').strip()
-                firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_JSON_B64'
-            except Exception as decode_error:
-                raise RuntimeError(f'FIREBASE_SERVICE_ACCOUNT_JSON_B64 inválido: {decode_error}')
+firebase_state = 'pending'  # pending | ready | failed
+_firebase_lock = threading.Lock()
 
-        cred_obj = None
-        if env_json:
-            try:
-                cred_obj = credentials.Certificate(json.loads(env_json))
-                if firebase_cred_source != 'FIREBASE_SERVICE_ACCOUNT_JSON_B64':
-                    firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_JSON'
-            except Exception as json_error:
-                raise RuntimeError(f'FIREBASE_SERVICE_ACCOUNT_JSON inválido: {json_error}')
-        else:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            default_filename = 'studio-7634777517-713ea-firebase-adminsdk-fbsvc-7669723ac0.json'
-
-            firebase_service_account_file = (os.environ.get('FIREBASE_SERVICE_ACCOUNT_FILE') or '').strip()
-            google_app_credentials = (os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or '').strip()
-
-            candidates = []
-            if firebase_service_account_file:
-                candidates.append(firebase_service_account_file)
-            if google_app_credentials:
-                candidates.append(google_app_credentials)
-
-            # Procura explícita em locais comuns (Replit pode ter cwd diferente)
-            candidates.extend([
-                os.path.join(base_dir, default_filename),
-                os.path.join(os.getcwd(), default_filename),
-                default_filename,
-            ])
-
-            chosen = None
-            firebase_cred_tried_paths = []
-            for p in candidates:
-                if not p:
-                    continue
-
-                # Registar tentativas (para diagnóstico)
-                if os.path.isabs(p):
-                    firebase_cred_tried_paths.append(p)
-                    if os.path.isfile(p):
-                        chosen = p
-                        break
-                else:
-                    p_cwd = os.path.join(os.getcwd(), p)
-                    firebase_cred_tried_paths.append(p_cwd)
-                    if os.path.isfile(p_cwd):
-                        chosen = p_cwd
-                        break
-
-                    p_base = os.path.join(base_dir, p)
-                    firebase_cred_tried_paths.append(p_base)
-                    if os.path.isfile(p_base):
-                        chosen = p_base
-                        break
-
-            if chosen:
-                cred_obj = credentials.Certificate(chosen)
+
+def _init_firebase():
+    """Inicializa o Firebase Admin SDK e o cliente Firestore (uma vez por processo)."""
+    global firebase_db, firebase_init_error, firebase_cred_source, firebase_cred_tried_paths, firebase_state
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        if not firebase_admin._apps:
+            # Preferir credenciais por variável de ambiente em produção (Vercel/Preview)
+            # - FIREBASE_SERVICE_ACCOUNT_JSON: conteúdo JSON completo do service account
+            # - FIREBASE_SERVICE_ACCOUNT_JSON_B64: o mesmo JSON, mas em Base64 (mais fácil de colar em plataformas)
+            # - GOOGLE_APPLICATION_CREDENTIALS: path para um ficheiro com credenciais
+            # - FIREBASE_SERVICE_ACCOUNT_FILE: path alternativo para um ficheiro de credenciais
+            env_json_b64 = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON_B64', '').strip()
+            env_json = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON', '').strip()
+
+            # Preferir Base64 quando existir (evita conflitos com um FIREBASE_SERVICE_ACCOUNT_JSON mal definido)
+            if env_json_b64:
+                try:
+                    env_json = base64.b64decode(env_json_b64).decode('utf-8', errors='strict').strip()
+                    firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_JSON_B64'
+                except Exception as decode_error:
+                    raise RuntimeError(f'FIREBASE_SERVICE_ACCOUNT_JSON_B64 inválido: {decode_error}')
+
+            cred_obj = None
+            if env_json:
+                try:
+                    cred_obj = credentials.Certificate(json.loads(env_json))
+                    if firebase_cred_source != 'FIREBASE_SERVICE_ACCOUNT_JSON_B64':
+                        firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_JSON'
+                except Exception as json_error:
+                    raise RuntimeError(f'FIREBASE_SERVICE_ACCOUNT_JSON inválido: {json_error}')
+            else:
+                base_dir = os.path.dirname(os.path.abspath(__file__))
+                default_filename = 'studio-7634777517-713ea-firebase-adminsdk-fbsvc-7669723ac0.json'
+
+                firebase_service_account_file = (os.environ.get('FIREBASE_SERVICE_ACCOUNT_FILE') or '').strip()
+                google_app_credentials = (os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or '').strip()
+
+                candidates = []
                 if firebase_service_account_file:
-                    firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_FILE'
-                elif google_app_credentials:
-                    firebase_cred_source = 'GOOGLE_APPLICATION_CREDENTIALS'
-                else:
-                    firebase_cred_source = 'LOCAL_JSON_FILE'
-
-        if not cred_obj:
-            # Em ambientes Google (ex: Cloud Run), pode usar Application Default Credentials (ADC)
-            # sem precisar de ficheiro/JSON.
-            try:
-                cred_obj = credentials.ApplicationDefault()
-                firebase_cred_source = 'APPLICATION_DEFAULT'
-            except Exception:
-                msg = 'Credenciais Firebase não encontradas (defina FIREBASE_SERVICE_ACCOUNT_JSON ou configure um ficheiro via FIREBASE_SERVICE_ACCOUNT_FILE/GOOGLE_APPLICATION_CREDENTIALS).'
-                if os.environ.get('DEBUG_DIAGNOSTICS'):
-                    msg += f" cwd={os.getcwd()} base_dir={base_dir} tried={firebase_cred_tried_paths}"
-                raise RuntimeError(msg)
-
-        firebase_admin.initialize_app(cred_obj, {
-            'databaseURL': os.environ.get('FIREBASE_DATABASE_URL', 'https://studio-7634777517-713ea.firebaseio.com')
-        })
-        firebase_db = firestore.client()
-        print("✓ Firebase inicializado com sucesso")
-except Exception as e:
-    firebase_init_error = str(e)
-    print(f"⚠ Aviso: Firebase não está disponível: {e}")
-    print("  A aplicação continuará funcionando apenas com SQLite")
-
-def get_db():
-    """Conecta ao banco de dados SQLite"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+                    candidates.append(firebase_service_account_file)
+                if google_app_credentials:
+                    candidates.append(google_app_credentials)
+
+                # Procura explícita em locais comuns (Replit pode ter cwd diferente)
+                candidates.extend([
+                    os.path.join(base_dir, default_filename),
+                    os.path.join(os.getcwd(), default_filename),
+                    default_filename,
+                ])
+
+                chosen = None
+                firebase_cred_tried_paths = []
+                for p in candidates:
+                    if not p:
+                        continue
+
+                    # Registar tentativas (para diagnóstico)
+                    if os.path.isabs(p):
+                        firebase_cred_tried_paths.append(p)
+                        if os.path.isfile(p):
+                            chosen = p
+                            break
+                    else:
+                        p_cwd = os.path.join(os.getcwd(), p)
+                        firebase_cred_tried_paths.append(p_cwd)
+                        if os.path.isfile(p_cwd):
+                            chosen = p_cwd
+                            break
+
+                        p_base = os.path.join(base_dir, p)
+                        firebase_cred_tried_paths.append(p_base)
+                        if os.path.isfile(p_base):
+                            chosen = p_base
+                            break
+
+                if chosen:
+                    cred_obj = credentials.Certificate(chosen)
+                    if firebase_service_account_file:
+                        firebase_cred_source = 'FIREBASE_SERVICE_ACCOUNT_FILE'
+                    elif google_app_credentials:
+                        firebase_cred_source = 'GOOGLE_APPLICATION_CREDENTIALS'
+                    else:
+                        firebase_cred_source = 'LOCAL_JSON_FILE'
+
+            if not cred_obj:
+                # Em ambientes Google (ex: Cloud Run), pode usar Application Default Credentials (ADC)
+                # sem precisar de ficheiro/JSON.
+                try:
+                    cred_obj = credentials.ApplicationDefault()
+                    firebase_cred_source = 'APPLICATION_DEFAULT'
+                except Exception:
+                    msg = 'Credenciais Firebase não encontradas (defina FIREBASE_SERVICE_ACCOUNT_JSON ou configure um ficheiro via FIREBASE_SERVICE_ACCOUNT_FILE/GOOGLE_APPLICATION_CREDENTIALS).'
+                    if os.environ.get('DEBUG_DIAGNOSTICS'):
+                        msg += f" cwd={os.getcwd()} base_dir={base_dir} tried={firebase_cred_tried_paths}"
+                    raise RuntimeError(msg)
+
+            firebase_admin.initialize_app(cred_obj, {
+                'databaseURL': os.environ.get('FIREBASE_DATABASE_URL', 'https://studio-7634777517-713ea.firebaseio.com')
+            })
+            firebase_db = firestore.client()
+            print("✓ Firebase inicializado com sucesso")
+        firebase_state = 'ready'
+    except Exception as e:
+        firebase_init_error = str(e)
+        firebase_state = 'failed'
+        print(f"⚠ Aviso: Firebase não está disponível: {e}")
+        print("  A aplicação continuará funcionando apenas com SQLite")
+
+
+def get_firestore():
+    """Cliente Firestore (ou None), inicializando o Firebase na primeira chamada."""
+    if firebase_state == 'pending':
+        with _firebase_lock:
+            if firebase_state == 'pending':
+                with startup_timer.phase('firebase'):
+                    _init_firebase()
+    return firebase_db
+
+
+def _firebase_app_inicializado():
+    """O Firebase já foi inicializado neste processo.
+
+    Usa o estado do próprio módulo e não `firebase_admin._apps`: enquanto o warm-up ou o
+    primeiro voto ainda estão a importar o SDK, o módulo está em sys.modules a meio da
+    importação e não tem esse atributo.
+    """
+    return firebase_state == 'ready'
+
+
+def _replicar_firestore():
+    """Os votos devem entrar na outbox: Firebase pronto ou ainda por inicializar (lazy)."""
+    return firebase_db is not None or firebase_state == 'pending'
+
+
+if startup_timer.mode == 'eager':
+    get_firestore()
+
+# Métricas Prometheus (/metrics). Cada worker grava um snapshot em METRICS_DIR e o
+# /metrics soma os de todos, por isso qualquer worker responde com o total do serviço.
+# Sob o gunicorn o master fixa (e esvazia) METRICS_DIR; fora dele a pasta é só deste processo.
+metrics_registry = metrics.Registry(
+    directory=os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), f'feedback_metrics_{os.getpid()}'),
+    flush_interval=float(os.environ.get('METRICS_FLUSH_SECONDS', '5')),
+    prefix='feedback_',
+)
+METRIC_HTTP_REQUESTS = metrics_registry.counter(
+    'http_requests_total', 'Pedidos HTTP por endpoint Flask, método e estado')
+METRIC_HTTP_LATENCY = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Latência por endpoint Flask (até à resposta; exclui o corpo em streaming)')
+METRIC_HTTP_IN_FLIGHT = metrics_registry.gauge(
+    'http_requests_in_flight', 'Pedidos HTTP em curso')
+METRIC_SQLITE_QUERY = metrics_registry.histogram(
+    'sqlite_query_duration_seconds', 'Tempo de execute/executemany no SQLite por tipo de instrução',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0))
+METRIC_SQLITE_POOL_IN_USE = metrics_registry.gauge(
+    'sqlite_pool_connections_in_use', 'Conexões SQLite em uso (pool de escrita/leitura)')
+METRIC_SQLITE_POOL_WAITS = metrics_registry.counter(
+    'sqlite_pool_waits_total', 'Pedidos de conexão que tiveram de esperar pelo pool')
+METRIC_SQLITE_POOL_WAIT_SECONDS = metrics_registry.counter(
+    'sqlite_pool_wait_seconds_total', 'Tempo total à espera de uma conexão do pool')
+METRIC_SQLITE_POOL_TIMEOUTS = metrics_registry.counter(
+    'sqlite_pool_timeouts_total', 'Pedidos de conexão que esgotaram SQLITE_POOL_TIMEOUT')
+METRIC_FIRESTORE_COMMIT = metrics_registry.histogram(
+    'firestore_commit_duration_seconds', 'Latência dos batch.commit() do replicador Firestore',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+METRIC_FIRESTORE_DOCUMENTS = metrics_registry.counter(
+    'firestore_documents_total', 'Documentos enviados para o Firestore (status=ok|error)')
+METRIC_EXPORT_ROWS = metrics_registry.counter(
+    'export_rows_total', 'Linhas exportadas por formato')
+METRIC_EXPORT_BYTES = metrics_registry.counter(
+    'export_bytes_total', 'Bytes exportados por formato (comprimidos, com gzip=1)')
+METRIC_EXPORT_JOBS = metrics_registry.counter(
+    'export_jobs_total', 'Jobs de exportação terminados por formato e estado')
+METRIC_INGEST_BATCH_ROWS = metrics_registry.histogram(
+    'ingest_batch_rows', 'Votos por transação do escritor agrupado (INGEST_MODE=group)',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+METRIC_INGEST_BATCH_REQUESTS = metrics_registry.histogram(
+    'ingest_batch_requests', 'Pedidos HTTP servidos por cada transação do escritor agrupado',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+METRIC_INGEST_COMMIT = metrics_registry.histogram(
+    'ingest_commit_duration_seconds', 'Duração de cada transação do escritor agrupado (status=ok|error)',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0))
+METRIC_SSE_STREAMS = metrics_registry.gauge(
+    'sse_streams_active', 'Streams /api/stream/summary abertos')
+METRIC_ADMISSION = metrics_registry.counter(
+    'admission_requests_total', 'Pedidos de votos admitidos ou recusados com 429 (decision, reason)')
+METRIC_ADMISSION_IN_FLIGHT = metrics_registry.gauge(
+    'admission_in_flight', 'Pedidos de votos admitidos em curso')
+METRIC_ADMISSION_WAITING = metrics_registry.gauge(
+    'admission_waiting', 'Pedidos de votos na fila de espera da admissão')
+
+_SQL_INSTRUCOES = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA'}
+
+
+def _medir_query(sql, segundos):
+    instrucao = sql.lstrip()[:8].split(None, 1)[0].upper() if sql.strip() else ''
+    METRIC_SQLITE_QUERY.observe(segundos, statement=instrucao if instrucao in _SQL_INSTRUCOES else 'OTHER')
+
+
+# Profiling de SQL (opt-in, por processo): tempos e linhas por instrução, consultas
+# lentas e o respetivo EXPLAIN QUERY PLAN em /api/admin/system/sql
+query_profiler = sql_profiler.SqlProfiler(
+    enabled=os.environ.get('SQL_PROFILE', '0') not in ['0', 'false', 'False', ''],
+    threshold_ms=float(os.environ.get('SQL_SLOW_MS', '100')),
+)
+
+# Pool de conexões SQLite (por processo). Com gunicorn `--threads 8` cada worker
+# precisa de, no máximo, uma conexão por thread.
+db_pool = sqlite_pool.SQLitePool(
+    DATABASE,
+    max_size=int(os.environ.get('SQLITE_POOL_SIZE', '8')),
+    readonly_max_size=int(os.environ.get('SQLITE_READ_POOL_SIZE', '8')),
+    timeout=float(os.environ.get('SQLITE_POOL_TIMEOUT', '10')),
+    pragmas={
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-8000')),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    },
+    on_query=_medir_query,
+    profiler=query_profiler,
+)
+
+
+def get_db(readonly=False):
+    """Obtém uma conexão SQLite do pool (conn.close() devolve-a ao pool).
+
+    Use readonly=True nos endpoints que só leem (estatísticas, histórico, exportações).
+    """
+    conn = db_pool.connection(readonly=readonly)
+    if has_app_context():
+        # Rede de segurança: o que não for devolvido até ao fim do pedido é devolvido no teardown
+        g.setdefault('db_leases', []).append((conn, conn.lease))
     return conn
 
+
+@app.teardown_appcontext
+def _devolver_conexoes(exc):
+    for conn, lease in g.pop('db_leases', ()):
+        db_pool.release(conn, lease)
+
 def init_db():
-    """Inicializa o banco de dados"""
+    """Inicializa o banco de dados (aplica as migrações pendentes, ver migrations.py)"""
     conn = get_db()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            grau_satisfacao TEXT NOT NULL,
-            data TEXT NOT NULL,
-            hora TEXT NOT NULL,
-            dia_semana TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    try:
+        applied = migrations.migrate(conn)
+    finally:
+        conn.close()
+    for version, description in applied:
+        print(f"✓ Migração {version} aplicada: {description}")
+
+# Snapshots e manutenção do SQLite (ver maintenance.py). Com BACKUP_DIR num volume
+# persistente, um contentor novo restaura o snapshot mais recente em vez de começar vazio.
+BACKUP_DIR = os.environ.get('BACKUP_DIR') or maintenance.default_directory(DATABASE)
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '7'))
+BACKUP_PAGES = int(os.environ.get('BACKUP_PAGES', '256'))
+RESTORE_ON_START = os.environ.get('RESTORE_ON_START', '1') not in ['0', 'false', 'False', '']
+last_restore = None
+
+# Inicializar banco de dados ao iniciar a aplicação. Com o gunicorn.conf.py o restauro e as
+# migrações correm uma vez no master, antes do fork, e os workers não voltam a abrir o esquema.
+if os.environ.get('FEEDBACK_SCHEMA_VERSION') == str(migrations.latest_version()):
+    startup_timer.record('schema', 0.0, skipped=True)
+else:
+    if RESTORE_ON_START:
+        try:
+            with startup_timer.phase('restore'):
+                last_restore = maintenance.restore_latest(BACKUP_DIR, DATABASE)
+        except Exception as e:
+            print(f"⚠ Aviso: Restauro do snapshot falhou: {e}")
+        if last_restore:
+            print(f"✓ Base de dados restaurada de {last_restore['snapshot']} em {last_restore['seconds']}s")
+    with startup_timer.phase('schema'):
+        init_db()
+
+def _medir_lote_ingestao(votos, pedidos, segundos, erro):
+    METRIC_INGEST_BATCH_ROWS.observe(votos)
+    METRIC_INGEST_BATCH_REQUESTS.observe(pedidos)
+    METRIC_INGEST_COMMIT.observe(segundos, status='error' if erro else 'ok')
+
+
+# Gravação dos votos: 'direct' (uma transação por pedido) ou 'group' (escritor único por
+# processo que junta os votos concorrentes numa transação, ver ingest.py)
+INGEST_MODE = os.environ.get('INGEST_MODE', 'direct').strip().lower()
+ingest_writer = None
+if INGEST_MODE == 'group':
+    ingest_writer = ingest.GroupCommitWriter(
+        connect=get_db,
+        max_batch=int(os.environ.get('INGEST_MAX_BATCH', '256')),
+        max_wait=float(os.environ.get('INGEST_MAX_WAIT_MS', '2')) / 1000.0,
+        # Prazo de um pedido na fila; expirado, não é gravado e o voto recebe 503
+        timeout=float(os.environ.get('INGEST_TIMEOUT_MS', '30000')) / 1000.0,
+        on_commit=_medir_lote_ingestao,
+    )
+
+
+def _medir_commit_firestore(segundos, documentos, erro):
+    METRIC_FIRESTORE_COMMIT.observe(segundos)
+    METRIC_FIRESTORE_DOCUMENTS.inc(documentos, status='error' if erro else 'ok')
+
+
+# Replicação assíncrona SQLite -> Firestore (outbox drenada em background)
+replicator = firestore_outbox.FirestoreReplicator(
+    connect=get_db,
+    get_client=get_firestore,
+    batch_size=int(os.environ.get('FIRESTORE_OUTBOX_BATCH', '200')),
+    max_delay=float(os.environ.get('FIRESTORE_OUTBOX_MAX_BACKOFF', '300')),
+    on_commit=_medir_commit_firestore,
+)
+if firebase_db:
+    replicator.start()
+
+
+def _warm_up():
+    """Thread de warm-up (STARTUP_MODE=background): Firebase e módulos pesados fora do import."""
+    with startup_timer.phase('warmup'):
+        if get_firestore():
+            replicator.start()
+        with startup_timer.phase('preload'):
+            for modulo in ('openpyxl', 'numpy'):
+                try:
+                    __import__(modulo)
+                except ImportError:
+                    pass
+            analytics.available()
+
+
+if startup_timer.mode == 'background':
+    threading.Thread(target=_warm_up, name='startup-warmup', daemon=True).start()
+
+
+def _read_data_version():
+    conn = get_db(readonly=True)
+    try:
+        return migrations.read_data_version(conn)
+    finally:
+        conn.close()
+
+
+# Cache de respostas (resumo público e estatísticas) invalidada pela versão dos dados
+data_version = response_cache.DataVersion(
+    _read_data_version,
+    ttl=float(os.environ.get('RESPONSE_CACHE_VERSION_TTL', '1.0')),
+)
+json_cache = response_cache.ResponseCache(
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256')),
+)
+
+
+def _cached_body(key, version, build):
+    """Corpo JSON (bytes) para a versão dada; `build()` só corre se não estiver em cache."""
+    body = json_cache.get(key, version)
+    if body is None:
+        body = jsonify(build()).get_data()
+        json_cache.set(key, version, body)
+    return body
+
+
+def _cached_json(key, build, private=True):
+    """Resposta JSON com cache por versão dos dados e suporte a ETag/If-None-Match.
+
+    `build()` só é chamado quando não há corpo em cache para a versão atual; se o
+    cliente já tem a versão atual (If-None-Match), devolve 304 sem corpo.
+    """
+    version = data_version.get()
+    etag = response_cache.ResponseCache.etag(key, version)
+
+    if request.if_none_match.contains_weak(etag):
+        json_cache.not_modified += 1
+        response = app.response_class(status=304)
+    else:
+        body = _cached_body(key, version, build)
+        response = app.response_class(body, mimetype='application/json')
+
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+
+# Stream SSE do resumo público: um thread por processo observa a versão dos dados
+# (partilhada entre workers via SQLite) e acorda os streams ligados. Cada stream ocupa
+# um thread do gunicorn (orçamento de threads: ver gunicorn.conf.py).
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '8'))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_MAX_AGE_SECONDS = float(os.environ.get('SSE_MAX_AGE_SECONDS', '240'))
+
+version_watcher = live_updates.VersionWatcher(
+    _read_data_version,
+    interval=float(os.environ.get('SSE_POLL_INTERVAL', '0.5')),
+    on_change=data_version.set,
+)
+
+
+@app.cli.command('db-migrate')
+@click.option('--vacuum', is_flag=True, help='Compacta o ficheiro no fim (ex.: após migrar para o esquema compacto).')
+def db_migrate_command(vacuum):
+    """Aplica as migrações pendentes e mostra a versão do esquema."""
+    init_db()
+    conn = get_db(readonly=True)
+    try:
+        estado = migrations.status(conn)
+    finally:
+        conn.close()
+    print(f"Esquema na versão {estado['version']} (mais recente: {estado['latest']})")
+
+    if vacuum:
+        tamanho_antes = os.path.getsize(DATABASE)
+        # VACUUM não pode correr dentro de uma transação nem com outras conexões a escrever
+        conn = sqlite3.connect(DATABASE)
+        try:
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+        print(f"✓ VACUUM: {tamanho_antes} -> {os.path.getsize(DATABASE)} bytes")
+
+
+@app.cli.command('rebuild-daily-counts')
+def rebuild_daily_counts_command():
+    """Regenera feedback_daily_counts a partir da tabela feedback."""
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        migrations.rebuild_daily_counts(conn)
+        conn.commit()
+        dias = conn.execute('SELECT COUNT(DISTINCT data) FROM feedback_daily_counts').fetchone()[0]
+    finally:
+        conn.close()
+    print(f"✓ Contagens diárias regeneradas ({dias} dia(s))")
+
+
+@app.cli.command('import-csv')
+@click.argument('ficheiro', type=click.File('rb'))
+@click.option('--new-ids', is_flag=True, help='Atribui ids novos (juntar dados de outro site) em vez de manter os do ficheiro.')
+@click.option('--firestore', is_flag=True, help='Envia também as linhas importadas para o Firestore (via outbox).')
+def import_csv_command(ficheiro, new_ids, firestore):
+    """Importa um CSV do export csv-plain (ou .csv.gz; use - para stdin)."""
+    init_db()
+    if firestore and not get_firestore():
+        print("⚠ Aviso: Firebase não está disponível; as linhas ficam só no SQLite")
+
+    ultimo = {'t': 0.0}
+
+    def progresso(r):
+        # No máximo uma linha por segundo (ficheiros grandes têm milhares de lotes)
+        if time.monotonic() - ultimo['t'] >= 1.0:
+            ultimo['t'] = time.monotonic()
+            print(f"  {r['rows']} linhas lidas, {r['inserted']} inseridas ({r['rowsPerSecond']} linhas/s)")
+
+    try:
+        r = _importar_csv(ficheiro, preserve_ids=not new_ids, forward=firestore, progress=progresso)
+    except csv_import.CsvImportError as e:
+        raise click.ClickException(str(e))
+
+    print(f"✓ Importação: {r['inserted']} inseridas, {r['skipped']} já existiam, "
+          f"{r['rejected']} rejeitadas em {r['seconds']}s ({r['rowsPerSecond']} linhas/s)")
+    for erro in r['errors']:
+        print(f"  ⚠ linha {erro['line']}: {erro['error']}")
+    if r['forwarded']:
+        print(f"  {r['forwarded']} linhas na outbox do Firestore (enviadas pelo replicador da aplicação)")
+
+
+@app.cli.command('maintenance')
+@click.argument('tarefa', type=click.Choice(['snapshot', 'compact', 'analyze']))
+def maintenance_command(tarefa):
+    """Corre já uma tarefa de manutenção do SQLite (snapshot, compact ou analyze)."""
+    init_db()
+    r = maintenance_scheduler.run_due(only=tarefa, force=True).get(tarefa)
+    if r is None:
+        raise click.ClickException('Manutenção em curso noutro processo')
+    if 'error' in r:
+        raise click.ClickException(r['error'])
+    destino = f" -> {r['path']} ({r['bytes']} bytes)" if 'path' in r else ''
+    print(f"✓ {tarefa} em {r['seconds']}s{destino}")
+
+
+@app.cli.command('hydrate')
+@click.option('--force', is_flag=True, help='Relê a coleção inteira mesmo que o SQLite pareça atualizado.')
+def hydrate_command(force):
+    """Copia a coleção feedback do Firestore para o SQLite (ids preservados)."""
+    init_db()
+    ultimo = {'t': 0.0}
+
+    def progresso(r):
+        if time.monotonic() - ultimo['t'] >= 1.0:
+            ultimo['t'] = time.monotonic()
+            print(f"  {r['rows']} documentos lidos, {r['inserted']} inseridos ({r['rowsPerSecond']} docs/s)")
+
+    try:
+        r = _hidratar(force=force, progress=progresso)
+    except Exception as e:
+        raise click.ClickException(str(e))
+
+    if not r['hydrated']:
+        print(f"✓ SQLite já está atualizado ({r['localRowsBefore']} votos, {r['remoteRows']} documentos no Firestore)")
+        return
+    print(f"✓ Hidratação: {r['inserted']} inseridos, {r['skipped']} já existiam, {r['rejected']} rejeitados "
+          f"em {r['seconds']}s ({r['rowsPerSecond']} docs/s, {r['pages']} páginas); próximo id {r['maxId'] + 1}")
+    for erro in r['errors']:
+        print(f"  ⚠ {erro['doc']}: {erro['error']}")
+
+
+@app.cli.command('reconcile')
+@click.option('--direction', type=click.Choice(['both', 'to-firestore', 'to-sqlite']), default='both',
+              help='Para que lado(s) copiar os votos em falta.')
+@click.option('--deep', is_flag=True, help='Compara todos os dias, não só os dos meses com totais diferentes.')
+@click.option('--dry-run', is_flag=True, help='Só lista os dias diferentes, sem escrever.')
+def reconcile_command(direction, deep, dry_run):
+    """Reconcilia o SQLite com a coleção feedback do Firestore (também serve de backfill)."""
+    init_db()
+    try:
+        r = _reconciliar(direction, deep=deep, dry_run=dry_run)
+    except Exception as e:
+        raise click.ClickException(str(e))
+
+    print(f"✓ Reconciliação: {r['months']} meses, {r['days']} dias comparados, "
+          f"{len(r['divergentDays'])} diferentes ({r['firestoreQueries']} consultas, {r['seconds']}s)")
+    for dia in r['divergentDays']:
+        print(f"  {dia['date']}: SQLite {dia['sqlite']} / Firestore {dia['firestore']}")
+    if r['pendingDays']:
+        print(f"  Saltados (votos na outbox): {', '.join(r['pendingDays'])}")
+    if not dry_run:
+        print(f"  {r['toFirestore']} enviados e {r['updatedFirestore']} corrigidos no Firestore, "
+              f"{r['toSqlite']} inseridos no SQLite, {r['conflicts']} conflitos")
+    for erro in r['errors']:
+        print(f"  ⚠ {erro['doc']}: {erro['error']}")
 
-# Inicializar banco de dados ao iniciar a aplicação
-init_db()
 
 @app.route('/')
 def index():
@@ -212,15 +657,29 @@ def health_check():
     """Health check simples (SQLite + Firebase init)."""
     sqlite_ok = False
     sqlite_error = None
+    schema_version = None
     try:
-        conn = get_db()
-        conn.execute('SELECT 1').fetchone()
-        conn.close()
+        conn = get_db(readonly=True)
+        try:
+            conn.execute('SELECT 1').fetchone()
+            schema_version = migrations.current_version(conn)
+        finally:
+            conn.close()
         sqlite_ok = True
     except Exception as e:
         sqlite_error = str(e)
 
-    firebase_ok = bool(firebase_db and firebase_admin._apps)
+    firebase_ok = bool(firebase_db and _firebase_app_inicializado())
+
+    replication = None
+    try:
+        conn = get_db(readonly=True)
+        try:
+            replication = replicator.stats(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        replication = {'error': str(e)}
 
     diagnostics_enabled = bool(os.environ.get('DEBUG_DIAGNOSTICS'))
 
@@ -232,15 +691,32 @@ def health_check():
             'ok': sqlite_ok,
             'db': DATABASE,
             'error': sqlite_error,
+            'schemaVersion': schema_version,
+            'pool': db_pool.stats(),
         },
         'firebase': {
-            'initialized': bool(firebase_admin._apps),
+            'initialized': _firebase_app_inicializado(),
+            'state': firebase_state,
             'firestoreAvailable': bool(firebase_db),
             'ok': firebase_ok,
             'projectId': FIREBASE_WEB_CONFIG.get('projectId') or None,
             'credSource': firebase_cred_source,
             'error': firebase_init_error,
-        }
+        },
+        'replication': replication,
+        'responseCache': json_cache.stats(),
+        'stream': version_watcher.stats(),
+        'analytics': analytics_cache.stats(),
+        'hydration': {
+            'onStart': HYDRATE_ON_START,
+            'done': hydration_done.is_set(),
+            'last': last_hydration,
+        },
+        'ingest': dict(ingest_writer.stats(), mode=INGEST_MODE) if ingest_writer else {'mode': INGEST_MODE},
+        'admission': dict(admission_controller.stats(), enabled=ADMISSION),
+        'json': {'backend': JSON_BACKEND},
+        'compression': dict(compressor.stats(), enabled=COMPRESS),
+        'startup': startup_timer.report(),
     }
 
     if diagnostics_enabled:
@@ -253,47 +729,318 @@ def health_check():
     return jsonify(payload)
 
 
-@app.route('/api/public/summary', methods=['GET'])
-def public_summary():
-    """Resumo público para o ecrã principal (sem auth)."""
+@app.before_request
+def _metricas_inicio_pedido():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_em_curso = True
+    METRIC_HTTP_IN_FLIGHT.inc()
+    startup_timer.first_request()
+
+
+@app.after_request
+def _metricas_fim_pedido(response):
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is not None:
+        # Endpoint Flask (não o URL) para manter a cardinalidade baixa; sem rota = 404
+        endpoint = request.endpoint or 'not_found'
+        METRIC_HTTP_LATENCY.observe(time.perf_counter() - inicio, endpoint=endpoint)
+        METRIC_HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def _metricas_teardown(exc):
+    # Contextos sem before_request (ex.: test_request_context) não contam
+    if g.pop('metricas_em_curso', False):
+        METRIC_HTTP_IN_FLIGHT.dec()
+
+
+# Controlo de admissão dos endpoints públicos de votos (ver admission.py), por worker.
+# Com os valores por omissão no máximo 16 dos 32 threads do gunicorn ficam com votos
+# (8 em curso + 8 na fila), por isso o dashboard continua a responder durante uma rajada.
+ADMISSION = os.environ.get('ADMISSION', '1') not in ['0', 'false', 'False', '']
+ADMISSION_ENDPOINTS = {'registrar_feedback', 'registrar_feedback_batch'}
+# Proxies à frente da aplicação que acrescentam o IP do cliente ao X-Forwarded-For
+# (Vercel e Cloud Run: 1). Com 0 usa-se o endereço da ligação.
+ADMISSION_PROXY_HOPS = int(os.environ.get('ADMISSION_PROXY_HOPS', '1' if IS_VERCEL or IS_CLOUD_RUN else '0'))
+admission_controller = admission.AdmissionController(
+    rate=float(os.environ.get('ADMISSION_RATE', '5')),
+    burst=float(os.environ.get('ADMISSION_BURST', '30')),
+    max_concurrent=int(os.environ.get('ADMISSION_MAX_CONCURRENT', '8')),
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', '8')),
+    queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '2')),
+    retry_after=float(os.environ.get('ADMISSION_RETRY_AFTER', '1')),
+)
+
+
+def _cliente_admissao():
+    if ADMISSION_PROXY_HOPS:
+        encaminhado = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        if encaminhado:
+            # Os proxies acrescentam à direita; o que está mais à esquerda pode ser forjado pelo cliente
+            return encaminhado[-min(ADMISSION_PROXY_HOPS, len(encaminhado))]
+    return request.remote_addr or 'desconhecido'
+
+
+@app.before_request
+def _admitir_voto():
+    if not ADMISSION or request.endpoint not in ADMISSION_ENDPOINTS or request.method != 'POST':
+        return None
+    recusa = admission_controller.admit(_cliente_admissao())
+    if recusa:
+        motivo, retry_after = recusa
+        METRIC_ADMISSION.inc(decision='shed', reason=motivo)
+        return jsonify({'error': 'Demasiados pedidos, tente novamente mais tarde', 'reason': motivo}), 429, {
+            'Retry-After': str(retry_after),
+        }
+    METRIC_ADMISSION.inc(decision='admitted', reason='ok')
+    g.admissao = True
+    return None
+
+
+@app.teardown_request
+def _libertar_admissao(exc):
+    if g.pop('admissao', False):
+        admission_controller.release()
+
+
+# Compressão gzip/brotli das respostas (ver compression.py)
+COMPRESS = os.environ.get('COMPRESS', '1') not in ['0', 'false', 'False', '']
+compressor = compression.Compressor(
+    min_size=int(os.environ.get('COMPRESS_MIN_BYTES', '1024')),
+    gzip_level=int(os.environ.get('COMPRESS_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4')),
+)
+
+
+@app.after_request
+def _comprimir_resposta(response):
+    if COMPRESS:
+        compressor.process(response, request.accept_encodings)
+    return response
+
+
+def _recolher_metricas():
+    """Valores lidos no momento do snapshot (pool SQLite, streams SSE)."""
+    pool = db_pool.stats()
+    amostras = [
+        (METRIC_SSE_STREAMS, {}, version_watcher.subscribers),
+        (METRIC_ADMISSION_IN_FLIGHT, {}, admission_controller.in_flight),
+        (METRIC_ADMISSION_WAITING, {}, admission_controller.waiting),
+    ]
+    for tipo in ('write', 'read'):
+        amostras += [
+            (METRIC_SQLITE_POOL_IN_USE, {'pool': tipo}, pool[tipo]['inUse']),
+            (METRIC_SQLITE_POOL_WAITS, {'pool': tipo}, pool[tipo]['waits']),
+            (METRIC_SQLITE_POOL_WAIT_SECONDS, {'pool': tipo}, pool[tipo]['waitTimeMs'] / 1000.0),
+            (METRIC_SQLITE_POOL_TIMEOUTS, {'pool': tipo}, pool[tipo]['timeouts']),
+        ]
+    return amostras
+
+
+metrics_registry.add_collector(_recolher_metricas)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas no formato de texto do Prometheus (somadas entre todos os workers).
+
+    Se METRICS_TOKEN estiver definido, exige `Authorization: Bearer <token>`.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Não autorizado'}), 401
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _resumo_publico(hoje: str) -> dict:
+    """Totais de hoje, total geral e último id (usado pelo kiosk)."""
+    conn = get_db(readonly=True)
     try:
-        hoje = datetime.now().strftime('%Y-%m-%d')
-        conn = get_db()
 
-        # Totais de hoje
+        # Totais de hoje (contagens diárias materializadas)
         rows_hoje = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
+            SELECT grau_satisfacao, total
+            FROM feedback_daily_counts
             WHERE data = ?
-            GROUP BY grau_satisfacao
         ''', (hoje,)).fetchall()
 
         # Total geral + último id
-        total_geral = conn.execute('SELECT COUNT(*) as total FROM feedback').fetchone()['total']
-        last_id_row = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()
+        total_geral = conn.execute(
+            'SELECT COALESCE(SUM(total), 0) as total FROM feedback_daily_counts'
+        ).fetchone()['total']
+        last_id_row = conn.execute('SELECT MAX(id) as last_id FROM feedback_rows').fetchone()
         last_id = last_id_row['last_id'] if last_id_row else None
-
+    finally:
         conn.close()
 
-        hoje_result = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0,
-        }
-        for r in rows_hoje:
-            hoje_result[r['grau_satisfacao']] = r['total']
+    hoje_result = {
+        'muito_satisfeito': 0,
+        'satisfeito': 0,
+        'insatisfeito': 0,
+    }
+    for r in rows_hoje:
+        hoje_result[r['grau_satisfacao']] = r['total']
+
+    return {
+        'date': hoje,
+        'today': hoje_result,
+        'todayTotal': sum(hoje_result.values()),
+        'total': total_geral,
+        'lastId': last_id,
+        'firebaseAvailable': bool(firebase_db),
+    }
 
-        return jsonify({
-            'date': hoje,
-            'today': hoje_result,
-            'todayTotal': sum(hoje_result.values()),
-            'total': total_geral,
-            'lastId': last_id,
-            'firebaseAvailable': bool(firebase_db),
-        })
+
+@app.route('/api/public/summary', methods=['GET'])
+def public_summary():
+    """Resumo público para o ecrã principal (sem auth)."""
+    try:
+        hoje = datetime.now().strftime('%Y-%m-%d')
+        return _cached_json(
+            ('public_summary', hoje, bool(firebase_db)),
+            lambda: _resumo_publico(hoje),
+            private=False,
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+def _delta_resumo(anterior: Optional[dict], atual: dict) -> Optional[dict]:
+    """Diferença entre dois resumos públicos (None se não houver anterior do mesmo dia)."""
+    if not anterior or anterior.get('date') != atual.get('date'):
+        return None
+    return {
+        'today': {grau: atual['today'][grau] - anterior['today'].get(grau, 0) for grau in atual['today']},
+        'todayTotal': atual['todayTotal'] - anterior['todayTotal'],
+        'total': atual['total'] - anterior['total'],
+    }
+
+
+@app.route('/api/stream/summary', methods=['GET'])
+def stream_summary():
+    """Stream SSE (text/event-stream) do resumo público.
+
+    Envia um evento `summary` ao ligar e sempre que um voto é gravado (em qualquer worker),
+    com o resumo completo e o `delta` em relação ao evento anterior. Comentários de
+    heartbeat mantêm a ligação viva; ao fim de SSE_MAX_AGE_SECONDS o servidor fecha e o
+    EventSource volta a ligar sozinho.
+    """
+    if not version_watcher.subscribe(max_subscribers=SSE_MAX_STREAMS):
+        # Limite de streams neste worker: o cliente volta ao polling
+        return jsonify({'error': 'Demasiados streams abertos'}), 503, {'Retry-After': '30'}
+
+    def eventos():
+        try:
+            yield 'retry: 5000\n\n'
+            aberto_em = time.monotonic()
+            anterior = None
+            enviada = None
+            version = version_watcher.current()
+            while True:
+                hoje = datetime.now().strftime('%Y-%m-%d')
+                # Enviar quando a versão muda, no primeiro evento e na mudança de dia
+                if version is not None or anterior is None or anterior['date'] != hoje:
+                    enviada = version if version is not None else version_watcher.current()
+                    body = _cached_body(
+                        ('public_summary', hoje, bool(firebase_db)),
+                        enviada,
+                        lambda: _resumo_publico(hoje),
+                    )
+                    atual = app.json.loads(body)
+                    payload = dict(atual, delta=_delta_resumo(anterior, atual))
+                    yield f'id: {enviada}\nevent: summary\ndata: {app.json.dumps(payload)}\n\n'
+                    anterior = atual
+
+                restante = SSE_MAX_AGE_SECONDS - (time.monotonic() - aberto_em)
+                if restante <= 0:
+                    return
+                version = version_watcher.wait_for_change(enviada, min(SSE_HEARTBEAT_SECONDS, restante))
+                if version is None:
+                    yield ': ping\n\n'
+        finally:
+            version_watcher.unsubscribe()
+
+    return Response(stream_with_context(eventos()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+GRAUS_VALIDOS = ['muito_satisfeito', 'satisfeito', 'insatisfeito']
+
+# Dias da semana em português
+DIAS_SEMANA = ['Segunda-feira', 'Terça-feira', 'Quarta-feira',
+               'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
+
+# Limite de votos aceites num único pedido de /api/feedback/batch
+FEEDBACK_BATCH_MAX = int(os.environ.get('FEEDBACK_BATCH_MAX', '500'))
+# Chaves de idempotência (clientId) guardadas durante este número de dias
+FEEDBACK_CLIENT_KEY_DAYS = float(os.environ.get('FEEDBACK_CLIENT_KEY_DAYS', '30'))
+
+
+def _montar_feedback(grau_satisfacao: str, now: datetime) -> dict:
+    """Constrói o registo de feedback (campos do SQLite/Firestore) para o instante dado."""
+    return {
+        'grau_satisfacao': grau_satisfacao,
+        'data': now.strftime('%Y-%m-%d'),
+        'hora': now.strftime('%H:%M:%S'),
+        'dia_semana': DIAS_SEMANA[now.weekday()],
+        'timestamp': now.isoformat()
+    }
+
+
+def _chave_cliente(valor):
+    """`clientId` gerado pelo kiosk para um voto (None se não vier); ValueError se inválido."""
+    if valor is None or valor == '':
+        return None
+    if not isinstance(valor, str) or len(valor) > 64:
+        raise ValueError('clientId inválido')
+    return valor
+
+
+def _gravar_votos(votos) -> list:
+    """Grava [(instante, feedback_data, chave do kiosk ou None)] numa transação (e na outbox do Firestore).
+
+    Devolve os ids; um voto com uma chave já gravada devolve o id existente sem gravar.
+
+    Com INGEST_MODE=group os votos passam pelo escritor único do processo, que junta os
+    pedidos concorrentes no mesmo commit (ver ingest.py); ingest.IngestTimeout quer dizer
+    que nada foi gravado.
+    """
+    linhas = [
+        (migrations.to_ts(quando), migrations.GRAU_CODES[feedback_data['grau_satisfacao']], feedback_data, chave)
+        for quando, feedback_data, chave in votos
+    ]
+    if ingest_writer is not None:
+        return ingest_writer.submit(linhas, replicate=_replicar_firestore())
+
+    conn = get_db()
+    try:
+        with conn:
+            return ingest.insert_votes(conn, linhas, replicate=_replicar_firestore())
+    finally:
+        conn.close()
+
+
+def _parse_client_timestamp(value) -> Optional[datetime]:
+    """Converte o `createdAt` (ISO 8601) enviado pelo kiosk para hora local sem fuso.
+
+    O browser envia `toISOString()` (UTC, sufixo 'Z'); o servidor guarda data/hora locais,
+    por isso convertemos para o fuso do servidor antes de descartar o tzinfo.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    # Nunca aceitar instantes no futuro (relógio do kiosk adiantado)
+    return min(parsed, datetime.now())
+
+
 @app.route('/api/feedback', methods=['POST'])
 def registrar_feedback():
     """Registra o feedback do usuário no SQLite e Firebase"""
@@ -301,49 +1048,30 @@ def registrar_feedback():
         data = request.get_json()
         grau_satisfacao = data.get('grau_satisfacao')
         
-        if grau_satisfacao not in ['muito_satisfeito', 'satisfeito', 'insatisfeito']:
+        if grau_satisfacao not in GRAUS_VALIDOS:
             return jsonify({'error': 'Grau de satisfação inválido'}), 400
+        try:
+            chave = _chave_cliente(data.get('clientId'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        now = datetime.now()
-        data_str = now.strftime('%Y-%m-%d')
-        hora_str = now.strftime('%H:%M:%S')
-        timestamp_str = now.isoformat()
-        
-        # Dias da semana em português
-        dias_semana = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 
-                       'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
-        dia_semana = dias_semana[now.weekday()]
-        
-        # Preparar dados do feedback
-        feedback_data = {
-            'grau_satisfacao': grau_satisfacao,
-            'data': data_str,
-            'hora': hora_str,
-            'dia_semana': dia_semana,
-            'timestamp': timestamp_str
-        }
-        
-        # Guardar no SQLite
-        conn = get_db()
-        cursor = conn.execute(
-            'INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
-            (grau_satisfacao, data_str, hora_str, dia_semana)
-        )
-        conn.commit()
-        feedback_id = cursor.lastrowid
-        conn.close()
+        if not _aguardar_hidratacao():
+            return jsonify({'error': 'A restaurar os dados do Firestore, tente novamente'}), 503
 
-        # Adicionar id ao payload (útil para Firestore e integrações)
-        feedback_data['id'] = feedback_id
+        # Preparar dados do feedback
+        agora = datetime.now()
+        feedback_data = _montar_feedback(grau_satisfacao, agora)
         
-        # Guardar no Firebase (Firestore)
-        if firebase_db:
-            try:
-                firebase_db.collection('feedback').document(f'feedback_{feedback_id}').set(feedback_data)
-                print(f"✓ Feedback {feedback_id} sincronizado com Firebase")
-            except Exception as firebase_error:
-                # Log do erro mas não falha a resposta
-                print(f"⚠ Aviso: Erro ao guardar no Firebase: {firebase_error}")
+        # Guardar no SQLite (feedback + outbox do Firestore na mesma transação);
+        # o id também fica no payload (útil para Firestore e integrações)
+        feedback_id, = _gravar_votos([(agora, feedback_data, chave)])
+
+        # O envio para o Firebase (Firestore) é feito em background pelo replicador
+        # (no modo lazy é o primeiro voto que o arranca e inicializa o Firebase)
+        replicator.start()
+        replicator.notify()
+        data_version.invalidate()
+        version_watcher.poke()
         
         return jsonify({
             'success': True,
@@ -351,6 +1079,74 @@ def registrar_feedback():
             'id': feedback_id
         })
     
+    except ingest.IngestTimeout as e:
+        # O voto não foi gravado: o kiosk guarda-o na fila e reenvia-o depois do Retry-After
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '2'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/feedback/batch', methods=['POST'])
+def registrar_feedback_batch():
+    """Regista vários votos de uma vez (reenvio da fila offline do kiosk).
+
+    Aceita `{"items": [{"grau_satisfacao": ..., "createdAt": ..., "clientId": ...}, ...]}` (ou a lista diretamente).
+    Todos os votos válidos são gravados numa única transação SQLite (e replicados para o
+    Firestore em batch pela outbox);
+    a resposta devolve, por item e pela mesma ordem, o id atribuído ou o erro de validação.
+    Um item cujo `clientId` já foi gravado (o kiosk reenviou um lote cuja resposta se perdeu)
+    não é gravado outra vez: recebe o id existente.
+    """
+    try:
+        body = request.get_json(silent=True)
+        items = body.get('items') if isinstance(body, dict) else body
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Lista de feedbacks vazia ou inválida'}), 400
+        if len(items) > FEEDBACK_BATCH_MAX:
+            return jsonify({'error': f'Máximo de {FEEDBACK_BATCH_MAX} feedbacks por pedido'}), 413
+
+        resultados = []
+        validos = []
+        for index, item in enumerate(items):
+            grau_satisfacao = item.get('grau_satisfacao') if isinstance(item, dict) else None
+            if grau_satisfacao not in GRAUS_VALIDOS:
+                resultados.append({'index': index, 'error': 'Grau de satisfação inválido'})
+                continue
+            try:
+                chave = _chave_cliente(item.get('clientId'))
+            except ValueError as e:
+                resultados.append({'index': index, 'error': str(e)})
+                continue
+            quando = _parse_client_timestamp(item.get('createdAt')) or datetime.now()
+            feedback_data = _montar_feedback(grau_satisfacao, quando)
+            resultados.append({'index': index, 'id': None})
+            validos.append((index, quando, feedback_data, chave))
+
+        if validos and not _aguardar_hidratacao():
+            return jsonify({'error': 'A restaurar os dados do Firestore, tente novamente'}), 503
+
+        # Guardar no SQLite (uma única transação)
+        if validos:
+            ids = _gravar_votos([voto[1:] for voto in validos])
+            for (index, _, _, _), feedback_id in zip(validos, ids):
+                resultados[index]['id'] = feedback_id
+
+            # O envio para o Firebase (Firestore) é feito em background pelo replicador
+            replicator.start()
+            replicator.notify()
+            data_version.invalidate()
+            version_watcher.poke()
+
+        return jsonify({
+            'success': True,
+            'accepted': len(validos),
+            'rejected': len(items) - len(validos),
+            'results': resultados,
+        })
+
+    except ingest.IngestTimeout as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '2'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -423,9 +1219,11 @@ def admin_login_firebase():
         if not id_token:
             return jsonify({'error': 'idToken ausente'}), 400
 
-        if not firebase_admin._apps:
+        get_firestore()
+        if not _firebase_app_inicializado():
             return jsonify({'error': 'Firebase não inicializado'}), 503
 
+        from firebase_admin import auth
         decoded = auth.verify_id_token(id_token)
         uid = decoded.get('uid')
         email = decoded.get('email')
@@ -453,6 +1251,71 @@ def admin_me():
         return jsonify({'loggedIn': False}), 200
     return jsonify({'loggedIn': True, 'email': session.get('admin_email')}), 200
 
+def _estatisticas_gerais() -> dict:
+    """Totais e percentagens por grau de satisfação (todo o histórico)."""
+    conn = get_db(readonly=True)
+    try:
+        # Total por tipo de satisfação (contagens diárias materializadas)
+        stats = conn.execute('''
+            SELECT grau_satisfacao, SUM(total) as total
+            FROM feedback_daily_counts
+            GROUP BY grau_satisfacao
+        ''').fetchall()
+
+        # Total geral
+        total_geral = sum(row['total'] for row in stats)
+    finally:
+        conn.close()
+    
+    # Calcular percentagens
+    resultado = {
+        'muito_satisfeito': 0,
+        'satisfeito': 0,
+        'insatisfeito': 0,
+        'total': total_geral
+    }
+    
+    percentagens = {
+        'muito_satisfeito': 0,
+        'satisfeito': 0,
+        'insatisfeito': 0
+    }
+    
+    for row in stats:
+        grau = row['grau_satisfacao']
+        total = row['total']
+        resultado[grau] = total
+        if total_geral > 0:
+            percentagens[grau] = round((total / total_geral) * 100, 2)
+    
+    resultado['percentagens'] = percentagens
+    return resultado
+
+
+def _estatisticas_do_dia(data: str) -> dict:
+    """Contagens por grau de satisfação num dia."""
+    conn = get_db(readonly=True)
+    try:
+        stats = conn.execute('''
+            SELECT grau_satisfacao, total
+            FROM feedback_daily_counts
+            WHERE data = ?
+        ''', (data,)).fetchall()
+    finally:
+        conn.close()
+    
+    resultado = {
+        'muito_satisfeito': 0,
+        'satisfeito': 0,
+        'insatisfeito': 0
+    }
+    
+    for row in stats:
+        resultado[row['grau_satisfacao']] = row['total']
+    
+    return resultado
+
+
 @app.route('/api/admin/stats')
 def get_stats():
     """Retorna estatísticas gerais"""
@@ -460,44 +1323,7 @@ def get_stats():
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        conn = get_db()
-        
-        # Total por tipo de satisfação
-        stats = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
-            GROUP BY grau_satisfacao
-        ''').fetchall()
-        
-        # Total geral
-        total_geral = conn.execute('SELECT COUNT(*) as total FROM feedback').fetchone()['total']
-        
-        conn.close()
-        
-        # Calcular percentagens
-        resultado = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0,
-            'total': total_geral
-        }
-        
-        percentagens = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0
-        }
-        
-        for row in stats:
-            grau = row['grau_satisfacao']
-            total = row['total']
-            resultado[grau] = total
-            if total_geral > 0:
-                percentagens[grau] = round((total / total_geral) * 100, 2)
-        
-        resultado['percentagens'] = percentagens
-        
-        return jsonify(resultado)
+        return _cached_json(('stats',), _estatisticas_gerais)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -509,182 +1335,587 @@ def get_daily_stats():
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        data_filtro = request.args.get('data')
-        
-        conn = get_db()
-        
-        if data_filtro:
-            stats = conn.execute('''
-                SELECT grau_satisfacao, COUNT(*) as total
-                FROM feedback
-                WHERE data = ?
-                GROUP BY grau_satisfacao
-            ''', (data_filtro,)).fetchall()
-        else:
-            # Retorna o dia atual
-            hoje = datetime.now().strftime('%Y-%m-%d')
-            stats = conn.execute('''
-                SELECT grau_satisfacao, COUNT(*) as total
-                FROM feedback
-                WHERE data = ?
-                GROUP BY grau_satisfacao
-            ''', (hoje,)).fetchall()
-        
-        conn.close()
-        
-        resultado = {
-            'muito_satisfeito': 0,
-            'satisfeito': 0,
-            'insatisfeito': 0
-        }
-        
-        for row in stats:
-            resultado[row['grau_satisfacao']] = row['total']
-        
-        return jsonify(resultado)
+        # Sem filtro, retorna o dia atual
+        data_filtro = request.args.get('data') or datetime.now().strftime('%Y-%m-%d')
+        return _cached_json(('stats_daily', data_filtro), lambda: _estatisticas_do_dia(data_filtro))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/admin/stats/comparison')
-def get_comparison_stats():
-    """Retorna comparação entre dois períodos"""
-    if not session.get('admin_logged_in'):
-        return jsonify({'error': 'Não autorizado'}), 401
-    
+# Séries temporais para gráficos: nº máximo de buckets numa resposta
+TIMESERIES_MAX_BUCKETS = int(os.environ.get('TIMESERIES_MAX_BUCKETS', '5000'))
+TIMESERIES_BUCKETS = ('hour', 'day', 'week', 'month', 'heatmap')
+
+
+def _buckets_densos(bucket: str, inicio: date, fim: date) -> list:
+    """Rótulos de todos os buckets do intervalo (inclusive), pela ordem, mesmo os vazios."""
+    rotulos = []
+    if bucket == 'hour':
+        atual = datetime.combine(inicio, datetime.min.time())
+        limite = datetime.combine(fim + timedelta(days=1), datetime.min.time())
+        while atual < limite and len(rotulos) <= TIMESERIES_MAX_BUCKETS:
+            rotulos.append(atual.strftime('%Y-%m-%dT%H:00'))
+            atual += timedelta(hours=1)
+    elif bucket == 'day':
+        atual = inicio
+        while atual <= fim and len(rotulos) <= TIMESERIES_MAX_BUCKETS:
+            rotulos.append(atual.isoformat())
+            atual += timedelta(days=1)
+    elif bucket == 'week':
+        # Semanas ISO, identificadas pela segunda-feira
+        atual = inicio - timedelta(days=inicio.weekday())
+        while atual <= fim and len(rotulos) <= TIMESERIES_MAX_BUCKETS:
+            rotulos.append(atual.isoformat())
+            atual += timedelta(days=7)
+    elif bucket == 'month':
+        ano, mes = inicio.year, inicio.month
+        while (ano, mes) <= (fim.year, fim.month) and len(rotulos) <= TIMESERIES_MAX_BUCKETS:
+            rotulos.append(f'{ano:04d}-{mes:02d}')
+            ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return rotulos
+
+
+def _serie_temporal(bucket: str, inicio: date, fim: date) -> dict:
+    """Contagens por grau de satisfação agrupadas por bucket, numa única agregação.
+
+    day/week/month leem as contagens diárias materializadas; hour e heatmap agregam
+    feedback_rows pelo índice (grau, ts). O resultado é colunar: `buckets` com os rótulos
+    e, em `series`, uma lista de contagens por grau alinhada com eles.
+    """
+    graus_por_codigo = {codigo: grau for grau, codigo in migrations.GRAU_CODES.items()}
+    conn = get_db(readonly=True)
     try:
-        data1_inicio = request.args.get('data1_inicio')
-        data1_fim = request.args.get('data1_fim')
-        data2_inicio = request.args.get('data2_inicio')
-        data2_fim = request.args.get('data2_fim')
-        
-        if not all([data1_inicio, data1_fim, data2_inicio, data2_fim]):
-            return jsonify({'error': 'Datas inválidas'}), 400
-        
-        conn = get_db()
-        
-        # Período 1
-        stats1 = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
-            WHERE data BETWEEN ? AND ?
-            GROUP BY grau_satisfacao
-        ''', (data1_inicio, data1_fim)).fetchall()
-        
-        # Período 2
-        stats2 = conn.execute('''
-            SELECT grau_satisfacao, COUNT(*) as total
-            FROM feedback
+        if bucket in ('day', 'week', 'month'):
+            chave_sql = {
+                'day': 'data',
+                'week': "date(data, '-' || ((CAST(strftime('%w', data) AS INTEGER) + 6) % 7) || ' days')",
+                'month': 'substr(data, 1, 7)',
+            }[bucket]
+            linhas = conn.execute(f'''
+                SELECT {chave_sql} AS bucket, grau_satisfacao, SUM(total) AS total
+                FROM feedback_daily_counts
+                WHERE data BETWEEN ? AND ?
+                GROUP BY 1, 2
+            ''', (inicio.isoformat(), fim.isoformat())).fetchall()
+            contagens = [(row['bucket'], row['grau_satisfacao'], row['total']) for row in linhas]
+        else:
+            params = (migrations.to_ts(datetime.combine(inicio, datetime.min.time())),
+                      migrations.to_ts(datetime.combine(fim + timedelta(days=1), datetime.min.time())))
+            if bucket == 'hour':
+                linhas = conn.execute('''
+                    SELECT ts / 3600 AS bucket, grau, COUNT(*) AS total
+                    FROM feedback_rows
+                    WHERE grau IN (0, 1, 2) AND ts >= ? AND ts < ?
+                    GROUP BY 1, 2
+                ''', params).fetchall()
+                contagens = [
+                    ((datetime(1970, 1, 1) + timedelta(hours=row['bucket'])).strftime('%Y-%m-%dT%H:00'),
+                     graus_por_codigo[row['grau']], row['total'])
+                    for row in linhas
+                ]
+            else:
+                # 1970-01-01 foi quinta-feira: (ts / 86400 + 3) % 7 dá 0 = segunda-feira
+                linhas = conn.execute('''
+                    SELECT (ts / 86400 + 3) % 7 AS dia, (ts % 86400) / 3600 AS hora, grau, COUNT(*) AS total
+                    FROM feedback_rows
+                    WHERE grau IN (0, 1, 2) AND ts >= ? AND ts < ?
+                    GROUP BY 1, 2, 3
+                ''', params).fetchall()
+    finally:
+        conn.close()
+
+    resultado = {
+        'bucket': bucket,
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+    }
+
+    if bucket == 'heatmap':
+        series = {grau: [[0] * 24 for _ in range(7)] for grau in GRAUS_VALIDOS}
+        series['total'] = [[0] * 24 for _ in range(7)]
+        for row in linhas:
+            series[graus_por_codigo[row['grau']]][row['dia']][row['hora']] = row['total']
+            series['total'][row['dia']][row['hora']] += row['total']
+        resultado.update({'dias': DIAS_SEMANA, 'horas': list(range(24)), 'series': series})
+        return resultado
+
+    rotulos = _buckets_densos(bucket, inicio, fim)
+    posicao = {rotulo: i for i, rotulo in enumerate(rotulos)}
+    series = {grau: [0] * len(rotulos) for grau in GRAUS_VALIDOS}
+    series['total'] = [0] * len(rotulos)
+    for rotulo, grau, total in contagens:
+        i = posicao.get(rotulo)
+        if i is None or grau not in series:
+            continue
+        series[grau][i] = total
+        series['total'][i] += total
+
+    resultado.update({'buckets': rotulos, 'series': series})
+    return resultado
+
+
+@app.route('/api/admin/stats/timeseries')
+def get_timeseries_stats():
+    """Contagens por grau de satisfação por hora, dia, semana ISO, mês ou hora × dia da semana.
+
+    Parâmetros: `bucket` (hour|day|week|month|heatmap, padrão day), `data_inicio` e `data_fim`
+    (AAAA-MM-DD, inclusivos; padrão: os últimos 30 dias).
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    bucket = (request.args.get('bucket') or 'day').strip().lower()
+    if bucket not in TIMESERIES_BUCKETS:
+        return jsonify({'error': f'bucket inválido (use {", ".join(TIMESERIES_BUCKETS)})'}), 400
+
+    try:
+        fim = date.fromisoformat(request.args.get('data_fim') or date.today().isoformat())
+        inicio = date.fromisoformat(request.args.get('data_inicio') or (fim - timedelta(days=29)).isoformat())
+    except ValueError:
+        return jsonify({'error': 'Data inválida (use AAAA-MM-DD)'}), 400
+    if inicio > fim:
+        return jsonify({'error': 'data_inicio posterior a data_fim'}), 400
+    if bucket != 'heatmap' and len(_buckets_densos(bucket, inicio, fim)) > TIMESERIES_MAX_BUCKETS:
+        return jsonify({'error': f'Intervalo demasiado grande (máximo de {TIMESERIES_MAX_BUCKETS} buckets)'}), 400
+
+    try:
+        return _cached_json(
+            ('timeseries', bucket, inicio.isoformat(), fim.isoformat()),
+            lambda: _serie_temporal(bucket, inicio, fim),
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Análises de tendência (NumPy): matriz de contagens diárias em memória por processo
+analytics_cache = analytics.DailyCountsCache(
+    lambda: get_db(readonly=True),
+    refresh_days=int(os.environ.get('ANALYTICS_REFRESH_DAYS', '7')),
+    full_reload_seconds=float(os.environ.get('ANALYTICS_FULL_RELOAD_SECONDS', '600')),
+)
+
+
+def _parametros_analytics(janela_padrao: int, dias_padrao: int):
+    """(inicio, fim, janela) a partir da query string; ValueError se inválidos."""
+    fim = date.fromisoformat(request.args.get('data_fim') or date.today().isoformat())
+    inicio = date.fromisoformat(
+        request.args.get('data_inicio') or (fim - timedelta(days=dias_padrao - 1)).isoformat()
+    )
+    janela = int(request.args.get('janela', janela_padrao))
+    if inicio > fim or not 1 <= janela <= 365:
+        raise ValueError()
+    return inicio, fim, janela
+
+
+@app.route('/api/admin/analytics/trends')
+def get_analytics_trends():
+    """Séries diárias com médias móveis, percentagens móveis e índice de satisfação (0-100).
+
+    Parâmetros: `data_inicio`, `data_fim` (padrão: últimos 90 dias) e `janela` (dias, padrão 7).
+    As janelas móveis usam os dias anteriores ao intervalo pedido.
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+    if not analytics.available():
+        return jsonify({'error': 'Análises indisponíveis (numpy não instalado)'}), 503
+
+    try:
+        inicio, fim, janela = _parametros_analytics(7, 90)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos (datas AAAA-MM-DD, janela entre 1 e 365)'}), 400
+    if (fim - inicio).days + 1 > TIMESERIES_MAX_BUCKETS:
+        return jsonify({'error': f'Intervalo demasiado grande (máximo de {TIMESERIES_MAX_BUCKETS} dias)'}), 400
+
+    try:
+        return _cached_json(
+            ('analytics_trends', inicio.isoformat(), fim.isoformat(), janela),
+            lambda: analytics.tendencias(*analytics_cache.snapshot(), inicio, fim, janela),
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/admin/analytics/anomalies')
+def get_analytics_anomalies():
+    """Dias com total de votos ou % de insatisfeitos fora do normal (z-score vs. janela anterior).
+
+    Parâmetros: `data_inicio`, `data_fim` (padrão: últimos 90 dias), `janela` (padrão 28)
+    e `limiar` (|z| mínimo, padrão 3).
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+    if not analytics.available():
+        return jsonify({'error': 'Análises indisponíveis (numpy não instalado)'}), 503
+
+    try:
+        inicio, fim, janela = _parametros_analytics(28, 90)
+        limiar = float(request.args.get('limiar', 3))
+        if not limiar > 0:
+            raise ValueError()
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos (datas AAAA-MM-DD, janela entre 1 e 365, limiar > 0)'}), 400
+
+    try:
+        return _cached_json(
+            ('analytics_anomalies', inicio.isoformat(), fim.isoformat(), janela, limiar),
+            lambda: analytics.anomalias(*analytics_cache.snapshot(), inicio, fim, janela, limiar),
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Comparação de períodos: limite de períodos por pedido
+COMPARISON_MAX_PERIODS = int(os.environ.get('COMPARISON_MAX_PERIODS', '200'))
+COMPARISON_MODOS = ('semanas', 'meses', 'yoy')
+
+
+def _variacao(val1: int, val2: int):
+    """Variação percentual de val1 para val2 (mesma regra do comparador original)."""
+    if val1 == 0:
+        return 100 if val2 > 0 else 0
+    return round(((val2 - val1) / val1) * 100, 2)
+
+
+def _totais_por_periodo(periodos: list) -> list:
+    """Contagens por grau para cada período [(inicio, fim), ...] (datas inclusivas).
+
+    Uma única leitura das contagens diárias, do início do primeiro ao fim do último período;
+    com somas acumuladas por dia, cada período custa O(1), mesmo que se sobreponham.
+    """
+    inicio = min(a for a, _ in periodos)
+    fim = max(b for _, b in periodos)
+    n_dias = (fim - inicio).days + 1
+    if n_dias > 366 * 20:
+        raise ValueError('Intervalo total demasiado grande (máximo de 20 anos)')
+
+    acumulado = {grau: [0] * (n_dias + 1) for grau in GRAUS_VALIDOS}
+    conn = get_db(readonly=True)
+    try:
+        linhas = conn.execute('''
+            SELECT data, grau_satisfacao, total
+            FROM feedback_daily_counts
             WHERE data BETWEEN ? AND ?
-            GROUP BY grau_satisfacao
-        ''', (data2_inicio, data2_fim)).fetchall()
-        
+        ''', (inicio.isoformat(), fim.isoformat()))
+        for row in linhas:
+            serie = acumulado.get(row['grau_satisfacao'])
+            if serie is not None:
+                serie[(date.fromisoformat(row['data']) - inicio).days + 1] += row['total']
+    finally:
         conn.close()
-        
-        # Formatar resultado
-        resultado = {
-            'periodo1': {
-                'muito_satisfeito': 0,
-                'satisfeito': 0,
-                'insatisfeito': 0,
-                'total': 0
-            },
-            'periodo2': {
-                'muito_satisfeito': 0,
-                'satisfeito': 0,
-                'insatisfeito': 0,
-                'total': 0
-            }
-        }
-        
-        for row in stats1:
-            resultado['periodo1'][row['grau_satisfacao']] = row['total']
-            resultado['periodo1']['total'] += row['total']
-        
-        for row in stats2:
-            resultado['periodo2'][row['grau_satisfacao']] = row['total']
-            resultado['periodo2']['total'] += row['total']
-        
-        # Calcular variações percentuais
-        resultado['variacao'] = {}
-        for key in ['muito_satisfeito', 'satisfeito', 'insatisfeito']:
-            val1 = resultado['periodo1'][key]
-            val2 = resultado['periodo2'][key]
-            
-            if val1 == 0:
-                variacao = 100 if val2 > 0 else 0
+
+    for serie in acumulado.values():
+        for i in range(1, len(serie)):
+            serie[i] += serie[i - 1]
+
+    resultados = []
+    for a, b in periodos:
+        i, j = (a - inicio).days, (b - inicio).days + 1
+        totais = {grau: acumulado[grau][j] - acumulado[grau][i] for grau in GRAUS_VALIDOS}
+        totais['total'] = sum(totais.values())
+        resultados.append(totais)
+    return resultados
+
+
+def _periodos_predefinidos(modo: str, n: int, ate: date):
+    """Períodos e pares a comparar para os modos predefinidos.
+
+    - semanas: as últimas N semanas ISO (até à semana de `ate`), pares consecutivos;
+    - meses: os últimos N meses, pares consecutivos;
+    - yoy: as últimas N semanas ISO e as mesmas semanas do ano anterior, pares (ano anterior -> atual).
+    """
+    periodos = []
+    if modo in ('semanas', 'yoy'):
+        segunda = ate - timedelta(days=ate.weekday())
+        for k in range(n - 1, -1, -1):
+            inicio = segunda - timedelta(weeks=k)
+            ano, semana, _ = inicio.isocalendar()
+            periodos.append((f'{ano}-W{semana:02d}', inicio, inicio + timedelta(days=6)))
+    else:
+        ano, mes = ate.year, ate.month
+        for _ in range(n):
+            inicio = date(ano, mes, 1)
+            seguinte = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+            periodos.insert(0, (f'{ano:04d}-{mes:02d}', inicio, seguinte - timedelta(days=1)))
+            ano, mes = (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+
+    if modo != 'yoy':
+        return periodos, [(i, i + 1) for i in range(len(periodos) - 1)]
+
+    anteriores = []
+    for _, inicio, _ in periodos:
+        ano, semana, _ = inicio.isocalendar()
+        try:
+            inicio_anterior = date.fromisocalendar(ano - 1, semana, 1)
+        except ValueError:
+            # Semana 53 sem equivalente no ano anterior: usar a 52
+            inicio_anterior = date.fromisocalendar(ano - 1, 52, 1)
+        _, semana_anterior, _ = inicio_anterior.isocalendar()
+        anteriores.append((f'{ano - 1}-W{semana_anterior:02d}', inicio_anterior, inicio_anterior + timedelta(days=6)))
+    return anteriores + periodos, [(i, i + n) for i in range(n)]
+
+
+def _comparacao_periodos(periodos: list, pares: list) -> dict:
+    """Resultado da comparação N-períodos: totais por período e variações por par."""
+    totais = _totais_por_periodo([(a, b) for _, a, b in periodos])
+    resultado = {
+        'periodos': [
+            dict({'rotulo': rotulo, 'inicio': a.isoformat(), 'fim': b.isoformat()}, **t)
+            for (rotulo, a, b), t in zip(periodos, totais)
+        ],
+        'variacoes': [],
+    }
+    for i, j in pares:
+        variacao = {'de': i, 'para': j}
+        for key in GRAUS_VALIDOS + ['total']:
+            variacao[key] = _variacao(totais[i][key], totais[j][key])
+        resultado['variacoes'].append(variacao)
+    return resultado
+
+
+@app.route('/api/admin/stats/comparison')
+def get_comparison_stats():
+    """Retorna comparação entre períodos
+
+    - `data1_inicio`, `data1_fim`, `data2_inicio`, `data2_fim`: dois períodos (formato original);
+    - `periodos=AAAA-MM-DD:AAAA-MM-DD,...`: lista arbitrária de períodos, variações entre consecutivos;
+    - `modo=semanas|meses|yoy&n=N[&ate=AAAA-MM-DD]`: períodos predefinidos (ver _periodos_predefinidos).
+    `pares=todos` calcula a variação para todos os pares (i < j) em vez dos predefinidos.
+    Todos os períodos saem de uma única leitura das contagens diárias.
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+    
+    try:
+        data1_inicio = request.args.get('data1_inicio')
+        data1_fim = request.args.get('data1_fim')
+        data2_inicio = request.args.get('data2_inicio')
+        data2_fim = request.args.get('data2_fim')
+        periodos_arg = (request.args.get('periodos') or '').strip()
+        modo = (request.args.get('modo') or '').strip().lower()
+
+        try:
+            if periodos_arg:
+                periodos = []
+                for item in periodos_arg.split(','):
+                    inicio_str, fim_str = item.strip().split(':')
+                    periodos.append((item.strip(), date.fromisoformat(inicio_str), date.fromisoformat(fim_str)))
+                pares = [(i, i + 1) for i in range(len(periodos) - 1)]
+            elif modo:
+                if modo not in COMPARISON_MODOS:
+                    return jsonify({'error': f'modo inválido (use {", ".join(COMPARISON_MODOS)})'}), 400
+                n = max(1, int(request.args.get('n', 4)))
+                if n > COMPARISON_MAX_PERIODS:
+                    raise ValueError()
+                ate = date.fromisoformat(request.args.get('ate') or date.today().isoformat())
+                periodos, pares = _periodos_predefinidos(modo, n, ate)
+            elif all([data1_inicio, data1_fim, data2_inicio, data2_fim]):
+                periodos = [
+                    ('periodo1', date.fromisoformat(data1_inicio), date.fromisoformat(data1_fim)),
+                    ('periodo2', date.fromisoformat(data2_inicio), date.fromisoformat(data2_fim)),
+                ]
+                pares = None
             else:
-                variacao = round(((val2 - val1) / val1) * 100, 2)
-            
-            resultado['variacao'][key] = variacao
-        
-        return jsonify(resultado)
+                return jsonify({'error': 'Datas inválidas'}), 400
+        except ValueError:
+            return jsonify({'error': 'Datas inválidas'}), 400
+
+        if len(periodos) > COMPARISON_MAX_PERIODS:
+            return jsonify({'error': f'Máximo de {COMPARISON_MAX_PERIODS} períodos'}), 400
+        if any(a > b for _, a, b in periodos):
+            return jsonify({'error': 'Período com início posterior ao fim'}), 400
+        if request.args.get('pares') == 'todos':
+            pares = [(i, j) for i in range(len(periodos)) for j in range(i + 1, len(periodos))]
+
+        if pares is None:
+            # Formato original (dois períodos)
+            def build():
+                periodo1, periodo2 = _totais_por_periodo([(a, b) for _, a, b in periodos])
+                return {
+                    'periodo1': periodo1,
+                    'periodo2': periodo2,
+                    'variacao': {
+                        key: _variacao(periodo1[key], periodo2[key])
+                        for key in ['muito_satisfeito', 'satisfeito', 'insatisfeito']
+                    },
+                }
+        else:
+            def build():
+                return _comparacao_periodos(periodos, pares)
+
+        key = ('comparison', tuple((a.isoformat(), b.isoformat()) for _, a, b in periodos),
+               tuple(pares) if pares is not None else None, modo)
+        return _cached_json(key, build)
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Tamanho máximo de página do histórico (evita carregar a tabela inteira numa lista)
+HISTORICO_MAX_PER_PAGE = int(os.environ.get('HISTORICO_MAX_PER_PAGE', '200'))
+_HISTORICO_CHAVES = ('id', 'grau_satisfacao', 'data', 'hora', 'dia_semana')
+
+
+def _encode_cursor(row) -> str:
+    """Cursor opaco para a paginação por chave (ts, id) do histórico."""
+    raw = json.dumps([row['ts'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        chave = json.loads(raw)
+        if len(chave) == 3:
+            # Cursor antigo (data, hora, id), de antes do esquema compacto
+            data, hora, feedback_id = chave
+            ts = migrations.to_ts(datetime.strptime(f'{data} {hora}', '%Y-%m-%d %H:%M:%S'))
+        else:
+            ts, feedback_id = chave
+        return int(ts), int(feedback_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+def _filtro_datas_ts(data_inicio, data_fim):
+    """Condições SQL sobre feedback_rows.ts para um intervalo de datas (inclusivo).
+
+    Devolve (condições, parâmetros); ValueError se alguma data for inválida.
+    """
+    where = []
+    params = []
+    try:
+        if data_inicio:
+            where.append('ts >= ?')
+            params.append(migrations.date_to_ts(data_inicio))
+        if data_fim:
+            where.append('ts < ?')
+            params.append(migrations.date_to_ts(data_fim) + 86400)
+    except ValueError:
+        raise ValueError('Data inválida (use AAAA-MM-DD)')
+    return where, params
+
+
+def _historico_total(conn, grau, data_inicio, data_fim, q) -> int:
+    """Total de registos para os filtros do histórico (em cache por versão dos dados).
+
+    Sem pesquisa por id, o total sai das contagens diárias materializadas.
+    """
+    key = ('historico_total', grau, data_inicio, data_fim, q)
+    version = data_version.get()
+    total = json_cache.get(key, version)
+    if total is not None:
+        return total
+
+    if q.isdigit():
+        where, params = _filtro_datas_ts(data_inicio, data_fim)
+        where.append('id = ?')
+        params.append(int(q))
+        if grau in GRAUS_VALIDOS:
+            where.append('grau = ?')
+            params.append(migrations.GRAU_CODES[grau])
+        row = conn.execute(
+            f"SELECT COUNT(*) as total FROM feedback_rows WHERE {' AND '.join(where)}", tuple(params)
+        ).fetchone()
+        json_cache.set(key, version, row['total'])
+        return row['total']
+
+    where = []
+    params = []
+    if grau in GRAUS_VALIDOS:
+        where.append('grau_satisfacao = ?')
+        params.append(grau)
+    if data_inicio and data_fim:
+        where.append('data BETWEEN ? AND ?')
+        params.extend([data_inicio, data_fim])
+    elif data_inicio:
+        where.append('data >= ?')
+        params.append(data_inicio)
+    elif data_fim:
+        where.append('data <= ?')
+        params.append(data_fim)
+
+    where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+    total = conn.execute(
+        f'SELECT COALESCE(SUM(total), 0) as total FROM feedback_daily_counts{where_sql}', tuple(params)
+    ).fetchone()['total']
+    json_cache.set(key, version, total)
+    return total
+
+
 @app.route('/api/admin/historico')
 def get_historico():
-    """Retorna o histórico de feedbacks"""
+    """Retorna o histórico de feedbacks
+
+    Paginação por chave: cada resposta traz `next_cursor`; passar `cursor=<next_cursor>`
+    devolve a página seguinte sem OFFSET. `page` sem cursor continua a funcionar (OFFSET).
+    `include_total=0` dispensa o total (que, quando pedido, vem de cache).
+    """
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 50))
-        offset = (page - 1) * per_page
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(max(1, int(request.args.get('per_page', 50))), HISTORICO_MAX_PER_PAGE)
+        cursor = (request.args.get('cursor') or '').strip()
+        include_total = request.args.get('include_total', '1') not in ['0', 'false', 'False']
 
         # Filtros opcionais (não quebram o comportamento atual)
         q = (request.args.get('q') or '').strip()
         grau = (request.args.get('grau') or '').strip()
         data_inicio = (request.args.get('data_inicio') or '').strip()
         data_fim = (request.args.get('data_fim') or '').strip()
+
+        try:
+            cursor_key = _decode_cursor(cursor) if cursor else None
+            where, params = _filtro_datas_ts(data_inicio, data_fim)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        conn = get_db()
-        
-        where = []
-        params = []
-
-        if grau in ['muito_satisfeito', 'satisfeito', 'insatisfeito']:
-            where.append('grau_satisfacao = ?')
-            params.append(grau)
-
-        if data_inicio and data_fim:
-            where.append('data BETWEEN ? AND ?')
-            params.extend([data_inicio, data_fim])
-        elif data_inicio:
-            where.append('data >= ?')
-            params.append(data_inicio)
-        elif data_fim:
-            where.append('data <= ?')
-            params.append(data_fim)
-
-        if q.isdigit():
-            where.append('id = ?')
-            params.append(int(q))
-
-        where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
-
-        # Total de registros (com filtros)
-        total = conn.execute(f'SELECT COUNT(*) as total FROM feedback{where_sql}', tuple(params)).fetchone()['total']
-
-        # Registros paginados (com filtros)
-        registros = conn.execute(f'''
-            SELECT id, grau_satisfacao, data, hora, dia_semana
-            FROM feedback
-            {where_sql}
-            ORDER BY data DESC, hora DESC
-            LIMIT ? OFFSET ?
-        ''', tuple(params + [per_page, offset])).fetchall()
-        
-        conn.close()
+        conn = get_db(readonly=True)
+        try:
+            if grau in GRAUS_VALIDOS:
+                where.append('grau = ?')
+                params.append(migrations.GRAU_CODES[grau])
+
+            if q.isdigit():
+                where.append('id = ?')
+                params.append(int(q))
+
+            if cursor_key:
+                where.append('(ts, id) < (?, ?)')
+                params.extend(cursor_key)
+                offset = 0
+            else:
+                offset = (page - 1) * per_page
+
+            where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+
+            # Registros paginados (com filtros); +1 linha para saber se há página seguinte
+            registros = conn.execute(f'''
+                SELECT {migrations.FEEDBACK_COLUMNS}, ts
+                FROM feedback_rows
+                {where_sql}
+                ORDER BY ts DESC, id DESC
+                LIMIT ? OFFSET ?
+            ''', tuple(params + [per_page + 1, offset])).fetchall()
+
+            # Total de registros (com filtros)
+            total = _historico_total(conn, grau, data_inicio, data_fim, q) if include_total else None
+        finally:
+            conn.close()
+
+        has_more = len(registros) > per_page
+        registros = registros[:per_page]
         
         resultado = {
             'total': total,
             'page': page,
             'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page,
-            'registros': [dict(row) for row in registros]
+            'total_pages': (total + per_page - 1) // per_page if total is not None else None,
+            'has_more': has_more,
+            'next_cursor': _encode_cursor(registros[-1]) if has_more else None,
+            # As 5 primeiras colunas de FEEDBACK_COLUMNS, por posição (sem procurar cada chave na Row)
+            'registros': [dict(zip(_HISTORICO_CHAVES, row)) for row in registros]
         }
         
         return jsonify(resultado)
@@ -695,7 +1926,12 @@ def get_historico():
 @app.route('/api/admin/export/csv')
 @app.route('/api/admin/export/xlsx')
 def export_csv():
-    """Exporta dados em formato Excel"""
+    """Exporta dados em formato Excel
+
+    O workbook é gerado em modo write-only (as linhas vão para um ficheiro temporário
+    em vez de ficarem em memória). Para intervalos grandes use os jobs em
+    /api/admin/export/jobs, que geram o ficheiro fora do pedido.
+    """
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Não autorizado'}), 401
     
@@ -703,69 +1939,36 @@ def export_csv():
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
         
-        conn = get_db()
-        
-        if data_inicio and data_fim:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                WHERE data BETWEEN ? AND ?
-                ORDER BY data, hora
-            ''', (data_inicio, data_fim)).fetchall()
-        else:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                ORDER BY data, hora
-            ''').fetchall()
-        
-        conn.close()
-        
-        # Criar workbook Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Feedback"
-        
-        # Cabeçalho com formatação
-        header = ['ID', 'Grau de Satisfação', 'Data', 'Hora', 'Dia da Semana']
-        ws.append(header)
-        
-        # Formatar cabeçalho
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-        
-        # Adicionar dados
-        grau_map = {
-            'muito_satisfeito': 'Muito Satisfeito',
-            'satisfeito': 'Satisfeito',
-            'insatisfeito': 'Insatisfeito'
-        }
-        
-        for row in registros:
-            ws.append([
-                row['id'],
-                grau_map.get(row['grau_satisfacao'], row['grau_satisfacao']),
-                row['data'],
-                row['hora'],
-                row['dia_semana']
-            ])
-        
-        # Ajustar largura das colunas
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 12
-        ws.column_dimensions['D'].width = 12
-        ws.column_dimensions['E'].width = 18
+        output = tempfile.TemporaryFile()
+        conn = get_db(readonly=True)
+        try:
+            cursor = _export_cursor(conn, data_inicio, data_fim)
+            writer = export_jobs.XlsxWriter(output)
+            linhas = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    writer.append([
+                        row['id'],
+                        GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao']),
+                        row['data'],
+                        row['hora'],
+                        row['dia_semana']
+                    ])
+                linhas += len(rows)
+            cursor.close()
+            writer.close()
+            METRIC_EXPORT_ROWS.inc(linhas, format='xlsx')
+            METRIC_EXPORT_BYTES.inc(output.tell(), format='xlsx')
+        except Exception:
+            output.close()
+            raise
+        finally:
+            conn.close()
         
-        # Salvar em memória
-        output = io.BytesIO()
-        wb.save(output)
         output.seek(0)
-        
         return send_file(
             output,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
@@ -777,9 +1980,94 @@ def export_csv():
         return jsonify({'error': str(e)}), 500
 
 
+# Linhas lidas do SQLite por iteração nas exportações em streaming
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', '1000'))
+
+GRAU_LABELS = {
+    'muito_satisfeito': 'Muito Satisfeito',
+    'satisfeito': 'Satisfeito',
+    'insatisfeito': 'Insatisfeito'
+}
+
+
+def _export_cursor(conn, data_inicio, data_fim):
+    """Cursor ordenado (data, hora) com os registos a exportar, opcionalmente por intervalo."""
+    if data_inicio and data_fim:
+        where, params = _filtro_datas_ts(data_inicio, data_fim)
+        return conn.execute(f'''
+            SELECT {migrations.FEEDBACK_COLUMNS}
+            FROM feedback_rows
+            WHERE {' AND '.join(where)}
+            ORDER BY ts, id
+        ''', tuple(params))
+    return conn.execute(f'''
+        SELECT {migrations.FEEDBACK_COLUMNS}
+        FROM feedback_rows
+        ORDER BY ts, id
+    ''')
+
+
+def _stream_export(conn, cursor, render, filename, mimetype, compress=False):
+    """Resposta em streaming: lê o cursor em lotes (fetchmany) e envia cada lote já formatado.
+
+    `render(rows)` devolve o texto de um lote; `render(None)` o rodapé final.
+    A conexão volta ao pool quando a resposta termina (ou o cliente desiste).
+    Com `compress=True` o ficheiro é enviado em gzip (.gz) à medida que é gerado.
+    """
+    formato = filename.rsplit('.', 1)[-1]
+    enviados = {'linhas': 0, 'bytes': 0}
+
+    def gerar():
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            enviados['linhas'] += len(rows)
+            yield render(rows).encode('utf-8')
+        rodape = render(None)
+        if rodape:
+            yield rodape.encode('utf-8')
+
+    def contar(chunks):
+        for chunk in chunks:
+            enviados['bytes'] += len(chunk)
+            yield chunk
+
+    def gerar_gzip():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+        for chunk in gerar():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def fechar():
+        cursor.close()
+        conn.close()
+        METRIC_EXPORT_ROWS.inc(enviados['linhas'], format=formato)
+        METRIC_EXPORT_BYTES.inc(enviados['bytes'], format=formato)
+
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    response = Response(stream_with_context(contar(gerar_gzip() if compress else gerar())), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(fechar)
+    return response
+
+
+def _export_gzip_requested() -> bool:
+    return request.args.get('gzip', '0') not in ['0', 'false', 'False', '']
+
+
 @app.route('/api/admin/export/csv-plain')
 def export_csv_plain():
-    """Exporta dados em CSV (texto). Mantém o /export/csv antigo como Excel."""
+    """Exporta dados em CSV (texto). Mantém o /export/csv antigo como Excel.
+
+    O ficheiro é gerado em streaming (memória constante); `gzip=1` envia-o comprimido.
+    """
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Não autorizado'}), 401
 
@@ -787,50 +2075,142 @@ def export_csv_plain():
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
 
-        conn = get_db()
-        if data_inicio and data_fim:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                WHERE data BETWEEN ? AND ?
-                ORDER BY data, hora
-            ''', (data_inicio, data_fim)).fetchall()
-        else:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                ORDER BY data, hora
-            ''').fetchall()
-        conn.close()
-
-        grau_map = {
-            'muito_satisfeito': 'Muito Satisfeito',
-            'satisfeito': 'Satisfeito',
-            'insatisfeito': 'Insatisfeito'
-        }
+        conn = get_db(readonly=True)
+        try:
+            cursor = _export_cursor(conn, data_inicio, data_fim)
+        except Exception:
+            conn.close()
+            raise
 
-        output = io.StringIO()
-        writer = csv.writer(output)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
         writer.writerow(['id', 'grau_satisfacao', 'data', 'hora', 'dia_semana'])
-        for row in registros:
-            writer.writerow([
-                row['id'],
-                grau_map.get(row['grau_satisfacao'], row['grau_satisfacao']),
-                row['data'],
-                row['hora'],
-                row['dia_semana'],
-            ])
-
-        csv_bytes = output.getvalue().encode('utf-8')
-        return send_file(
-            io.BytesIO(csv_bytes),
+
+        def render(rows):
+            if rows is not None:
+                for row in rows:
+                    writer.writerow([
+                        row['id'],
+                        GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao']),
+                        row['data'],
+                        row['hora'],
+                        row['dia_semana'],
+                    ])
+            # O cabeçalho sai com o primeiro lote (ou no fim, se não houver registos)
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+
+        return _stream_export(
+            conn, cursor, render,
+            filename=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
             mimetype='text/csv; charset=utf-8',
-            as_attachment=True,
-            download_name=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            compress=_export_gzip_requested(),
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _export_total(conn, data_inicio, data_fim) -> int:
+    """Nº de registos a exportar (a partir das contagens diárias, para o progresso dos jobs)."""
+    if data_inicio and data_fim:
+        row = conn.execute(
+            'SELECT COALESCE(SUM(total), 0) AS total FROM feedback_daily_counts WHERE data BETWEEN ? AND ?',
+            (data_inicio, data_fim)
+        ).fetchone()
+    else:
+        row = conn.execute('SELECT COALESCE(SUM(total), 0) AS total FROM feedback_daily_counts').fetchone()
+    return row['total']
+
+
+def _medir_export_job(job):
+    METRIC_EXPORT_JOBS.inc(format=job['format'], status=job['status'])
+    if job['status'] == 'done':
+        METRIC_EXPORT_ROWS.inc(job['rows'], format=job['format'])
+        METRIC_EXPORT_BYTES.inc(job['sizeBytes'], format=job['format'])
+
+
+# Exportações em background: estado e ficheiros em disco, visíveis a todos os workers
+export_job_manager = export_jobs.ExportJobManager(
+    directory=os.environ.get('EXPORT_JOBS_DIR') or os.path.join(tempfile.gettempdir(), 'feedback_exports'),
+    connect=lambda: get_db(readonly=True),
+    open_cursor=_export_cursor,
+    count_rows=_export_total,
+    grau_labels=GRAU_LABELS,
+    ttl_seconds=float(os.environ.get('EXPORT_JOBS_TTL_SECONDS', '3600')),
+    max_workers=int(os.environ.get('EXPORT_JOBS_WORKERS', '1')),
+    fetch_size=EXPORT_FETCH_SIZE,
+    on_finish=_medir_export_job,
+)
+
+
+def _export_job_json(job) -> dict:
+    dados = dict(job)
+    dados.pop('pid', None)
+    dados['downloadUrl'] = (
+        url_for('download_export_job', job_id=job['id']) if job['status'] == 'done' else None
+    )
+    return dados
+
+
+@app.route('/api/admin/export/jobs', methods=['POST'])
+def create_export_job():
+    """Cria um job de exportação (xlsx ou csv) e devolve 202 com o id para polling."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    payload = request.get_json(silent=True) or request.form
+    try:
+        job = export_job_manager.submit(
+            (payload.get('format') or 'xlsx').lower(),
+            data_inicio=payload.get('data_inicio') or None,
+            data_fim=payload.get('data_fim') or None,
         )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    response = jsonify(_export_job_json(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_export_job', job_id=job['id'])
+    return response
+
+
+@app.route('/api/admin/export/jobs/<job_id>')
+def get_export_job(job_id):
+    """Estado/progresso de um job (linhas, linhas/s, pico de memória, expiração)."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    job = export_job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado ou expirado'}), 404
+    return jsonify(_export_job_json(job))
+
+
+@app.route('/api/admin/export/jobs/<job_id>/download')
+def download_export_job(job_id):
+    """Descarrega o ficheiro de um job terminado."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    job = export_job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado ou expirado'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Job ainda não terminou (estado: {job['status']})"}), 409
+
+    mimetype, extensao = export_jobs.FORMATS[job['format']]
+    criado = datetime.fromtimestamp(job['createdAt']).strftime('%Y%m%d_%H%M%S')
+    return send_file(
+        export_job_manager.artifact_path(job),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f'feedback_export_{criado}{extensao}',
+    )
+
 
 @app.route('/api/admin/system')
 def admin_system():
@@ -839,11 +2219,15 @@ def admin_system():
         return jsonify({'error': 'Não autorizado'}), 401
 
     try:
-        conn = get_db()
-        total = conn.execute('SELECT COUNT(*) as total FROM feedback').fetchone()['total']
-        last_id_row = conn.execute('SELECT MAX(id) as last_id FROM feedback').fetchone()
-        last_id = last_id_row['last_id'] if last_id_row else None
-        conn.close()
+        conn = get_db(readonly=True)
+        try:
+            total = conn.execute(
+                'SELECT COALESCE(SUM(total), 0) as total FROM feedback_daily_counts'
+            ).fetchone()['total']
+            last_id_row = conn.execute('SELECT MAX(id) as last_id FROM feedback_rows').fetchone()
+            last_id = last_id_row['last_id'] if last_id_row else None
+        finally:
+            conn.close()
 
         db_size = None
         try:
@@ -860,9 +2244,12 @@ def admin_system():
             'db': {
                 'path': DATABASE,
                 'sizeBytes': db_size,
+                'pool': db_pool.stats(),
+                'latestSnapshot': next(iter(maintenance.list_snapshots(BACKUP_DIR)), None),
             },
             'firebase': {
-                'initialized': bool(firebase_admin._apps),
+                'initialized': _firebase_app_inicializado(),
+                'state': firebase_state,
                 'firestoreAvailable': bool(firebase_db),
                 'projectId': FIREBASE_WEB_CONFIG.get('projectId') or None,
             },
@@ -873,9 +2260,41 @@ def admin_system():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/system/sql', methods=['GET', 'POST'])
+def admin_sql_profile():
+    """Profiling de SQL deste worker: instruções mais caras, consultas lentas e planos.
+
+    GET aceita `limit` e `order` (seconds, calls, max, rows). POST com
+    `{"enabled": true|false, "threshold_ms": 50, "reset": true}` liga/desliga o profiler,
+    muda o limite das consultas lentas ou limpa as estatísticas (só neste processo).
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        try:
+            query_profiler.configure(
+                enabled=payload.get('enabled'),
+                threshold_ms=payload.get('threshold_ms'),
+            )
+        except (TypeError, ValueError):
+            return jsonify({'error': 'threshold_ms inválido'}), 400
+        if payload.get('reset'):
+            query_profiler.reset()
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        limit = 50
+    relatorio = query_profiler.report(limit=limit, order=request.args.get('order', 'seconds'))
+    relatorio['pid'] = os.getpid()
+    return jsonify(relatorio)
+
+
 @app.route('/api/admin/export/txt')
 def export_txt():
-    """Exporta dados em formato TXT"""
+    """Exporta dados em formato TXT (em streaming; `gzip=1` envia-o comprimido)"""
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'Não autorizado'}), 401
     
@@ -883,59 +2302,188 @@ def export_txt():
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
         
-        conn = get_db()
-        
-        if data_inicio and data_fim:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                WHERE data BETWEEN ? AND ?
-                ORDER BY data, hora
-            ''', (data_inicio, data_fim)).fetchall()
-        else:
-            registros = conn.execute('''
-                SELECT id, grau_satisfacao, data, hora, dia_semana
-                FROM feedback
-                ORDER BY data, hora
-            ''').fetchall()
-        
-        conn.close()
-        
-        # Criar TXT em memória
-        output = io.StringIO()
-        output.write('=' * 80 + '\n')
-        output.write('RELATÓRIO DE FEEDBACK DE SATISFAÇÃO\n')
-        output.write('=' * 80 + '\n\n')
-        
-        grau_map = {
-            'muito_satisfeito': 'Muito Satisfeito',
-            'satisfeito': 'Satisfeito',
-            'insatisfeito': 'Insatisfeito'
-        }
-        
-        for row in registros:
-            output.write(f"ID: {row['id']}\n")
-            output.write(f"Grau de Satisfação: {grau_map.get(row['grau_satisfacao'], row['grau_satisfacao'])}\n")
-            output.write(f"Data: {row['data']}\n")
-            output.write(f"Hora: {row['hora']}\n")
-            output.write(f"Dia da Semana: {row['dia_semana']}\n")
-            output.write('-' * 80 + '\n\n')
+        conn = get_db(readonly=True)
+        try:
+            cursor = _export_cursor(conn, data_inicio, data_fim)
+        except Exception:
+            conn.close()
+            raise
         
-        output.write(f"\nTotal de registros: {len(registros)}\n")
-        output.write(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
+        # Cabeçalho vai no primeiro lote; o total é contado durante o streaming
+        estado = {'total': 0, 'cabecalho': True}
+
+        def render(rows):
+            output = io.StringIO()
+            if estado['cabecalho']:
+                output.write('=' * 80 + '\n')
+                output.write('RELATÓRIO DE FEEDBACK DE SATISFAÇÃO\n')
+                output.write('=' * 80 + '\n\n')
+                estado['cabecalho'] = False
+
+            if rows is None:
+                output.write(f"\nTotal de registros: {estado['total']}\n")
+                output.write(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
+                return output.getvalue()
+
+            for row in rows:
+                output.write(f"ID: {row['id']}\n")
+                output.write(f"Grau de Satisfação: {GRAU_LABELS.get(row['grau_satisfacao'], row['grau_satisfacao'])}\n")
+                output.write(f"Data: {row['data']}\n")
+                output.write(f"Hora: {row['hora']}\n")
+                output.write(f"Dia da Semana: {row['dia_semana']}\n")
+                output.write('-' * 80 + '\n\n')
+            estado['total'] += len(rows)
+            return output.getvalue()
         
-        # Preparar arquivo para download
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        return _stream_export(
+            conn, cursor, render,
+            filename=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt',
             mimetype='text/plain',
-            as_attachment=True,
-            download_name=f'feedback_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
+            compress=_export_gzip_requested(),
         )
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Linhas por transação na importação de CSV
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '5000'))
+
+
+def _importar_csv(fileobj, preserve_ids=True, forward=False, progress=None) -> dict:
+    """Importa um CSV no formato do export (csv-plain) e avisa caches/replicador."""
+    forward = bool(forward and get_firestore())
+    conn = get_db()
+    try:
+        relatorio = csv_import.import_csv(
+            conn, fileobj, GRAU_LABELS,
+            chunk_size=IMPORT_CHUNK_SIZE,
+            preserve_ids=preserve_ids,
+            forward=forward,
+            progress=progress,
+        )
+    finally:
+        conn.close()
+        # Mesmo após um erro a meio, os lotes anteriores já foram gravados
+        data_version.invalidate()
+        version_watcher.poke()
+    if forward:
+        replicator.notify()
+    return relatorio
+
+
+@app.route('/api/admin/import/csv', methods=['POST'])
+def import_csv():
+    """Importa votos de um CSV exportado por /api/admin/export/csv-plain (também .csv.gz).
+
+    O ficheiro vai no campo `file` (multipart) ou no corpo do pedido. Parâmetros:
+    `ids=novos` atribui ids novos (por omissão os ids do ficheiro são mantidos e os
+    repetidos ignorados); `firestore=1` envia também as linhas para o Firestore.
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    upload = request.files.get('file')
+    fileobj = upload.stream if upload else request.stream
+    try:
+        relatorio = _importar_csv(
+            fileobj,
+            preserve_ids=request.values.get('ids', 'manter') != 'novos',
+            forward=request.values.get('firestore', '0') not in ['0', 'false', 'False', ''],
+        )
+    except csv_import.CsvImportError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'success': True, **relatorio})
+
+
+# Hidratação do SQLite a partir do Firestore (ver hydrate.py). Ligada por omissão quando a
+# base de dados é efémera (/tmp em Vercel/Cloud Run): cada instância nova começa vazia.
+# Decide-se pelo caminho resolvido e não pela presença de DATABASE_PATH, que o
+# gunicorn.conf.py exporta sempre (/tmp/feedback.db nesses ambientes).
+HYDRATE_ON_START = os.environ.get(
+    'HYDRATE_ON_START',
+    '1' if (IS_VERCEL or IS_CLOUD_RUN) and DATABASE.startswith('/tmp/') else '0',
+) not in ['0', 'false', 'False', '']
+HYDRATE_PAGE_SIZE = int(os.environ.get('HYDRATE_PAGE_SIZE', '1000'))
+HYDRATE_PARALLELISM = int(os.environ.get('HYDRATE_PARALLELISM', '4'))
+# Quanto tempo um voto espera pela hidratação do arranque antes de responder 503
+HYDRATE_WAIT_SECONDS = float(os.environ.get('HYDRATE_WAIT_SECONDS', '60'))
+
+hydration_done = threading.Event()
+hydration_done.set()
+last_hydration = None
+
+
+def _hidratar(force=False, progress=None) -> dict:
+    """Hidrata o SQLite a partir do Firestore (um processo de cada vez). Devolve o relatório."""
+    global last_hydration
+    client = get_firestore()
+    if client is None:
+        raise RuntimeError('Firebase não está disponível')
+
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover - Windows
+        fcntl = None
+    # Vários workers na mesma base de dados: um hidrata, os outros esperam pelo lock e
+    # depois encontram-na atualizada (só uma contagem no Firestore)
+    with open(DATABASE + '.hydrate.lock', 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        conn = get_db()
+        try:
+            relatorio = hydrate.hydrate(
+                conn, client, GRAU_LABELS,
+                page_size=HYDRATE_PAGE_SIZE,
+                parallelism=HYDRATE_PARALLELISM,
+                force=force,
+                progress=progress,
+            )
+        finally:
+            conn.close()
+            data_version.invalidate()
+            version_watcher.poke()
+    last_hydration = dict(relatorio, at=time.time())
+    return relatorio
+
+
+def _hidratar_no_arranque():
+    global last_hydration
+    inicio = time.perf_counter()
+    try:
+        r = _hidratar()
+        startup_timer.record('hydrate', time.perf_counter() - inicio, reason=r['reason'], rows=r['inserted'])
+        if r['hydrated']:
+            print(f"✓ SQLite hidratado a partir do Firestore: {r['inserted']} voto(s) em {r['seconds']}s "
+                  f"({r['rowsPerSecond']} linhas/s, último id {r['maxId']})")
+    except Exception as e:
+        startup_timer.record('hydrate', time.perf_counter() - inicio, error=str(e))
+        last_hydration = {'error': str(e), 'at': time.time()}
+        print(f"⚠ Aviso: Hidratação a partir do Firestore falhou: {e}")
+    finally:
+        hydration_done.set()
+
+
+def _aguardar_hidratacao() -> bool:
+    """Os votos esperam pela hidratação do arranque (senão os ids recomeçariam em 1)."""
+    return hydration_done.wait(HYDRATE_WAIT_SECONDS)
+
+
+@app.route('/api/admin/system/hydrate', methods=['POST'])
+def admin_hydrate():
+    """Hidrata o SQLite a partir do Firestore. `{"force": true}` relê a coleção inteira."""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        relatorio = _hidratar(force=bool(payload.get('force')))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'success': True, **relatorio})
+
+
 @app.route('/api/admin/dates')
 def get_available_dates():
     """Retorna as datas disponíveis para filtragem"""
@@ -943,19 +2491,199 @@ def get_available_dates():
         return jsonify({'error': 'Não autorizado'}), 401
     
     try:
-        conn = get_db()
-        dates = conn.execute('''
-            SELECT DISTINCT data
-            FROM feedback
-            ORDER BY data DESC
-        ''').fetchall()
-        conn.close()
+        conn = get_db(readonly=True)
+        try:
+            dates = conn.execute('''
+                SELECT data
+                FROM feedback_daily_counts
+                GROUP BY data
+                HAVING SUM(total) > 0
+                ORDER BY data DESC
+            ''').fetchall()
+        finally:
+            conn.close()
         
         return jsonify([row['data'] for row in dates])
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _tarefa_snapshot():
+    conn = get_db(readonly=True)
+    try:
+        return maintenance.snapshot(conn, BACKUP_DIR, pages=BACKUP_PAGES, keep=BACKUP_KEEP)
+    finally:
+        conn.close()
+
+
+def _tarefa_compact():
+    # VACUUM INTO escreve noutro ficheiro, mas não é permitido com query_only (pool de leitura)
+    conn = get_db()
+    try:
+        return maintenance.compact(conn, BACKUP_DIR, keep=BACKUP_KEEP)
+    finally:
+        conn.close()
+
+
+def _tarefa_analyze():
+    conn = get_db()
+    try:
+        return maintenance.analyze(conn)
+    finally:
+        conn.close()
+
+
+def _tarefa_client_keys():
+    """Apaga as chaves de idempotência com mais de FEEDBACK_CLIENT_KEY_DAYS dias."""
+    conn = get_db()
+    try:
+        with conn:
+            apagadas = conn.execute(
+                'DELETE FROM feedback_client_keys WHERE created_at < ?',
+                (time.time() - FEEDBACK_CLIENT_KEY_DAYS * 86400,)
+            ).rowcount
+        return {'task': 'client_keys', 'deleted': apagadas}
+    finally:
+        conn.close()
+
+
+# Reconciliação SQLite <-> Firestore por dia (ver reconcile.py)
+RECONCILE_PARALLELISM = int(os.environ.get('RECONCILE_PARALLELISM', '8'))
+last_reconcile = None
+
+
+class ReconcileBusy(Exception):
+    """Outra reconciliação já está a correr (noutro worker ou thread)."""
+
+
+def _reconciliar(direction='both', deep=False, dry_run=False) -> dict:
+    """Reconcilia o SQLite com o Firestore (um processo de cada vez). Devolve o relatório."""
+    global last_reconcile
+    client = get_firestore()
+    if client is None:
+        raise RuntimeError('Firebase não está disponível')
+    if not hydration_done.is_set():
+        raise ReconcileBusy('Hidratação do arranque em curso')
+
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover - Windows
+        fcntl = None
+    with open(DATABASE + '.reconcile.lock', 'a') as lock:
+        if fcntl:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ReconcileBusy('Reconciliação em curso noutro processo')
+        conn = get_db()
+        try:
+            relatorio = reconcile.reconcile(
+                conn, client, GRAU_LABELS,
+                direction=direction,
+                deep=deep,
+                dry_run=dry_run,
+                parallelism=RECONCILE_PARALLELISM,
+            )
+        finally:
+            conn.close()
+    if relatorio['toSqlite']:
+        data_version.invalidate()
+        version_watcher.poke()
+    last_reconcile = dict(relatorio, at=time.time())
+    return relatorio
+
+
+def _tarefa_reconcile():
+    # Sem Firebase (ex.: desenvolvimento local sem credenciais) não há nada a reconciliar
+    if get_firestore() is None:
+        return {'task': 'reconcile', 'skipped': 'Firebase não está disponível'}
+    try:
+        return dict(_reconciliar(), task='reconcile')
+    except ReconcileBusy as e:
+        return {'task': 'reconcile', 'skipped': str(e)}
+
+
+# Manutenção periódica (intervalos em horas; 0 desliga a tarefa). A última execução de cada
+# tarefa fica em app_meta, por isso com vários workers só um a corre em cada intervalo.
+maintenance_scheduler = maintenance.MaintenanceScheduler(
+    connect=get_db,
+    tasks={
+        'snapshot': (float(os.environ.get('MAINTENANCE_SNAPSHOT_HOURS', '6')) * 3600, _tarefa_snapshot),
+        'compact': (float(os.environ.get('MAINTENANCE_COMPACT_HOURS', '24')) * 3600, _tarefa_compact),
+        'analyze': (float(os.environ.get('MAINTENANCE_ANALYZE_HOURS', '24')) * 3600, _tarefa_analyze),
+        'client_keys': (24 * 3600, _tarefa_client_keys),
+        'reconcile': (float(os.environ.get('RECONCILE_HOURS', '1')) * 3600, _tarefa_reconcile),
+    },
+    lock_path=DATABASE + '.maintenance.lock',
+)
+if os.environ.get('MAINTENANCE', '1') not in ['0', 'false', 'False', '']:
+    maintenance_scheduler.start()
+
+
+@app.route('/api/admin/system/maintenance', methods=['GET', 'POST'])
+def admin_maintenance():
+    """Snapshots e tarefas de manutenção do SQLite.
+
+    POST com `{"task": "snapshot"|"compact"|"analyze"}` corre a tarefa já (mesmo que não
+    esteja em atraso); responde 409 se outro processo estiver a fazer manutenção.
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+
+    resultado = None
+    if request.method == 'POST':
+        task = (request.get_json(silent=True) or {}).get('task')
+        if task not in maintenance_scheduler.tasks:
+            return jsonify({'error': f"Tarefa inválida (use {', '.join(maintenance_scheduler.tasks)})"}), 400
+        resultado = maintenance_scheduler.run_due(only=task, force=True).get(task)
+        if resultado is None:
+            return jsonify({'error': 'Manutenção em curso noutro processo'}), 409
+
+    return jsonify({
+        'result': resultado,
+        'backupDir': BACKUP_DIR,
+        'snapshots': maintenance.list_snapshots(BACKUP_DIR),
+        'lastRestore': last_restore,
+        **maintenance_scheduler.stats(),
+    })
+
+
+@app.route('/api/admin/system/reconcile', methods=['GET', 'POST'])
+def admin_reconcile():
+    """Reconciliação SQLite <-> Firestore por dia.
+
+    POST com `{"direction": "both"|"to-firestore"|"to-sqlite", "deep": bool, "dryRun": bool}`
+    corre-a já; responde 409 se já estiver a correr. GET devolve o último relatório.
+    """
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Não autorizado'}), 401
+    if request.method == 'GET':
+        return jsonify({'last': last_reconcile})
+
+    payload = request.get_json(silent=True) or {}
+    direction = payload.get('direction', 'both')
+    if direction not in reconcile.DIRECTIONS:
+        return jsonify({'error': f"Direção inválida (use {', '.join(reconcile.DIRECTIONS)})"}), 400
+    try:
+        relatorio = _reconciliar(direction, deep=bool(payload.get('deep')), dry_run=bool(payload.get('dryRun')))
+    except ReconcileBusy as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'success': True, **relatorio})
+
+
+# Hidratação no arranque: síncrona no modo eager, senão em background (os votos esperam por ela)
+if HYDRATE_ON_START:
+    hydration_done.clear()
+    if startup_timer.mode == 'eager':
+        _hidratar_no_arranque()
+    else:
+        threading.Thread(target=_hidratar_no_arranque, name='startup-hydrate', daemon=True).start()
+
+# Fim da importação: o worker está pronto para aceitar pedidos
+startup_timer.ready()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', '8000'))
     host = '0.0.0.0' if os.environ.get('PORT') else '127.0.0.1'
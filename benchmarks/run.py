@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos endpoints (votos, resumo, estatísticas, histórico e exportações).
+
+Para cada tamanho pedido cria (ou reaproveita) uma base de dados sintética e corre os
+cenários num subprocesso próprio, com a app Flask em processo (test client, sem rede).
+O Firestore é substituído por um stub em memória: o replicador drena a outbox normalmente,
+mas nada sai da máquina.
+
+Exemplos:
+    python benchmarks/run.py --sizes 10k,1m --output resultados.json
+    python benchmarks/run.py --sizes 10m --reuse --db-dir /var/tmp/bench
+    python benchmarks/run.py --sizes 10k --compare resultados_antigos.json
+
+O JSON de saída tem, por tamanho e por cenário: pedidos, erros, throughput (req/s),
+latências p50/p95/p99/máx (ms), bytes médios por resposta, pico de RSS, as esperas do
+pool SQLite (esperas, tempo à espera e timeouts), o tempo à espera do lock de escrita do
+SQLite (ver `WriteLockTimer`) e erros "database is locked" durante o cenário. Em `payload` ficam o tempo de serialização de uma página grande do histórico
+com cada JSON provider e o tamanho/tempo de cada compressão.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GRAUS_PESOS = (('insatisfeito', 0.15), ('satisfeito', 0.30), ('muito_satisfeito', 0.55))
+
+
+def parse_size(texto):
+    texto = texto.strip().lower()
+    multiplicador = {'k': 1_000, 'm': 1_000_000}.get(texto[-1:], 1)
+    numero = texto[:-1] if multiplicador > 1 else texto
+    return int(float(numero) * multiplicador)
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100.0 * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+
+# Dados sintéticos -------------------------------------------------------------
+
+def seed_database(path, rows, days, seed):
+    """Cria a base de dados com `rows` votos distribuídos pelos últimos `days` dias."""
+    import migrations
+
+    for sufixo in ('', '-wal', '-shm'):
+        try:
+            os.remove(path + sufixo)
+        except OSError:
+            pass
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    migrations.migrate(conn)
+
+    rng = random.Random(seed)
+    codigos = [migrations.GRAU_CODES[g] for g, _ in GRAUS_PESOS]
+    pesos = [p for _, p in GRAUS_PESOS]
+    fim = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio_ts = migrations.to_ts(fim - timedelta(days=days))
+    passo = max(1, (days * 86400) // max(1, rows))
+
+    # Votos por ordem cronológica (como chegam na realidade), em lotes grandes
+    lote = 50_000
+    t0 = time.perf_counter()
+    for base in range(0, rows, lote):
+        n = min(lote, rows - base)
+        graus = rng.choices(codigos, weights=pesos, k=n)
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO feedback_rows (ts, grau) VALUES (?, ?)',
+            ((inicio_ts + (base + i) * days * 86400 // rows + rng.randrange(passo), graus[i]) for i in range(n))
+        )
+        conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return time.perf_counter() - t0
+
+
+def count_rows(path):
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM feedback_rows').fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+# Stub do Firestore --------------------------------------------------------------
+
+class StubFirestore:
+    """Cliente Firestore falso: aceita batches e conta documentos, com latência opcional."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.documents = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return doc_id
+
+    def batch(self):
+        return _StubBatch(self)
+
+
+class _StubBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = 0
+
+    def set(self, ref, data):
+        self._writes += 1
+
+    def commit(self):
+        if self._client.latency:
+            time.sleep(self._client.latency)
+        with self._client._lock:
+            self._client.documents += self._writes
+            self._client.commits += 1
+
+
+# Lock de escrita do SQLite --------------------------------------------------------
+
+_ESCRITAS = ('BEGIN', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class WriteLockTimer:
+    """Tempo das instruções que abrem uma transação de escrita nas conexões do pool.
+
+    É nessa instrução (BEGIN IMMEDIATE, ou o primeiro INSERT/UPDATE/DELETE de uma
+    transação implícita) que o SQLite espera pelo lock de escrita (busy_timeout) quando
+    outro escritor o tem; em WAL o resto da transação e o commit já não esperam por ele.
+    O tempo medido inclui o trabalho da própria instrução (microssegundos num INSERT), e
+    conta todos os escritores do processo (também o replicador a limpar a outbox).
+    As esperas do pool (checkout de uma conexão) são contadas à parte, em `pool`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def install(self, connection_class):
+        timer = self
+        execute, executemany = connection_class.execute, connection_class.executemany
+
+        def medir(metodo):
+            def wrapper(conn, sql, *args):
+                if conn._readonly or conn.in_transaction or not sql.lstrip()[:7].upper().startswith(_ESCRITAS):
+                    return metodo(conn, sql, *args)
+                inicio = time.perf_counter()
+                try:
+                    return metodo(conn, sql, *args)
+                finally:
+                    timer.add(time.perf_counter() - inicio)
+            return wrapper
+
+        connection_class.execute = medir(execute)
+        connection_class.executemany = medir(executemany)
+
+    def add(self, segundos):
+        with self._lock:
+            self.count += 1
+            self.seconds += segundos
+            self.max_seconds = max(self.max_seconds, segundos)
+
+    def snapshot(self, reset_max=False):
+        with self._lock:
+            valores = self.count, self.seconds, self.max_seconds
+            if reset_max:
+                self.max_seconds = 0.0
+            return valores
+
+
+# Execução dos cenários ----------------------------------------------------------
+
+class Runner:
+    def __init__(self, app_module, args):
+        self.app = app_module
+        self.args = args
+        self.results = {}
+        self.write_lock = WriteLockTimer()
+        self.write_lock.install(app_module.sqlite_pool.PooledConnection)
+
+    def client(self, admin=False):
+        client = self.app.app.test_client()
+        if admin:
+            with client.session_transaction() as sess:
+                sess['admin_logged_in'] = True
+        return client
+
+    def run(self, nome, pedido, requests=None, threads=1, admin=True, cold=False):
+        """Corre `pedido(client, i)` `requests` vezes em `threads` threads e regista as métricas."""
+        requests = requests or self.args.requests
+        limite = time.perf_counter() + self.args.max_seconds
+        latencias = []
+        tamanhos = []
+        erros = {'http': 0, 'locked': 0}
+        lock = threading.Lock()
+        contador = iter(range(requests))
+
+        pool_antes = self.app.db_pool.stats()
+        escritas_antes = self.write_lock.snapshot(reset_max=True)
+        pico = {'rss': current_rss(), 'ativo': True}
+
+        def amostrar():
+            while pico['ativo']:
+                pico['rss'] = max(pico['rss'], current_rss())
+                time.sleep(0.02)
+
+        def trabalhador():
+            client = self.client(admin)
+            while time.perf_counter() < limite:
+                with lock:
+                    i = next(contador, None)
+                if i is None:
+                    return
+                if cold:
+                    self.app.json_cache.clear()
+                t = time.perf_counter()
+                resp = pedido(client, i)
+                dt = time.perf_counter() - t
+                with lock:
+                    latencias.append(dt)
+                    if resp.content_length is not None:
+                        tamanhos.append(resp.content_length)
+                    if resp.status_code >= 400:
+                        erros['http'] += 1
+                        if b'locked' in resp.get_data():
+                            erros['locked'] += 1
+                resp.close()
+
+        amostrador = threading.Thread(target=amostrar, daemon=True)
+        amostrador.start()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(trabalhador) for _ in range(threads)]:
+                future.result()
+        duracao = time.perf_counter() - t0
+        pico['ativo'] = False
+        amostrador.join()
+
+        pool_depois = self.app.db_pool.stats()
+        pool = {}
+        for tipo in ('write', 'read'):
+            for campo, chave in (('waits', 'Waits'), ('waitTimeMs', 'WaitMs'), ('timeouts', 'Timeouts')):
+                pool[f'{tipo}{chave}'] = round(pool_depois[tipo][campo] - pool_antes[tipo][campo], 3)
+        escritas = self.write_lock.snapshot()
+        write_lock = {
+            'transactions': escritas[0] - escritas_antes[0],
+            'waitMs': round((escritas[1] - escritas_antes[1]) * 1000, 3),
+            'maxWaitMs': round(escritas[2] * 1000, 3),
+        }
+
+        ms = [v * 1000 for v in latencias]
+        self.results[nome] = {
+            'requests': len(latencias),
+            'threads': threads,
+            'errors': erros['http'],
+            'lockedErrors': erros['locked'],
+            'seconds': round(duracao, 3),
+            'throughputRps': round(len(latencias) / duracao, 1) if duracao > 0 else None,
+            'p50Ms': round(percentil(ms, 50), 3) if ms else None,
+            'p95Ms': round(percentil(ms, 95), 3) if ms else None,
+            'p99Ms': round(percentil(ms, 99), 3) if ms else None,
+            'maxMs': round(max(ms), 3) if ms else None,
+            'avgBytes': round(sum(tamanhos) / len(tamanhos)) if tamanhos else None,
+            'peakRssBytes': pico['rss'],
+            'pool': pool,
+            'writeLock': write_lock,
+        }
+        r = self.results[nome]
+        print(f"  {nome:32} {r['requests']:6d} req  {r['throughputRps'] or 0:9.1f} req/s  "
+              f"p50 {r['p50Ms'] or 0:8.2f} ms  p99 {r['p99Ms'] or 0:8.2f} ms  "
+              f"lock escrita {write_lock['waitMs']:8.1f} ms  erros {r['errors']}",
+              file=sys.stderr, flush=True)
+        return r
+
+
+def scenarios(runner, rows):
+    app = runner.app
+    args = runner.args
+    graus = [g for g, _ in GRAUS_PESOS]
+    hoje = datetime.now().date()
+    export_inicio = (hoje - timedelta(days=args.export_days)).isoformat()
+    export_fim = hoje.isoformat()
+    intervalo = f'data_inicio={export_inicio}&data_fim={export_fim}'
+
+    # Votos
+    runner.run('registrar_feedback', lambda c, i: c.post('/api/feedback', json={'grau_satisfacao': graus[i % 3]}),
+               admin=False)
+    runner.run('registrar_feedback_concurrent',
+               lambda c, i: c.post('/api/feedback', json={'grau_satisfacao': graus[i % 3]}),
+               requests=args.requests * 2, threads=args.writers, admin=False)
+    runner.run('registrar_feedback_batch50',
+               lambda c, i: c.post('/api/feedback/batch', json={
+                   'items': [{'grau_satisfacao': graus[(i + k) % 3]} for k in range(50)]}),
+               requests=max(1, args.requests // 10), admin=False)
+
+    # Leituras (com cache quente e fria)
+    runner.run('public_summary', lambda c, i: c.get('/api/public/summary'), admin=False)
+    runner.run('public_summary_cold', lambda c, i: c.get('/api/public/summary'), admin=False, cold=True)
+    runner.run('get_stats', lambda c, i: c.get('/api/admin/stats'))
+    runner.run('get_stats_cold', lambda c, i: c.get('/api/admin/stats'), cold=True)
+    runner.run('get_daily_stats_cold', lambda c, i: c.get('/api/admin/stats/daily'), cold=True)
+    runner.run('get_comparison_cold', lambda c, i: c.get('/api/admin/stats/comparison?modo=yoy&n=12'), cold=True)
+    runner.run('get_timeseries_hour_cold',
+               lambda c, i: c.get(f'/api/admin/stats/timeseries?bucket=hour&{intervalo}'), cold=True)
+
+    # Histórico: primeira página, página profunda por OFFSET e por cursor
+    per_page = 50
+    runner.run('historico_first_page', lambda c, i: c.get(f'/api/admin/historico?per_page={per_page}'), cold=True)
+    conn = app.get_db(readonly=True)
+    try:
+        meio = conn.execute(
+            'SELECT ts, id FROM feedback_rows ORDER BY ts DESC, id DESC LIMIT 1 OFFSET ?', (rows // 2,)
+        ).fetchone()
+    finally:
+        conn.close()
+    pagina_meio = max(1, rows // 2 // per_page)
+    runner.run('historico_deep_offset',
+               lambda c, i: c.get(f'/api/admin/historico?per_page={per_page}&page={pagina_meio}&include_total=0'),
+               requests=max(1, args.requests // 10))
+    if meio:
+        cursor = app._encode_cursor({'ts': meio['ts'], 'id': meio['id']})
+        runner.run('historico_deep_cursor',
+                   lambda c, i: c.get(f'/api/admin/historico?per_page={per_page}&cursor={cursor}&include_total=0'))
+
+    # Páginas grandes do histórico: cada JSON provider e cada Content-Encoding (bytes em avgBytes)
+    grande = f'/api/admin/historico?per_page={args.large_page}&include_total=0'
+    backend = app.JSON_BACKEND
+    for nome_backend in ('json', 'orjson'):
+        if nome_backend == 'orjson' and not app.json_provider.orjson_available():
+            continue
+        app.json_provider.install(app.app, nome_backend)
+        runner.run(f'historico_large_{nome_backend}',
+                   lambda c, i: c.get(grande, headers={'Accept-Encoding': 'identity'}))
+    app.json_provider.install(app.app, backend)
+    for codificacao in app.compressor.encodings:
+        runner.run(f'historico_large_{codificacao}', lambda c, i, e=codificacao: c.get(grande, headers={'Accept-Encoding': e}))
+
+    # Exportações (intervalo dos últimos --export-days dias)
+    n_export = args.export_requests
+    for nome, url in (
+        ('export_csv_plain', f'/api/admin/export/csv-plain?{intervalo}'),
+        ('export_csv_plain_gzip', f'/api/admin/export/csv-plain?{intervalo}&gzip=1'),
+        ('export_txt', f'/api/admin/export/txt?{intervalo}'),
+        ('export_xlsx', f'/api/admin/export/xlsx?{intervalo}'),
+    ):
+        runner.run(nome, lambda c, i, url=url: c.get(url, buffered=True), requests=n_export)
+
+    def export_job(c, i):
+        resp = c.post('/api/admin/export/jobs', json={
+            'format': 'xlsx', 'data_inicio': export_inicio, 'data_fim': export_fim})
+        job_id = resp.get_json()['id']
+        limite = time.perf_counter() + args.max_seconds
+        while True:
+            estado = c.get(f'/api/admin/export/jobs/{job_id}')
+            if estado.get_json()['status'] not in ('queued', 'running') or time.perf_counter() > limite:
+                return estado
+            time.sleep(0.01)
+
+    runner.run('export_job_xlsx', export_job, requests=n_export)
+
+    # Carga mista: escritores e leitores em simultâneo
+    def misto(c, i):
+        if i % 4 == 0:
+            return c.post('/api/feedback', json={'grau_satisfacao': graus[i % 3]})
+        if i % 4 == 1:
+            return c.get('/api/public/summary')
+        if i % 4 == 2:
+            return c.get(f'/api/admin/historico?per_page={per_page}')
+        return c.get('/api/admin/stats')
+
+    runner.run('mixed_read_write', misto, requests=args.requests * 4, threads=args.writers * 2)
+
+
+def payload_benchmark(app_module, args, repeticoes=20):
+    """Serialização e compressão de uma página grande do histórico, fora do pedido HTTP."""
+    app = app_module.app
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_logged_in'] = True
+    pagina = client.get(f'/api/admin/historico?per_page={args.large_page}&include_total=0',
+                        headers={'Accept-Encoding': 'identity'}).get_json()
+    resultado = {'rows': len(pagina['registros']), 'serialization': {}, 'compression': {}}
+
+    backend = app_module.JSON_BACKEND
+    corpo = None
+    for nome in ('json', 'orjson'):
+        if nome == 'orjson' and not app_module.json_provider.orjson_available():
+            continue
+        app_module.json_provider.install(app, nome)
+        with app.app_context():
+            t = time.perf_counter()
+            for _ in range(repeticoes):
+                corpo = app.json.response(pagina).get_data()
+            ms = (time.perf_counter() - t) * 1000 / repeticoes
+        resultado['serialization'][nome] = {'ms': round(ms, 3), 'bytes': len(corpo)}
+    app_module.json_provider.install(app, backend)
+
+    compressor = app_module.compressor
+    for codificacao in compressor.encodings:
+        t = time.perf_counter()
+        for _ in range(repeticoes):
+            comprimido = compressor._comprimir(corpo, codificacao)
+        resultado['compression'][codificacao] = {
+            'ms': round((time.perf_counter() - t) * 1000 / repeticoes, 3),
+            'bytes': len(comprimido),
+            'ratio': round(len(comprimido) / len(corpo), 3),
+        }
+
+    print(f"  payload ({resultado['rows']} registos): " + '  '.join(
+        [f"{n} {r['ms']:.2f} ms {r['bytes']} B" for n, r in resultado['serialization'].items()]
+        + [f"{n} {r['ms']:.2f} ms {r['bytes']} B" for n, r in resultado['compression'].items()]
+    ), file=sys.stderr, flush=True)
+    return resultado
+
+
+def worker(args):
+    """Corre num subprocesso: prepara a base de dados, importa a app e corre os cenários."""
+    rows = parse_size(args.size)
+    db_path = os.path.join(args.db_dir, f'bench_{args.size}.db')
+
+    seed_seconds = None
+    if not (args.reuse and count_rows(db_path) == rows):
+        print(f'A gerar {rows} votos em {db_path}...', file=sys.stderr, flush=True)
+        seed_seconds = seed_database(db_path, rows, args.days, args.seed)
+
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ['EXPORT_JOBS_DIR'] = os.path.join(args.db_dir, 'exports')
+    # Métricas do benchmark separadas das da aplicação (e de outras corridas na mesma máquina)
+    os.environ['METRICS_DIR'] = os.path.join(args.db_dir, 'metrics')
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    # Credenciais inválidas: a inicialização do Firebase falha logo, sem rede
+    os.environ['FIREBASE_SERVICE_ACCOUNT_JSON'] = '{}'
+    os.environ['STARTUP_MODE'] = 'eager'
+    # O benchmark mede os handlers: todos os pedidos vêm do mesmo cliente e seriam recusados com 429
+    os.environ.setdefault('ADMISSION', '0')
+    # A base de dados acabada de gerar não tem histórico de manutenção: sem isto o snapshot,
+    # a compactação, o ANALYZE e a reconciliação correm a meio dos cenários medidos
+    os.environ['MAINTENANCE'] = '0'
+    os.environ['HISTORICO_MAX_PER_PAGE'] = str(max(200, args.large_page))
+    os.environ.pop('FIREBASE_SERVICE_ACCOUNT_JSON_B64', None)
+
+    rss_antes = current_rss()
+    import app as app_module
+
+    stub = StubFirestore(latency=args.firestore_latency_ms / 1000.0)
+    app_module.firebase_db = stub
+    app_module.replicator.start()
+
+    runner = Runner(app_module, args)
+    print(f'Tamanho {args.size} ({rows} votos):', file=sys.stderr, flush=True)
+    scenarios(runner, rows)
+    payload = payload_benchmark(app_module, args)
+
+    # Dar ao replicador a oportunidade de esvaziar a outbox antes de recolher as métricas
+    def replicacao():
+        conn = app_module.get_db()
+        try:
+            return app_module.replicator.stats(conn)
+        finally:
+            conn.close()
+
+    limite = time.monotonic() + 10
+    while replicacao()['queueDepth'] and time.monotonic() < limite:
+        app_module.replicator.notify()
+        time.sleep(0.05)
+    fila = replicacao()['queueDepth']
+    app_module.replicator.stop()
+
+    import resource
+    resultado = {
+        'size': args.size,
+        'rows': rows,
+        'seedSeconds': round(seed_seconds, 3) if seed_seconds is not None else None,
+        'dbBytes': os.path.getsize(db_path),
+        'rssAfterImportBytes': rss_antes,
+        'peakRssBytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'firestoreStub': {'documents': stub.documents, 'commits': stub.commits,
+                          'queueDepth': fila},
+        'scenarios': runner.results,
+        'payload': payload,
+    }
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(anterior, atual):
+    """Tabela com a variação (%) de throughput e p95 face a um resultado anterior."""
+    antigos = {r['size']: r['scenarios'] for r in anterior.get('results', [])}
+    for resultado in atual['results']:
+        base = antigos.get(resultado['size'])
+        if not base:
+            continue
+        print(f"\nComparação ({resultado['size']}): {anterior['meta'].get('revision')} -> {atual['meta'].get('revision')}")
+        for nome, r in resultado['scenarios'].items():
+            a = base.get(nome)
+            if not a:
+                continue
+            def delta(campo):
+                if not a.get(campo) or r.get(campo) is None:
+                    return '     n/a'
+                return f'{(r[campo] - a[campo]) * 100.0 / a[campo]:+7.1f}%'
+            print(f'  {nome:32} throughput {delta("throughputRps")}   p95 {delta("p95Ms")}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k,1m,10m', help='Tamanhos das bases de dados (ex.: 10k,1m,10m)')
+    parser.add_argument('--db-dir', default=os.path.join(tempfile.gettempdir(), 'feedback_bench'))
+    parser.add_argument('--reuse', action='store_true', help='Reaproveitar bases de dados já geradas com o mesmo tamanho')
+    parser.add_argument('--days', type=int, default=730, help='Dias cobertos pelos dados sintéticos')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help='Pedidos por cenário')
+    parser.add_argument('--export-requests', type=int, default=3, help='Pedidos por cenário de exportação')
+    parser.add_argument('--export-days', type=int, default=30, help='Dias incluídos nas exportações')
+    parser.add_argument('--writers', type=int, default=8, help='Threads nos cenários concorrentes')
+    parser.add_argument('--large-page', type=int, default=2000, help='Registos por página nos cenários historico_large_*')
+    parser.add_argument('--max-seconds', type=float, default=30.0, help='Tempo máximo por cenário')
+    parser.add_argument('--firestore-latency-ms', type=float, default=0.0, help='Latência simulada por commit no stub')
+    parser.add_argument('--output', help='Ficheiro JSON de resultados (por omissão: stdout)')
+    parser.add_argument('--compare', help='Resultado anterior (JSON) para comparar')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return 0
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    resultados = []
+    for size in [s.strip() for s in args.sizes.split(',') if s.strip()]:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            result_file = f.name
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', '--size', size, '--result-file', result_file]
+        for opcao in ('db_dir', 'days', 'seed', 'requests', 'export_requests', 'export_days', 'writers',
+                      'large_page', 'max_seconds', 'firestore_latency_ms'):
+            cmd += [f'--{opcao.replace("_", "-")}', str(getattr(args, opcao))]
+        if args.reuse:
+            cmd.append('--reuse')
+        # A saída da app (prints de arranque) vai para stderr; stdout fica limpo para o JSON
+        subprocess.run(cmd, check=True, cwd=ROOT, stdout=sys.stderr)
+        with open(result_file, encoding='utf-8') as f:
+            resultados.append(json.load(f))
+        os.remove(result_file)
+
+    saida = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('worker', 'size', 'result_file')},
+        },
+        'results': resultados,
+    }
+
+    texto = json.dumps(saida, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), saida)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Compressão das respostas (gzip/brotli) negociada pelo `Accept-Encoding`.
+
+O dashboard e o ecrã de TV usam o Wi-Fi do espaço, por isso as respostas JSON/HTML/CSV
+acima de `min_size` bytes são comprimidas com brotli (se o módulo `brotli` estiver
+instalado e o cliente o aceitar) ou gzip. Não são comprimidos:
+
+- respostas em streaming (SSE, exportações) e ficheiros (`send_file`);
+- respostas que já têm `Content-Encoding` (ex.: CSV com `gzip=1`);
+- 304 e outros estados sem corpo.
+
+As respostas com ETag (as da cache por versão dos dados) guardam a versão comprimida
+num LRU pequeno, por isso um corpo em cache é comprimido uma vez por versão e não em
+cada pedido. O ETag passa a fraco (o corpo muda com a codificação, o conteúdo não).
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'image/svg+xml',
+})
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class Compressor:
+    """Comprime respostas Flask no after_request."""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4, cache_entries=64):
+        self.min_size = max(0, int(min_size))
+        self.gzip_level = int(gzip_level)
+        self.brotli_quality = int(brotli_quality)
+        self.brotli = _brotli()
+        self.encodings = ('br', 'gzip') if self.brotli else ('gzip',)
+        self.cache_entries = max(0, int(cache_entries))
+        self._cache = OrderedDict()  # (etag, codificação) -> bytes
+        self._lock = threading.Lock()
+
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_encoding = dict.fromkeys(self.encodings, 0)
+        self.cache_hits = 0
+
+    def negotiate(self, accept_encodings):
+        """Melhor codificação aceite pelo cliente (werkzeug `request.accept_encodings`), ou None."""
+        melhor, melhor_q = None, 0
+        # Em caso de empate ganha a primeira (brotli comprime mais)
+        for codificacao in self.encodings:
+            q = accept_encodings.quality(codificacao)
+            if q > melhor_q:
+                melhor, melhor_q = codificacao, q
+        return melhor
+
+    def _comprimir(self, data, codificacao):
+        if codificacao == 'br':
+            return self.brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _em_cache(self, chave, data, codificacao):
+        if chave is None or not self.cache_entries:
+            return self._comprimir(data, codificacao)
+        with self._lock:
+            corpo = self._cache.get(chave)
+            if corpo is not None:
+                self._cache.move_to_end(chave)
+                self.cache_hits += 1
+                return corpo
+        corpo = self._comprimir(data, codificacao)
+        with self._lock:
+            self._cache[chave] = corpo
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return corpo
+
+    def process(self, response, accept_encodings):
+        """Comprime `response` no lugar se valer a pena. Devolve a resposta."""
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304)):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        codificacao = self.negotiate(accept_encodings)
+        if codificacao is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        corpo = self._em_cache((etag, len(data), codificacao) if etag else None, data, codificacao)
+        if len(corpo) >= len(data):
+            return response
+
+        response.set_data(corpo)
+        response.headers['Content-Encoding'] = codificacao
+        if etag:
+            response.set_etag(etag, weak=True)
+        with self._lock:
+            self.responses += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(corpo)
+            self.by_encoding[codificacao] += 1
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'encodings': list(self.encodings),
+                'minSize': self.min_size,
+                'responses': self.responses,
+                'byEncoding': dict(self.by_encoding),
+                'bytesIn': self.bytes_in,
+                'bytesOut': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+                'cacheHits': self.cache_hits,
+            }
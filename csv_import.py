@@ -0,0 +1,272 @@
+"""
+Importação em massa de votos a partir do CSV do /api/admin/export/csv-plain.
+
+O ficheiro é lido em streaming (csv.reader sobre o ficheiro, aceita .gz) e gravado em
+lotes: cada lote de `chunk_size` linhas é uma única transação IMMEDIATE com um
+`executemany`, por isso a memória não depende do tamanho do ficheiro e o custo por voto
+é o de uma linha num INSERT preparado. Os triggers de `feedback_rows` mantêm as
+contagens diárias e a versão dos dados, tal como nos votos normais.
+
+Os ids do ficheiro são preservados por omissão (restaurar um backup, migrar um kiosk):
+linhas cujo id já existe são ignoradas, o que torna a importação idempotente para as
+linhas com id (reimportar um ficheiro com linhas sem id duplica-as). Linhas sem id só
+recebem um id novo no fim do ficheiro, depois de gravados todos os ids explícitos
+(um id atribuído antes podia ser o de uma linha de um lote seguinte, que seria então
+ignorada); até lá ficam em memória (dois inteiros por linha). Com `preserve_ids=False`
+todas as linhas recebem ids novos (juntar dados de outro site).
+
+Com `forward=True` as linhas importadas entram na outbox do Firestore na mesma
+transação, e o replicador envia-as em batches como os votos normais.
+"""
+import csv
+import gzip
+import io
+import json
+import time
+
+import firestore_outbox
+import migrations
+
+# Colunas obrigatórias (a ordem não importa, o cabeçalho é lido por nome)
+COLUMNS = ('id', 'grau_satisfacao', 'data', 'hora')
+
+# Nº máximo de erros de validação guardados no relatório
+MAX_ERRORS = 20
+
+
+class CsvImportError(ValueError):
+    """Ficheiro que não está no formato do export (cabeçalho em falta, não é CSV...)."""
+
+
+def open_text(fileobj):
+    """Ficheiro binário (CSV ou CSV.gz) -> texto UTF-8 pronto para o csv.reader."""
+    if not hasattr(fileobj, 'peek'):
+        fileobj = io.BufferedReader(fileobj)
+    if fileobj.peek(2)[:2] == b'\x1f\x8b':
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    # utf-8-sig: aceita o BOM que o Excel acrescenta ao gravar CSV
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def _codigos_grau(grau_labels):
+    """Texto do export (rótulo ou código) -> código do esquema compacto."""
+    codigos = dict(migrations.GRAU_CODES)
+    for grau, rotulo in grau_labels.items():
+        codigos[rotulo] = migrations.GRAU_CODES[grau]
+    codigos.update({texto.lower(): codigo for texto, codigo in list(codigos.items())})
+    return codigos
+
+
+class _ParserLinhas:
+    """Converte linhas do CSV em (id, ts, grau), com cache do início de cada dia."""
+
+    def __init__(self, header, grau_labels):
+        nomes = [h.strip().lower() for h in header]
+        em_falta = [c for c in COLUMNS if c not in nomes]
+        if em_falta:
+            raise CsvImportError(f'Cabeçalho inválido: faltam as colunas {", ".join(em_falta)}')
+        self._idx = [nomes.index(c) for c in COLUMNS]
+        self._largura = max(self._idx) + 1
+        self._codigos = _codigos_grau(grau_labels)
+        self._dias = {}
+
+    def parse(self, row):
+        if len(row) < self._largura:
+            raise ValueError('linha incompleta')
+        i_id, i_grau, i_data, i_hora = self._idx
+
+        grau_texto = row[i_grau].strip()
+        grau = self._codigos.get(grau_texto, self._codigos.get(grau_texto.lower()))
+        if grau is None:
+            raise ValueError(f'grau de satisfação inválido: {grau_texto!r}')
+
+        data = row[i_data].strip()
+        inicio_dia = self._dias.get(data)
+        if inicio_dia is None:
+            try:
+                inicio_dia = self._dias[data] = migrations.date_to_ts(data)
+            except ValueError:
+                raise ValueError(f'data inválida: {data!r}') from None
+
+        try:
+            h, m, s = (int(p) for p in row[i_hora].strip().split(':'))
+        except ValueError:
+            # HH:MM, texto, partes a mais: a mensagem do Python não diz nada ao utilizador
+            raise ValueError(f'hora inválida: {row[i_hora]!r}') from None
+        if not (0 <= h < 24 and 0 <= m < 60 and 0 <= s < 60):
+            raise ValueError(f'hora inválida: {row[i_hora]!r}')
+
+        texto_id = row[i_id].strip()
+        try:
+            feedback_id = int(texto_id) if texto_id else None
+        except ValueError:
+            raise ValueError(f'id inválido: {texto_id!r}') from None
+        if feedback_id is not None and feedback_id <= 0:
+            raise ValueError(f'id inválido: {texto_id!r}')
+        return feedback_id, inicio_dia + h * 3600 + m * 60 + s, grau
+
+
+def _payload(feedback_id, ts, grau, graus):
+    """Documento do Firestore no mesmo formato dos votos normais."""
+    quando = time.gmtime(ts)
+    data = time.strftime('%Y-%m-%d', quando)
+    hora = time.strftime('%H:%M:%S', quando)
+    return {
+        'grau_satisfacao': graus[grau],
+        'data': data,
+        'hora': hora,
+        'dia_semana': migrations._DIAS_SEMANA_W[int(time.strftime('%w', quando))],
+        'timestamp': f'{data}T{hora}',
+        'id': feedback_id,
+    }
+
+
+class _Importador:
+    def __init__(self, conn, preserve_ids, forward):
+        self.conn = conn
+        self.preserve_ids = preserve_ids
+        self.forward = forward
+        self._graus = {codigo: grau for grau, codigo in migrations.GRAU_CODES.items()}
+        self._sem_id = []  # (ts, grau) das linhas sem id, com preserve_ids
+
+    def gravar(self, lote):
+        """Grava um lote numa transação. Devolve (inseridas, ignoradas por id repetido).
+
+        Com `preserve_ids` as linhas sem id ficam para `lotes_sem_id()`.
+        """
+        if not self.preserve_ids:
+            return self._transacao(self._inserir_sem_id, [(ts, grau) for _, ts, grau in lote])
+        com_id = []
+        for feedback_id, ts, grau in lote:
+            if feedback_id is None:
+                self._sem_id.append((ts, grau))
+            else:
+                com_id.append((feedback_id, ts, grau))
+        return self._transacao(self._inserir_com_id, com_id)
+
+    def lotes_sem_id(self, chunk_size):
+        """Lotes (a passar a `gravar_sem_id`) das linhas sem id guardadas por `gravar()`."""
+        pendentes, self._sem_id = self._sem_id, []
+        return [pendentes[i:i + chunk_size] for i in range(0, len(pendentes), chunk_size)]
+
+    def gravar_sem_id(self, lote):
+        """Grava [(ts, grau)] com ids novos numa transação. Devolve (inseridas, 0)."""
+        return self._transacao(self._inserir_sem_id, lote)
+
+    def _transacao(self, inserir, lote):
+        if not lote:
+            return 0, 0
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            linhas = inserir(lote)
+            if self.forward and linhas:
+                firestore_outbox.enqueue(conn, [_payload(*linha, self._graus) for linha in linhas])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(linhas), len(lote) - len(linhas)
+
+    def _inserir_com_id(self, lote):
+        novos = {}
+        for feedback_id, ts, grau in lote:
+            novos.setdefault(feedback_id, (ts, grau))
+        # Ids já existentes (backup reimportado, ficheiros sobrepostos) são ignorados
+        existentes = self.conn.execute(
+            'SELECT id FROM feedback_rows WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(novos)),)
+        ).fetchall()
+        for row in existentes:
+            novos.pop(row[0], None)
+        linhas = [(feedback_id, ts, grau) for feedback_id, (ts, grau) in novos.items()]
+        self.conn.executemany('INSERT INTO feedback_rows (id, ts, grau) VALUES (?, ?, ?)', linhas)
+        return linhas
+
+    def _inserir_sem_id(self, lote):
+        # Ids atribuídos aqui (dentro da transação IMMEDIATE) para os conhecermos sem
+        # inserir linha a linha
+        proximo = self.conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM feedback_rows').fetchone()[0]
+        linhas = [(proximo + k, ts, grau) for k, (ts, grau) in enumerate(lote)]
+        self.conn.executemany('INSERT INTO feedback_rows (id, ts, grau) VALUES (?, ?, ?)', linhas)
+        return linhas
+
+
+def import_csv(conn, fileobj, grau_labels, chunk_size=5000, preserve_ids=True, forward=False,
+               progress=None):
+    """Importa o CSV de `fileobj` (binário, CSV ou CSV.gz) para feedback_rows.
+
+    `progress(relatorio)` é chamado após cada lote gravado. Devolve o relatório final
+    (linhas lidas, inseridas, ignoradas, rejeitadas, erros, linhas/segundo).
+    Levanta CsvImportError se o ficheiro não tiver o cabeçalho do export.
+    """
+    inicio = time.perf_counter()
+    relatorio = {
+        'rows': 0,
+        'inserted': 0,
+        'skipped': 0,
+        'rejected': 0,
+        'errors': [],
+        'batches': 0,
+        'forwarded': 0,
+        'seconds': 0.0,
+        'rowsPerSecond': None,
+    }
+
+    def atualizar_tempo():
+        relatorio['seconds'] = round(time.perf_counter() - inicio, 3)
+        if relatorio['seconds'] > 0:
+            relatorio['rowsPerSecond'] = round(relatorio['rows'] / relatorio['seconds'], 1)
+
+    texto = open_text(fileobj)
+    try:
+        reader = csv.reader(texto)
+        try:
+            header = next(reader)
+        except StopIteration:
+            raise CsvImportError('Ficheiro vazio') from None
+        except (UnicodeDecodeError, csv.Error, OSError) as e:
+            raise CsvImportError(f'Ficheiro ilegível: {e}') from None
+        parser = _ParserLinhas(header, grau_labels)
+        importador = _Importador(conn, preserve_ids, forward)
+
+        def gravar(lote, gravar_lote=importador.gravar):
+            inseridas, ignoradas = gravar_lote(lote)
+            relatorio['inserted'] += inseridas
+            relatorio['skipped'] += ignoradas
+            relatorio['batches'] += 1
+            if forward:
+                relatorio['forwarded'] += inseridas
+            atualizar_tempo()
+            if progress:
+                progress(relatorio)
+
+        lote = []
+        try:
+            for row in reader:
+                if not row:
+                    continue
+                relatorio['rows'] += 1
+                try:
+                    lote.append(parser.parse(row))
+                except ValueError as e:
+                    relatorio['rejected'] += 1
+                    if len(relatorio['errors']) < MAX_ERRORS:
+                        relatorio['errors'].append({'line': reader.line_num, 'error': str(e)})
+                    continue
+                if len(lote) >= chunk_size:
+                    gravar(lote)
+                    lote = []
+        except (UnicodeDecodeError, csv.Error, OSError, EOFError) as e:
+            # Ficheiro truncado/corrompido: os lotes anteriores ficam gravados
+            raise CsvImportError(f'Ficheiro ilegível perto da linha {reader.line_num}: {e}') from None
+        if lote:
+            gravar(lote)
+        # Linhas sem id (com preserve_ids): só depois de gravados todos os ids explícitos
+        for lote in importador.lotes_sem_id(chunk_size):
+            gravar(lote, importador.gravar_sem_id)
+    finally:
+        texto.detach()
+
+    atualizar_tempo()
+    return relatorio
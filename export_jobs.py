@@ -0,0 +1,297 @@
+"""
+Exportações em background (jobs) com XLSX em modo write-only.
+
+Um pedido cria o job e devolve logo o id; o ficheiro é gerado num thread do processo
+(fora do thread do pedido) e guardado em disco. O estado de cada job fica num ficheiro
+JSON ao lado do artefacto, por isso qualquer worker do gunicorn consegue responder
+ao polling e servir o download, e não apenas o que gerou o ficheiro.
+
+Os artefactos expiram ao fim de `ttl_seconds` e são apagados na limpeza seguinte.
+Cada job regista linhas/segundo e o pico de memória (RSS) do processo durante a geração.
+"""
+import csv
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+    'csv': ('text/csv; charset=utf-8', '.csv'),
+}
+
+HEADER = ['ID', 'Grau de Satisfação', 'Data', 'Hora', 'Dia da Semana']
+
+# Um job 'running' sem atualização há mais do que isto pertence a um processo que morreu
+STALE_AFTER_SECONDS = 300
+
+
+def _current_rss():
+    """RSS atual do processo em bytes (Linux); fallback para o pico via getrusage."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return None
+
+
+class ExportJobManager:
+    """Cria, executa e limpa jobs de exportação."""
+
+    def __init__(self, directory, connect, open_cursor, count_rows, grau_labels,
+                 ttl_seconds=3600, max_workers=1, fetch_size=1000, on_finish=None):
+        self.directory = directory
+        # on_finish(job): chamado quando um job termina, com sucesso ou não (métricas)
+        self._on_finish = on_finish
+        self._connect = connect
+        self._open_cursor = open_cursor
+        self._count_rows = count_rows
+        self._grau_labels = grau_labels
+        self.ttl_seconds = ttl_seconds
+        self.fetch_size = fetch_size
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix='export-job')
+        os.makedirs(self.directory, exist_ok=True)
+
+    # Estado em disco ----------------------------------------------------
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def artifact_path(self, job):
+        return os.path.join(self.directory, f"{job['id']}{FORMATS[job['format']][1]}")
+
+    def _write_state(self, job):
+        job['updatedAt'] = time.time()
+        tmp = self._state_path(job['id']) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp, self._state_path(job['id']))
+
+    def get(self, job_id):
+        """Estado do job, ou None se não existir / já expirou."""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        now = time.time()
+        if job.get('expiresAt') and job['expiresAt'] <= now:
+            self._delete(job)
+            return None
+        if job['status'] == 'running' and now - job.get('updatedAt', now) > STALE_AFTER_SECONDS:
+            job['status'] = 'failed'
+            job['error'] = 'Job interrompido (processo terminou durante a exportação)'
+        return job
+
+    def _delete(self, job):
+        for path in (self.artifact_path(job), self._state_path(job['id'])):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge_expired(self):
+        """Apaga artefactos e estados expirados. Devolve quantos jobs foram removidos."""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            stale = job['status'] in ('queued', 'running') and now - job.get('updatedAt', now) > self.ttl_seconds
+            if (job.get('expiresAt') and job['expiresAt'] <= now) or stale:
+                self._delete(job)
+                removed += 1
+        return removed
+
+    # Execução ----------------------------------------------------------
+
+    def submit(self, fmt, data_inicio=None, data_fim=None):
+        if fmt not in FORMATS:
+            raise ValueError(f'Formato inválido: {fmt} (use {", ".join(FORMATS)})')
+        self.purge_expired()
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'format': fmt,
+            'status': 'queued',
+            'params': {'data_inicio': data_inicio, 'data_fim': data_fim},
+            'createdAt': time.time(),
+            'startedAt': None,
+            'finishedAt': None,
+            'expiresAt': None,
+            'rows': 0,
+            'totalRows': None,
+            'progress': 0.0,
+            'rowsPerSecond': None,
+            'elapsedSeconds': None,
+            'rssStartBytes': None,
+            'peakRssBytes': None,
+            'rssDeltaBytes': None,
+            'sizeBytes': None,
+            'error': None,
+            'pid': os.getpid(),
+        }
+        self._write_state(job)
+        # O thread trabalha sobre uma cópia; a resposta ao pedido é o estado inicial
+        self._executor.submit(self._run, dict(job))
+        return job
+
+    def _run(self, job):
+        job['status'] = 'running'
+        job['startedAt'] = time.time()
+        job['rssStartBytes'] = job['peakRssBytes'] = _current_rss()
+        params = job['params']
+        path = self.artifact_path(job)
+        tmp_path = path + '.part'
+
+        conn = None
+        cursor = None
+        writer = None
+        try:
+            # Dentro do try: um pool esgotado também marca o job como 'failed'
+            conn = self._connect()
+            job['totalRows'] = self._count_rows(conn, params['data_inicio'], params['data_fim'])
+            self._write_state(job)
+
+            cursor = self._open_cursor(conn, params['data_inicio'], params['data_fim'])
+            writer = XlsxWriter(tmp_path) if job['format'] == 'xlsx' else CsvWriter(tmp_path)
+            last_state_write = time.monotonic()
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    writer.append([
+                        row['id'],
+                        self._grau_labels.get(row['grau_satisfacao'], row['grau_satisfacao']),
+                        row['data'],
+                        row['hora'],
+                        row['dia_semana'],
+                    ])
+                job['rows'] += len(rows)
+                self._sample(job)
+
+                # Atualizar o progresso em disco no máximo 2x por segundo
+                if time.monotonic() - last_state_write >= 0.5:
+                    self._write_state(job)
+                    last_state_write = time.monotonic()
+
+            writer.close()
+            writer = None
+            self._sample(job)
+            os.replace(tmp_path, path)
+
+            job['status'] = 'done'
+            job['progress'] = 1.0
+            job['sizeBytes'] = os.path.getsize(path)
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            if writer is not None:
+                try:
+                    writer.discard()
+                except Exception:
+                    pass
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
+        job['finishedAt'] = time.time()
+        job['expiresAt'] = job['finishedAt'] + self.ttl_seconds
+        job['elapsedSeconds'] = round(job['finishedAt'] - job['startedAt'], 3)
+        if job['elapsedSeconds'] > 0:
+            job['rowsPerSecond'] = round(job['rows'] / job['elapsedSeconds'], 1)
+        self._write_state(job)
+        if self._on_finish:
+            self._on_finish(job)
+
+    def _sample(self, job):
+        rss = _current_rss()
+        if rss is not None:
+            job['peakRssBytes'] = max(job['peakRssBytes'] or 0, rss)
+            if job['rssStartBytes'] is not None:
+                job['rssDeltaBytes'] = job['peakRssBytes'] - job['rssStartBytes']
+        total = job['totalRows']
+        job['progress'] = round(min(1.0, job['rows'] / total), 4) if total else 0.0
+
+
+class XlsxWriter:
+    """Workbook openpyxl em modo write-only: as linhas vão para disco, não ficam em memória."""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill
+
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet('Feedback')
+
+        # Larguras têm de ser definidas antes da primeira linha
+        for col, width in zip('ABCDE', (8, 20, 12, 12, 18)):
+            self.ws.column_dimensions[col].width = width
+
+        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF")
+        header = []
+        for title in HEADER:
+            cell = WriteOnlyCell(self.ws, value=title)
+            cell.fill = header_fill
+            cell.font = header_font
+            header.append(cell)
+        self.ws.append(header)
+
+    def append(self, values):
+        self.ws.append(values)
+
+    def close(self):
+        self.wb.save(self.path)
+
+    def discard(self):
+        """Abandona o workbook sem o gravar (fecha e apaga o ficheiro temporário da folha)."""
+        rows = getattr(self.ws, '_rows', None)
+        if rows is not None:
+            rows.close()
+        writer = getattr(self.ws, '_writer', None)
+        if writer is not None:
+            writer.close()
+            writer.cleanup()
+
+
+class CsvWriter:
+    """CSV no mesmo formato do /api/admin/export/csv-plain."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['id', 'grau_satisfacao', 'data', 'hora', 'dia_semana'])
+
+    def append(self, values):
+        self._writer.writerow(values)
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
@@ -0,0 +1,217 @@
+"""
+Outbox de replicação SQLite -> Firestore.
+
+O pedido de voto só escreve no SQLite (feedback + linha na outbox, na mesma transação).
+Um thread em background (um por processo) drena a outbox em batches do Firestore,
+com retry e backoff exponencial. Como a outbox vive no próprio ficheiro SQLite,
+os votos pendentes sobrevivem a reinícios do processo.
+
+Vários workers do gunicorn podem correr o replicador ao mesmo tempo: cada um
+"reserva" as linhas que vai enviar (lease) dentro de uma transação IMMEDIATE,
+e o `set()` por id de documento é idempotente se uma linha for reenviada.
+"""
+import json
+import random
+import threading
+import time
+
+OUTBOX_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS firestore_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        feedback_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        lease_until REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_firestore_outbox_due ON firestore_outbox(next_attempt_at)',
+]
+
+# Limite do Firestore para escritas num único batch
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def enqueue(conn, registos):
+    """Acrescenta registos (dicts com 'id') à outbox.
+
+    Não faz commit: deve ser chamado dentro da mesma transação que grava o feedback.
+    """
+    now = time.time()
+    conn.executemany(
+        'INSERT INTO firestore_outbox (feedback_id, payload, created_at) VALUES (?, ?, ?)',
+        [(r['id'], json.dumps(r, ensure_ascii=False), now) for r in registos]
+    )
+
+
+class FirestoreReplicator:
+    """Drena a outbox para o Firestore em background."""
+
+    def __init__(self, connect, get_client, collection='feedback', batch_size=FIRESTORE_BATCH_LIMIT,
+                 base_delay=1.0, max_delay=300.0, lease_seconds=60.0, idle_interval=5.0, on_commit=None):
+        self._connect = connect
+        # on_commit(segundos, documentos, erro): chamado após cada batch.commit() (métricas)
+        self._on_commit = on_commit
+        self._get_client = get_client
+        self.collection = collection
+        self.batch_size = max(1, min(int(batch_size), FIRESTORE_BATCH_LIMIT))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.idle_interval = idle_interval
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.synced_total = 0
+        self.failed_batches = 0
+        self.last_success_at = None
+        self.last_error = None
+        self.last_error_at = None
+
+    # Ciclo de vida -----------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='firestore-replicator', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def notify(self):
+        """Acorda o replicador (chamado após gravar novos votos)."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                enviados = self.drain_once()
+            except Exception as e:
+                enviados = 0
+                self._record_error(e)
+                print(f"⚠ Aviso: Replicação Firestore falhou: {e}")
+
+            # Batch cheio: provavelmente há mais pendentes, continuar já.
+            if enviados >= self.batch_size:
+                continue
+            self._wakeup.wait(self.idle_interval)
+            self._wakeup.clear()
+
+    # Drenagem ----------------------------------------------------------
+
+    def _claim(self, conn, now):
+        """Reserva (lease) o próximo lote de linhas vencidas."""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('''
+                SELECT id, feedback_id, payload, attempts
+                FROM firestore_outbox
+                WHERE next_attempt_at <= ? AND lease_until <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (now, now, self.batch_size)).fetchall()
+            if rows:
+                conn.executemany(
+                    'UPDATE firestore_outbox SET lease_until = ? WHERE id = ?',
+                    [(now + self.lease_seconds, r[0]) for r in rows]
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain_once(self):
+        """Envia um lote para o Firestore. Devolve o número de documentos replicados."""
+        client = self._get_client()
+        if client is None:
+            return 0
+
+        conn = self._connect()
+        try:
+            now = time.time()
+            rows = self._claim(conn, now)
+            if not rows:
+                return 0
+
+            inicio = time.perf_counter()
+            try:
+                batch = client.batch()
+                for _, feedback_id, payload, _ in rows:
+                    doc = client.collection(self.collection).document(f'feedback_{feedback_id}')
+                    batch.set(doc, json.loads(payload))
+                batch.commit()
+            except Exception as e:
+                if self._on_commit:
+                    self._on_commit(time.perf_counter() - inicio, len(rows), e)
+                self._record_error(e)
+                self.failed_batches += 1
+                now = time.time()
+                with conn:
+                    conn.executemany('''
+                        UPDATE firestore_outbox
+                        SET attempts = attempts + 1, next_attempt_at = ?, lease_until = 0, last_error = ?
+                        WHERE id = ?
+                    ''', [(now + self._backoff(attempts), str(e)[:500], row_id)
+                          for row_id, _, _, attempts in rows])
+                print(f"⚠ Aviso: Erro ao replicar {len(rows)} feedback(s) no Firebase: {e}")
+                return 0
+
+            if self._on_commit:
+                self._on_commit(time.perf_counter() - inicio, len(rows), None)
+
+            with conn:
+                conn.executemany('DELETE FROM firestore_outbox WHERE id = ?', [(r[0],) for r in rows])
+
+            self.synced_total += len(rows)
+            self.last_success_at = time.time()
+            print(f"✓ {len(rows)} feedback(s) sincronizado(s) com Firebase")
+            return len(rows)
+        finally:
+            conn.close()
+
+    def _record_error(self, error):
+        self.last_error = str(error)
+        self.last_error_at = time.time()
+
+    # Observabilidade ---------------------------------------------------
+
+    def stats(self, conn):
+        """Estado da replicação: profundidade da fila e atraso (lag) do item mais antigo."""
+        row = conn.execute('''
+            SELECT COUNT(*), MIN(feedback_id), MIN(created_at), MAX(attempts)
+            FROM firestore_outbox
+        ''').fetchone()
+        depth, oldest_id, oldest_created, max_attempts = row[0], row[1], row[2], row[3]
+        return {
+            'running': self.running,
+            'queueDepth': depth,
+            'oldestUnsyncedId': oldest_id,
+            'lagSeconds': round(time.time() - oldest_created, 3) if oldest_created else 0,
+            'maxAttempts': max_attempts or 0,
+            'syncedTotal': self.synced_total,
+            'failedBatches': self.failed_batches,
+            'lastSuccessAt': self.last_success_at,
+            'lastError': self.last_error,
+            'lastErrorAt': self.last_error_at,
+        }
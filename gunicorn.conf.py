@@ -0,0 +1,85 @@
+"""
+Configuração do gunicorn (Dockerfile / Cloud Run).
+
+O restauro do snapshot mais recente (base de dados vazia, ver maintenance.py) e as
+migrações do SQLite correm uma vez no master, antes de arrancar os workers: cada worker
+encontra FEEDBACK_SCHEMA_VERSION no ambiente e salta o init_db(). O master fixa também
+DATABASE_PATH para os workers usarem exatamente a base de dados migrada.
+Depois de um reload (HUP) com migrações novas, a versão deixa de coincidir e os workers
+voltam a aplicá-las (migrations.migrate() é seguro com vários processos).
+O master fixa ainda METRICS_DIR (por omissão uma pasta própria, `<tmp>/feedback_metrics_<pid>`)
+e esvazia-a, para o /metrics não somar snapshots de corridas anteriores ou de outros serviços.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Orçamento de threads por worker (o único sítio onde a soma está documentada):
+#   SSE_MAX_STREAMS (8)                    streams /api/stream/summary, um thread cada até 240 s
+# + ADMISSION_MAX_CONCURRENT (8)           votos em curso
+# + ADMISSION_MAX_QUEUE (8)                votos à espera de admissão (também ocupam um thread)
+# = 24 de 32; os 8 restantes ficam para o dashboard, admin, exportações e health checks.
+# O master avisa no arranque se a soma não deixar threads livres.
+threads = int(os.environ.get('GUNICORN_THREADS', '32'))
+MIN_FREE_THREADS = 4
+
+
+def _threads_reservados():
+    """Threads que os streams SSE e o controlo de admissão podem ocupar num worker."""
+    reservados = int(os.environ.get('SSE_MAX_STREAMS', '8'))
+    if os.environ.get('ADMISSION', '1') not in ['0', 'false', 'False', '']:
+        reservados += int(os.environ.get('ADMISSION_MAX_CONCURRENT', '8'))
+        reservados += int(os.environ.get('ADMISSION_MAX_QUEUE', '8'))
+    return reservados
+timeout = 0
+
+
+def on_starting(server):
+    import maintenance
+    import metrics
+    import migrations
+
+    inicio = time.perf_counter()
+    if os.environ.get('VERCEL') or os.environ.get('K_SERVICE'):
+        os.environ.setdefault('DATABASE_PATH', '/tmp/feedback.db')
+    path = os.environ.setdefault('DATABASE_PATH', 'feedback.db')
+
+    if os.environ.get('RESTORE_ON_START', '1') not in ['0', 'false', 'False', '']:
+        backup_dir = os.environ.get('BACKUP_DIR') or maintenance.default_directory(path)
+        restauro = maintenance.restore_latest(backup_dir, path)
+        if restauro:
+            print(f"✓ Base de dados restaurada de {restauro['snapshot']} em {restauro['seconds']}s")
+
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        applied = migrations.migrate(conn)
+    finally:
+        conn.close()
+    for version, description in applied:
+        print(f"✓ Migração {version} aplicada: {description}")
+
+    os.environ['FEEDBACK_SCHEMA_VERSION'] = str(migrations.latest_version())
+
+    metrics_dir = os.environ.setdefault(
+        'METRICS_DIR', os.path.join(tempfile.gettempdir(), f'feedback_metrics_{os.getpid()}'))
+    apagados = metrics.clear_directory(metrics_dir)
+    if apagados:
+        print(f"✓ {apagados} snapshot(s) de métricas antigos apagados de {metrics_dir}")
+
+    reservados = _threads_reservados()
+    if reservados > threads - MIN_FREE_THREADS:
+        print(f"⚠ Aviso: SSE_MAX_STREAMS + ADMISSION_MAX_CONCURRENT + ADMISSION_MAX_QUEUE = {reservados} "
+              f"deixa menos de {MIN_FREE_THREADS} dos {threads} threads por worker para os restantes pedidos")
+    print(f"✓ Esquema SQLite pronto em {(time.perf_counter() - inicio) * 1000:.0f} ms ({path})")
+
+
+def on_exit(server):
+    # Só a pasta por omissão é deste master; uma METRICS_DIR explícita fica para o próximo arranque
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir == os.path.join(tempfile.gettempdir(), f'feedback_metrics_{os.getpid()}'):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -0,0 +1,225 @@
+"""
+Hidratação do SQLite local a partir da coleção `feedback` do Firestore.
+
+Em Cloud Run/Vercel a base de dados fica em /tmp e cada instância nova começa vazia,
+enquanto o histórico completo está no Firestore. Sem hidratação as estatísticas ficam
+erradas e os ids recomeçam em 1, sobrescrevendo os documentos `feedback_{id}`.
+
+A coleção é lida em paralelo: os ids dos documentos (`feedback_<id>`) são divididos
+pelo primeiro dígito em até 9 intervalos de nomes, e cada thread lê o seu intervalo em
+páginas (`page_size`) ordenadas pelo nome do documento. As páginas seguem por uma fila
+limitada para um único escritor, que as grava com `INSERT OR IGNORE` em lotes (uma
+transação IMMEDIATE por página), por isso a hidratação é idempotente e pode correr com
+votos já gravados. Como os ids originais são preservados, o próximo voto continua a
+sequência (INTEGER PRIMARY KEY usa MAX(id) + 1).
+
+Sem `force`, a coleção só é lida quando o SQLite está vazio, tem menos votos do que o
+Firestore (contagem por agregação, sem ler os documentos) ou o maior `id` do Firestore é
+superior ao local (um voto local ainda por replicar não esconde um voto remoto em falta). Documentos que não entram no
+SQLite (rejeitados, nomes fora do padrão) ficam registados em `app_meta.hydrate_gap`
+para não tornarem a base de dados "desatualizada" em cada arranque.
+"""
+import queue
+import threading
+import time
+
+import csv_import
+
+# Intervalos de nomes de documentos lidos em paralelo: 'feedback_1' <= nome < 'feedback_2', ...
+_PREFIXO = 'feedback_'
+_INTERVALOS = [(f'{_PREFIXO}{d}', f'{_PREFIXO}{d + 1}' if d < 9 else f'{_PREFIXO}:') for d in range(1, 10)]
+
+MAX_ERRORS = 20
+
+
+def _contar_remoto(colecao):
+    resultado = colecao.count().get()
+    # get() devolve [[AggregationResult]]
+    return int(resultado[0][0].value)
+
+
+def _max_id_remoto(colecao):
+    docs = colecao.order_by('id', direction='DESCENDING').limit(1).get()
+    return int((docs[0].to_dict() or {}).get('id') or 0) if docs else 0
+
+
+def _ler_intervalo(colecao, inicio, fim, page_size, saida, parar):
+    """Lê os documentos com inicio <= nome < fim, página a página, para a fila `saida`."""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        colecao
+        .where(filter=FieldFilter('__name__', '>=', colecao.document(inicio)))
+        .where(filter=FieldFilter('__name__', '<', colecao.document(fim)))
+        .order_by('__name__')
+        .limit(page_size)
+    )
+    ultimo = None
+    while not parar.is_set():
+        pagina = (query.start_after(ultimo) if ultimo is not None else query).get()
+        if not pagina:
+            return
+        saida.put([(doc.id, doc.to_dict() or {}) for doc in pagina])
+        if len(pagina) < page_size:
+            return
+        ultimo = pagina[-1]
+
+
+class _Conversor:
+    """Documento do Firestore -> (id, ts, grau) do esquema compacto."""
+
+    def __init__(self, grau_labels):
+        self._parser = csv_import._ParserLinhas(csv_import.COLUMNS, grau_labels)
+
+    def linha(self, doc_id, dados):
+        texto_id = doc_id[len(_PREFIXO):] if doc_id.startswith(_PREFIXO) else ''
+        if not texto_id.isdigit():
+            texto_id = str(dados.get('id') or '')
+        if not texto_id:
+            raise ValueError('documento sem id')
+        return self._parser.parse([
+            texto_id,
+            str(dados.get('grau_satisfacao', '')),
+            str(dados.get('data', '')),
+            str(dados.get('hora', '')),
+        ])
+
+
+def _diferenca_conhecida(conn):
+    row = conn.execute("SELECT value FROM app_meta WHERE key = 'hydrate_gap'").fetchone()
+    return row[0] if row else 0
+
+
+def local_state(conn):
+    row = conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM feedback_rows').fetchone()
+    return row[0], row[1]
+
+
+def hydrate(conn, client, grau_labels, collection='feedback', page_size=1000, parallelism=4, force=False,
+            progress=None):
+    """Copia a coleção do Firestore para feedback_rows (ids preservados). Devolve o relatório.
+
+    `progress(relatorio)` é chamado após cada página gravada.
+    """
+    inicio = time.perf_counter()
+    colecao = client.collection(collection)
+    linhas_locais, max_id_antes = local_state(conn)
+    relatorio = {
+        'hydrated': False,
+        'reason': None,
+        'localRowsBefore': linhas_locais,
+        'remoteRows': None,
+        'remoteMaxId': None,
+        'rows': 0,
+        'inserted': 0,
+        'skipped': 0,
+        'rejected': 0,
+        'errors': [],
+        'pages': 0,
+        'parallelism': 0,
+        'maxIdBefore': max_id_antes,
+        'maxId': max_id_antes,
+        'seconds': 0.0,
+        'rowsPerSecond': None,
+    }
+
+    def atualizar_tempo():
+        relatorio['seconds'] = round(time.perf_counter() - inicio, 3)
+        if relatorio['seconds'] > 0:
+            relatorio['rowsPerSecond'] = round(relatorio['rows'] / relatorio['seconds'], 1)
+
+    relatorio['remoteRows'] = _contar_remoto(colecao)
+    if force:
+        relatorio['reason'] = 'force'
+    else:
+        relatorio['remoteMaxId'] = _max_id_remoto(colecao)
+        if (linhas_locais and linhas_locais + _diferenca_conhecida(conn) >= relatorio['remoteRows']
+                and max_id_antes >= relatorio['remoteMaxId']):
+            relatorio['reason'] = 'up-to-date'
+            atualizar_tempo()
+            return relatorio
+        relatorio['reason'] = 'empty' if linhas_locais == 0 else 'stale'
+
+    # Leitores em paralelo (um intervalo de nomes de cada vez), escritor único nesta thread
+    parallelism = max(1, min(int(parallelism), len(_INTERVALOS)))
+    relatorio['parallelism'] = parallelism
+    paginas = queue.Queue(maxsize=parallelism * 2)
+    intervalos = queue.SimpleQueue()
+    for intervalo in _INTERVALOS:
+        intervalos.put(intervalo)
+    parar = threading.Event()
+    falhas = []
+
+    def leitor():
+        try:
+            while not parar.is_set():
+                try:
+                    inicio_nome, fim_nome = intervalos.get_nowait()
+                except queue.Empty:
+                    return
+                _ler_intervalo(colecao, inicio_nome, fim_nome, page_size, paginas, parar)
+        except Exception as e:
+            falhas.append(e)
+            parar.set()
+        finally:
+            paginas.put(None)
+
+    threads = [threading.Thread(target=leitor, name=f'hydrate-{i}', daemon=True) for i in range(parallelism)]
+    for t in threads:
+        t.start()
+
+    conversor = _Conversor(grau_labels)
+    ativos = parallelism
+    try:
+        while ativos:
+            pagina = paginas.get()
+            if pagina is None:
+                ativos -= 1
+                continue
+            lote = []
+            for doc_id, dados in pagina:
+                relatorio['rows'] += 1
+                try:
+                    lote.append(conversor.linha(doc_id, dados))
+                except ValueError as e:
+                    relatorio['rejected'] += 1
+                    if len(relatorio['errors']) < MAX_ERRORS:
+                        relatorio['errors'].append({'doc': doc_id, 'error': str(e)})
+            if lote:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # rowcount soma as linhas inseridas (as ignoradas e as dos triggers não contam)
+                    inseridas = conn.executemany(
+                        'INSERT OR IGNORE INTO feedback_rows (id, ts, grau) VALUES (?, ?, ?)', lote
+                    ).rowcount
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                relatorio['inserted'] += inseridas
+                relatorio['skipped'] += len(lote) - inseridas
+            relatorio['pages'] += 1
+            atualizar_tempo()
+            if progress:
+                progress(relatorio)
+    finally:
+        parar.set()
+        # Desbloquear leitores parados no put() da fila cheia
+        while any(t.is_alive() for t in threads):
+            try:
+                paginas.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    if falhas:
+        raise falhas[0]
+
+    linhas_depois, relatorio['maxId'] = local_state(conn)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO app_meta (key, value) VALUES ('hydrate_gap', ?)",
+            (max(0, relatorio['remoteRows'] - linhas_depois),)
+        )
+    relatorio['hydrated'] = True
+    atualizar_tempo()
+    return relatorio
@@ -0,0 +1,216 @@
+"""
+Gravação dos votos, com agrupamento opcional de commits (group commit).
+
+`insert_votes()` grava votos (e, se pedido, a outbox do Firestore) numa transação já
+aberta. É usada diretamente no modo normal (uma transação por pedido HTTP) e pelo
+`GroupCommitWriter` no modo agrupado.
+
+No modo agrupado (INGEST_MODE=group) cada processo tem um único escritor: os pedidos
+entregam os votos numa fila e esperam pelo resultado. O escritor junta o que chegou
+durante a janela (`max_wait`, alguns ms) ou até `max_batch` votos e grava tudo numa
+só transação IMMEDIATE, por isso em picos (todos os kiosks ao mesmo tempo) há um
+commit (e um fsync) por lote em vez de um por voto, e as threads do worker não
+disputam o lock de escrita do SQLite entre si. Cada pedido continua a receber os seus
+ids de forma síncrona.
+
+Se o lote falhar, cada pedido é repetido na sua própria transação, para que o erro de
+um não afete os outros.
+
+Cada pedido tem um prazo (`timeout`) para sair da fila. O escritor recusa com
+`IngestTimeout` os pedidos cujo prazo passou *antes* de os gravar, e um pedido que entra
+num lote espera pelo resultado sem limite (o escritor resolve sempre o futuro). Assim um
+timeout significa sempre "não foi gravado" e o kiosk pode reenviar o voto sem o duplicar.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import firestore_outbox
+
+
+class IngestTimeout(Exception):
+    """O pedido ficou na fila do escritor para além do prazo e não foi gravado."""
+
+
+def insert_votes(conn, votos, replicate=False):
+    """Grava `votos` ([(ts, código do grau, payload, chave do kiosk ou None)]) na transação aberta em `conn`.
+
+    O id atribuído é escrito em payload['id']; com `replicate` os payloads entram na outbox
+    do Firestore na mesma transação. Um voto cuja chave já existe em feedback_client_keys
+    (reenvio de um voto já gravado) não é gravado outra vez e fica com o id existente.
+    Não faz commit. Devolve a lista de ids.
+    """
+    ids = []
+    novos = []
+    for ts, grau, payload, chave in votos:
+        if chave is not None:
+            existente = conn.execute(
+                'SELECT feedback_id FROM feedback_client_keys WHERE key = ?', (chave,)
+            ).fetchone()
+            if existente is not None:
+                ids.append(existente[0])
+                continue
+        feedback_id = conn.execute(
+            'INSERT INTO feedback_rows (ts, grau) VALUES (?, ?)', (ts, grau)
+        ).lastrowid
+        if chave is not None:
+            conn.execute(
+                'INSERT INTO feedback_client_keys (key, feedback_id, created_at) VALUES (?, ?, ?)',
+                (chave, feedback_id, time.time())
+            )
+        payload['id'] = feedback_id
+        ids.append(feedback_id)
+        novos.append(payload)
+    if replicate and novos:
+        firestore_outbox.enqueue(conn, novos)
+    return ids
+
+
+class GroupCommitWriter:
+    """Escritor único por processo que agrupa os votos concorrentes em transações partilhadas."""
+
+    def __init__(self, connect, max_batch=256, max_wait=0.002, timeout=30.0, on_commit=None):
+        self._connect = connect
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        self.timeout = timeout
+        # on_commit(votos, pedidos, segundos, erro): chamado após cada lote (métricas)
+        self._on_commit = on_commit
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_seen = 0
+        self.fallbacks = 0
+        self.expired = 0
+        self.last_error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, votos, replicate=False):
+        """Entrega os votos ao escritor e espera pelo commit. Devolve os ids (pela mesma ordem).
+
+        IngestTimeout se o escritor não pegou no pedido dentro de `timeout` segundos (nesse
+        caso nada foi gravado).
+        """
+        if not votos:
+            return []
+        self.start()
+        futuro = Future()
+        prazo = time.monotonic() + self.timeout if self.timeout is not None else None
+        self._queue.put((votos, replicate, futuro, prazo))
+        # Sem timeout aqui: o escritor resolve sempre o futuro (gravado, erro ou prazo
+        # expirado), e desistir a meio deixaria um voto gravado com resposta de erro
+        return futuro.result()
+
+    # Escritor ------------------------------------------------------------------
+
+    def _recolher(self):
+        """Bloqueia até haver um pedido e junta os que chegarem durante a janela."""
+        pedidos = [self._queue.get()]
+        total = len(pedidos[0][0])
+        limite = time.perf_counter() + self.max_wait
+        while total < self.max_batch:
+            restante = limite - time.perf_counter()
+            try:
+                pedido = self._queue.get(timeout=restante) if restante > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pedidos.append(pedido)
+            total += len(pedido[0])
+        return pedidos, total
+
+    def _expirados(self, pedidos):
+        """Recusa (sem gravar) os pedidos cujo prazo já passou. Devolve os restantes."""
+        agora = time.monotonic()
+        validos = []
+        for pedido in pedidos:
+            prazo = pedido[3]
+            if prazo is not None and agora > prazo:
+                self.expired += 1
+                pedido[2].set_exception(IngestTimeout(
+                    f'Voto não gravado: mais de {self.timeout:g}s na fila do escritor'
+                ))
+            else:
+                validos.append(pedido)
+        return validos
+
+    def _run(self):
+        while True:
+            pedidos, _ = self._recolher()
+            pedidos = [p for p in pedidos if p[2].set_running_or_notify_cancel()]
+            pedidos = self._expirados(pedidos)
+            if not pedidos:
+                continue
+            total = sum(len(p[0]) for p in pedidos)
+            inicio = time.perf_counter()
+            erro = None
+            try:
+                self._gravar_lote(pedidos)
+            except Exception as e:
+                erro = e
+                self.last_error = str(e)
+                self.fallbacks += 1
+                self._gravar_um_a_um(pedidos)
+            segundos = time.perf_counter() - inicio
+
+            self.batches += 1
+            self.rows += total
+            self.max_batch_seen = max(self.max_batch_seen, total)
+            if self._on_commit:
+                try:
+                    self._on_commit(total, len(pedidos), segundos, erro)
+                except Exception:
+                    pass
+
+    def _gravar_lote(self, pedidos):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                resultados = [insert_votes(conn, votos, replicate) for votos, replicate, _, _ in pedidos]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.close()
+        for (_, _, futuro, _), ids in zip(pedidos, resultados):
+            futuro.set_result(ids)
+
+    def _gravar_um_a_um(self, pedidos):
+        for votos, replicate, futuro, _ in pedidos:
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        ids = insert_votes(conn, votos, replicate)
+                finally:
+                    conn.close()
+            except Exception as e:
+                futuro.set_exception(e)
+            else:
+                futuro.set_result(ids)
+
+    def stats(self):
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'rows': self.rows,
+            'avgBatch': round(self.rows / self.batches, 2) if self.batches else None,
+            'maxBatch': self.max_batch_seen,
+            'maxWaitMs': self.max_wait * 1000,
+            'fallbacks': self.fallbacks,
+            'expired': self.expired,
+            'timeoutSeconds': self.timeout,
+            'lastError': self.last_error,
+        }
@@ -0,0 +1,86 @@
+"""
+JSON provider da aplicação (jsonify, request.get_json, respostas em cache).
+
+`JSON_BACKEND` escolhe a implementação:
+
+- `orjson`: serialização em C diretamente para bytes (sem passar por str), várias
+  vezes mais rápida do que o módulo json nas páginas grandes do histórico e nas
+  estatísticas. O texto sai em UTF-8 (sem escapes `\\uXXXX`) e sem ordenar as chaves;
+- `json`: o provider por omissão do Flask (módulo json da biblioteca padrão);
+- `auto` (omissão): orjson se estiver instalado, senão json.
+
+Os tipos que o orjson não serializa da mesma forma que o Flask (datas, Decimal, objetos
+com `__html__`) passam pelo `default` do Flask, e um valor que o orjson recuse (ex.:
+inteiros acima de 64 bits) é serializado pelo módulo json, por isso o resultado é
+sempre JSON equivalente ao do provider do Flask.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+BACKENDS = ('auto', 'orjson', 'json')
+
+
+def orjson_available():
+    import importlib.util
+    return importlib.util.find_spec('orjson') is not None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider com o orjson nos caminhos quentes (dumps, loads e response)."""
+
+    backend = 'orjson'
+    # A ordem das chaves não importa aos clientes e os ETags vêm da versão dos dados
+    sort_keys = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+
+        self._orjson = orjson
+        self._opcoes = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _bytes(self, obj, indent=False):
+        opcoes = self._opcoes
+        if self.sort_keys:
+            opcoes |= self._orjson.OPT_SORT_KEYS
+        if indent:
+            opcoes |= self._orjson.OPT_INDENT_2
+        return self._orjson.dumps(obj, default=self.default, option=opcoes)
+
+    def dumps(self, obj, **kwargs):
+        # Argumentos do módulo json (indent, separators, cls...) ficam com o provider do Flask
+        if not kwargs:
+            try:
+                return self._bytes(obj).decode('utf-8')
+            except self._orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            corpo = self._bytes(obj, indent=indent) + b'\n'
+        except self._orjson.JSONEncodeError:
+            return super().response(obj)
+        return self._app.response_class(corpo, mimetype=self.mimetype)
+
+
+class StdlibProvider(DefaultJSONProvider):
+    backend = 'json'
+
+
+def install(app, backend='auto'):
+    """Instala o provider escolhido em `app` (ValueError se `backend` não existir). Devolve o nome."""
+    if backend not in BACKENDS:
+        raise ValueError(f"JSON_BACKEND inválido: {backend} (use {', '.join(BACKENDS)})")
+    if backend == 'auto':
+        backend = 'orjson' if orjson_available() else 'json'
+    provider_class = OrjsonProvider if backend == 'orjson' else StdlibProvider
+    app.json_provider_class = provider_class
+    app.json = provider_class(app)
+    return backend
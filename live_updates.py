@@ -0,0 +1,122 @@
+"""
+Deteção de alterações para o stream SSE (`/api/stream/summary`).
+
+Cada processo tem um único thread que lê `app_meta.data_version` a cada `interval`
+segundos enquanto houver clientes ligados. Como a versão é incrementada por triggers
+no SQLite, o thread deteta votos gravados por qualquer worker do gunicorn, e o custo
+é uma leitura por intervalo por processo, independentemente do número de ecrãs.
+
+Os streams ficam bloqueados numa Condition até a versão mudar, por isso uma ligação
+parada não consome CPU nem conexões SQLite.
+"""
+import threading
+import time
+
+
+class VersionWatcher:
+    """Observa a versão dos dados e acorda os streams quando ela muda."""
+
+    def __init__(self, read_version, interval=0.5, on_change=None):
+        self._read_version = read_version
+        self.interval = interval
+        self._on_change = on_change
+        self._cond = threading.Condition()
+        self._poke = threading.Event()
+        self._version = None
+        self._subscribers = 0
+        self._thread = None
+        self.polls = 0
+        self.changes = 0
+        self.last_error = None
+
+    # Subscrição -------------------------------------------------------
+
+    def subscribe(self, max_subscribers=None):
+        """Regista um stream. Devolve False se o limite de streams foi atingido."""
+        with self._cond:
+            if max_subscribers is not None and self._subscribers >= max_subscribers:
+                return False
+            self._subscribers += 1
+            self._ensure_thread()
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def poke(self):
+        """Pede uma verificação imediata (ex.: após um voto gravado neste processo)."""
+        self._poke.set()
+
+    # Espera -----------------------------------------------------------
+
+    def current(self):
+        with self._cond:
+            if self._version is None:
+                self._version = self._read_version()
+            return self._version
+
+    def wait_for_change(self, last_version, timeout):
+        """Bloqueia até a versão ser diferente de `last_version` ou até `timeout`.
+
+        Devolve a nova versão, ou None se nada mudou.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._version == last_version or self._version is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._version
+
+    # Thread de polling --------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='sse-version-watcher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._subscribers == 0:
+                    # Sem clientes: o thread termina e volta a arrancar no próximo subscribe()
+                    self._thread = None
+                    return
+            try:
+                version = self._read_version()
+                self.polls += 1
+                self.last_error = None
+            except Exception as e:
+                version = None
+                self.last_error = str(e)
+
+            if version is not None:
+                with self._cond:
+                    changed = version != self._version
+                    self._version = version
+                    if changed:
+                        self.changes += 1
+                        self._cond.notify_all()
+                if changed and self._on_change:
+                    self._on_change(version)
+
+            self._poke.wait(self.interval)
+            self._poke.clear()
+
+    def stats(self):
+        return {
+            'subscribers': self._subscribers,
+            'running': bool(self._thread and self._thread.is_alive()),
+            'intervalSeconds': self.interval,
+            'version': self._version,
+            'polls': self.polls,
+            'changes': self.changes,
+            'lastError': self.last_error,
+        }
@@ -0,0 +1,303 @@
+"""
+Manutenção do SQLite: snapshots online, cópias compactadas, ANALYZE e restauro no arranque.
+
+- snapshot: cópia da base de dados com a API de backup do sqlite3, `pages` páginas de
+  cada vez com uma pausa entre passos, por isso os votos dos kiosks continuam a ser
+  gravados durante a cópia. Se as escritas reiniciarem a cópia demasiadas vezes, o
+  resto é feito num só passo (em WAL uma leitura não bloqueia as escritas);
+- compact: `VACUUM INTO` para um ficheiro novo (sem páginas livres nem fragmentação);
+- analyze: `ANALYZE` seguido de `PRAGMA optimize` (estatísticas do planeador).
+
+Os snapshots ficam em `directory` como `feedback-AAAAMMDD-HHMMSS[.compact].db` e só os
+`keep` mais recentes são mantidos. `restore_latest()` copia o snapshot válido mais
+recente para o caminho da base de dados quando esta não existe ou está vazia (ex.: um
+contentor novo com o diretório de snapshots num volume persistente), o que é muito
+mais rápido do que voltar a importar tudo.
+
+O `MaintenanceScheduler` corre as tarefas em background. A hora da última execução de
+cada tarefa fica em `app_meta` (partilhada pelos workers) e um lock de ficheiro garante
+que só um processo faz manutenção de cada vez.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+SNAPSHOT_PREFIX = 'feedback-'
+SNAPSHOT_SUFFIXES = ('.compact.db', '.db')
+
+
+class _Reiniciada(Exception):
+    """A cópia incremental foi reiniciada demasiadas vezes por escritas concorrentes."""
+
+
+def _uri_leitura(path):
+    return f'file:{quote(os.path.abspath(path))}?mode=ro'
+
+
+def default_directory(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+
+
+def _nome_snapshot(directory, compact=False):
+    nome = time.strftime(f'{SNAPSHOT_PREFIX}%Y%m%d-%H%M%S', time.localtime())
+    return os.path.join(directory, nome + ('.compact.db' if compact else '.db'))
+
+
+def list_snapshots(directory):
+    """Snapshots em `directory`, do mais recente para o mais antigo."""
+    try:
+        nomes = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    snapshots = []
+    for nome in nomes:
+        if nome.startswith(SNAPSHOT_PREFIX) and nome.endswith(SNAPSHOT_SUFFIXES):
+            caminho = os.path.join(directory, nome)
+            estado = os.stat(caminho)
+            snapshots.append({'name': nome, 'path': caminho, 'bytes': estado.st_size, 'mtime': estado.st_mtime})
+    snapshots.sort(key=lambda s: s['mtime'], reverse=True)
+    return snapshots
+
+
+def _rodar(directory, keep):
+    for antigo in list_snapshots(directory)[keep:]:
+        try:
+            os.remove(antigo['path'])
+        except OSError:
+            pass
+
+
+def snapshot(conn, directory, pages=256, pause=0.005, max_restarts=3, keep=7):
+    """Snapshot online de `conn` para `directory` (API de backup, por passos). Devolve o relatório."""
+    os.makedirs(directory, exist_ok=True)
+    destino = _nome_snapshot(directory)
+    tmp = destino + '.tmp'
+    inicio = time.perf_counter()
+    passos = {'steps': 0, 'restarts': 0, 'restante': None, 'single_step': False}
+
+    def progresso(status, remaining, total):
+        passos['steps'] += 1
+        # Outra conexão escreveu na origem: a cópia recomeça do início
+        if passos['restante'] is not None and remaining > passos['restante']:
+            passos['restarts'] += 1
+            if passos['restarts'] > max_restarts:
+                raise _Reiniciada()
+        passos['restante'] = remaining
+        if remaining:
+            time.sleep(pause)
+
+    try:
+        dest = sqlite3.connect(tmp)
+        try:
+            try:
+                conn.backup(dest, pages=pages, progress=progresso)
+            except _Reiniciada:
+                passos['single_step'] = True
+                conn.backup(dest, pages=-1)
+            dest.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            dest.close()
+        os.replace(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    _rodar(directory, keep)
+    return {
+        'task': 'snapshot',
+        'path': destino,
+        'bytes': os.path.getsize(destino),
+        'steps': passos['steps'],
+        'restarts': passos['restarts'],
+        'singleStep': passos['single_step'],
+        'seconds': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def compact(conn, directory, keep=7):
+    """`VACUUM INTO` um snapshot compactado. Devolve o relatório."""
+    os.makedirs(directory, exist_ok=True)
+    destino = _nome_snapshot(directory, compact=True)
+    tmp = destino + '.tmp'
+    inicio = time.perf_counter()
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        conn.execute('VACUUM INTO ?', (tmp,))
+        os.replace(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _rodar(directory, keep)
+    return {
+        'task': 'compact',
+        'path': destino,
+        'bytes': os.path.getsize(destino),
+        'seconds': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def analyze(conn):
+    """`ANALYZE` + `PRAGMA optimize`. Devolve o relatório."""
+    inicio = time.perf_counter()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+    conn.commit()
+    return {'task': 'analyze', 'seconds': round(time.perf_counter() - inicio, 3)}
+
+
+def _tem_dados(db_path):
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+        return False
+    conn = sqlite3.connect(_uri_leitura(db_path), uri=True)
+    try:
+        tabelas = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        tabela = 'feedback_rows' if 'feedback_rows' in tabelas else 'feedback' if 'feedback' in tabelas else None
+        return bool(tabela and conn.execute(f'SELECT 1 FROM {tabela} LIMIT 1').fetchone())
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+
+
+def _snapshot_valido(path):
+    try:
+        conn = sqlite3.connect(_uri_leitura(path), uri=True)
+        try:
+            return conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return False
+
+
+def restore_latest(directory, db_path):
+    """Restaura o snapshot válido mais recente se a base de dados não existir ou estiver vazia.
+
+    Tem de correr antes de qualquer conexão à base de dados neste processo. Devolve o
+    relatório do restauro, ou None se não havia nada a fazer.
+    """
+    if _tem_dados(db_path):
+        return None
+    inicio = time.perf_counter()
+    for candidato in list_snapshots(directory):
+        if not _snapshot_valido(candidato['path']):
+            print(f"⚠ Aviso: Snapshot corrompido ignorado: {candidato['name']}")
+            continue
+        tmp = db_path + '.restore.tmp'
+        shutil.copyfile(candidato['path'], tmp)
+        # WAL/SHM da base de dados anterior (vazia) não podem ser aplicados ao snapshot
+        for sufixo in ('-wal', '-shm'):
+            if os.path.exists(db_path + sufixo):
+                os.remove(db_path + sufixo)
+        os.replace(tmp, db_path)
+        return {
+            'snapshot': candidato['name'],
+            'bytes': candidato['bytes'],
+            'snapshotAge': round(time.time() - candidato['mtime'], 1),
+            'seconds': round(time.perf_counter() - inicio, 3),
+        }
+    return None
+
+
+class MaintenanceScheduler:
+    """Corre `tasks` ({nome: (intervalo em segundos, função)}) em background, um processo de cada vez."""
+
+    def __init__(self, connect, tasks, lock_path, check_interval=60.0, initial_delay=60.0):
+        self._connect = connect
+        self.tasks = {nome: (intervalo, funcao) for nome, (intervalo, funcao) in tasks.items() if intervalo > 0}
+        self.lock_path = lock_path
+        self.check_interval = check_interval
+        self.initial_delay = initial_delay
+        self._thread = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self.last_results = {}
+
+    def start(self):
+        with self._lock:
+            if not self.tasks or (self._thread and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._loop, name='sqlite-maintenance', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        time.sleep(self.initial_delay)
+        while True:
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"⚠ Aviso: Manutenção do SQLite falhou: {e}")
+            time.sleep(self.check_interval)
+
+    def _ultimas_execucoes(self):
+        conn = self._connect(readonly=True)
+        try:
+            rows = conn.execute("SELECT key, value FROM app_meta WHERE key LIKE 'maintenance_%'").fetchall()
+        finally:
+            conn.close()
+        return {key[len('maintenance_'):]: value for key, value in rows}
+
+    def _marcar(self, nome, quando):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)',
+                             (f'maintenance_{nome}', int(quando)))
+        finally:
+            conn.close()
+
+    def run_due(self, only=None, force=False):
+        """Corre as tarefas em atraso (ou `only`). Devolve {tarefa: relatório}; {} se outro processo está a correr."""
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover - Windows
+            fcntl = None
+
+        resultados = {}
+        with self._run_lock, open(self.lock_path, 'a') as lock:
+            if fcntl:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return resultados
+            # Reler depois de obter o lock: outro worker pode ter acabado de correr a tarefa
+            ultimas = self._ultimas_execucoes()
+            agora = time.time()
+            for nome, (intervalo, funcao) in self.tasks.items():
+                if only is not None and nome != only:
+                    continue
+                if not force and agora - ultimas.get(nome, 0) < intervalo:
+                    continue
+                try:
+                    resultado = funcao()
+                except Exception as e:
+                    resultado = {'task': nome, 'error': str(e)}
+                    print(f"⚠ Aviso: Manutenção '{nome}' falhou: {e}")
+                # Também após uma falha: a tarefa volta a ser tentada no intervalo seguinte
+                self._marcar(nome, time.time())
+                resultados[nome] = self.last_results[nome] = dict(resultado, at=time.time())
+        return resultados
+
+    def stats(self):
+        try:
+            ultimas = self._ultimas_execucoes()
+        except sqlite3.Error:
+            ultimas = {}
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'tasks': {
+                nome: {
+                    'intervalSeconds': intervalo,
+                    'lastRunAt': ultimas.get(nome),
+                    'nextRunAt': ultimas.get(nome, 0) + intervalo if nome in ultimas else None,
+                    'last': self.last_results.get(nome),
+                }
+                for nome, (intervalo, _) in self.tasks.items()
+            },
+        }
@@ -0,0 +1,296 @@
+"""
+Métricas no formato de texto do Prometheus, agregadas entre os workers do gunicorn.
+
+Cada processo acumula contadores, histogramas e gauges em memória e grava
+periodicamente (`flush_interval`) um snapshot JSON em `directory/<pid>-<instância>.json`. O
+`/metrics` grava o snapshot do próprio processo, lê os de todos os processos e soma-os,
+por isso um único scrape vê o total do serviço, seja qual for o worker que responde.
+
+- contadores e histogramas somam todos os ficheiros, incluindo os de workers que já
+  terminaram (o total nunca desce quando o gunicorn recicla um worker);
+- gauges (ex.: pedidos em curso) só somam processos ainda vivos (com um pid reutilizado,
+  só o snapshot mais recente desse pid conta como vivo).
+
+A pasta deve ser exclusiva de um master do gunicorn e esvaziada quando ele arranca
+(`clear_directory`, chamado em gunicorn.conf.py), como no modo multiprocesso do cliente
+oficial do Prometheus: snapshots de corridas anteriores seriam somados para sempre.
+
+Os snapshots de outros workers podem ter até `flush_interval` segundos de atraso.
+Depois de um fork (gunicorn --preload) o processo filho recomeça com valores a zero.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pares) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def clear_directory(directory):
+    """Apaga os snapshots de `directory` (arranque de um master novo). Devolve quantos apagou."""
+    apagados = 0
+    try:
+        nomes = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for name in nomes:
+        if name.endswith('.json') or name.endswith('.json.tmp'):
+            try:
+                os.remove(os.path.join(directory, name))
+                apagados += 1
+            except FileNotFoundError:
+                pass
+    return apagados
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # existe, mas pertence a outro utilizador
+    return True
+
+
+class Registry:
+    """Métricas de um processo + agregação dos snapshots de todos os processos."""
+
+    def __init__(self, directory, flush_interval=5.0, prefix=''):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._definitions = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(self.directory, exist_ok=True)
+        self._reset()
+        atexit.register(self._flush_at_exit)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # Um pid pode ser reutilizado por outro worker: cada processo tem o seu ficheiro
+        self._instance = uuid.uuid4().hex[:12]
+        self._started = time.time()
+        self._values = {}   # nome -> {labels_key: valor | [contagens por bucket..., soma, total]}
+        self._thread = None
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    # Definição ----------------------------------------------------------
+
+    def _define(self, name, kind, help_text, buckets=None):
+        name = self.prefix + name
+        self._definitions[name] = {'type': kind, 'help': help_text, 'buckets': buckets}
+        return name
+
+    def counter(self, name, help_text):
+        return _Metric(self, self._define(name, 'counter', help_text))
+
+    def gauge(self, name, help_text):
+        return _Metric(self, self._define(name, 'gauge', help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return _Metric(self, self._define(name, 'histogram', help_text, tuple(sorted(buckets))))
+
+    def add_collector(self, collect):
+        """`collect()` devolve [(metrica, labels, valor)] lidos no momento do snapshot.
+
+        Para valores que já existem noutro sítio (ex.: estatísticas do pool SQLite):
+        o valor substitui o anterior em vez de ser somado.
+        """
+        self._collectors.append(collect)
+
+    # Registo ------------------------------------------------------------
+
+    def _inc(self, name, labels, amount):
+        self._check_fork()
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+        self._ensure_thread()
+
+    def _set(self, name, labels, value):
+        self._check_fork()
+        with self._lock:
+            self._values.setdefault(name, {})[_labels_key(labels)] = value
+
+    def _observe(self, name, labels, value):
+        self._check_fork()
+        buckets = self._definitions[name]['buckets']
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            estado = series.get(key)
+            if estado is None:
+                estado = series[key] = [0] * len(buckets) + [0.0, 0]
+            for i, limite in enumerate(buckets):
+                if value <= limite:
+                    estado[i] += 1
+                    break
+            estado[-2] += value
+            estado[-1] += 1
+        self._ensure_thread()
+
+    # Snapshots em disco ---------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is not None or not self.flush_interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._pid != os.getpid():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠ Aviso: Falha ao gravar métricas: {e}")
+
+    def _flush_at_exit(self):
+        if self._pid == os.getpid():
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def flush(self):
+        """Grava o snapshot deste processo (atómico: ficheiro temporário + rename)."""
+        self._check_fork()
+        for collect in self._collectors:
+            try:
+                for metric, labels, value in collect():
+                    metric.set(value, **labels)
+            except Exception as e:
+                print(f"⚠ Aviso: Falha ao recolher métricas: {e}")
+
+        with self._lock:
+            dados = {
+                'pid': self._pid,
+                'started': self._started,
+                'metrics': {
+                    name: [[list(map(list, key)), valor] for key, valor in series.items()]
+                    for name, series in self._values.items()
+                },
+            }
+        path = os.path.join(self.directory, f'{self._pid}-{self._instance}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(dados, f)
+        os.replace(tmp, path)
+
+    def _load_all(self):
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # ficheiro a ser substituído neste instante
+        return snapshots
+
+    # Exposição ------------------------------------------------------------
+
+    def render(self):
+        """Texto para o /metrics com a soma de todos os processos."""
+        self.flush()
+        agregado = {}
+        snapshots = self._load_all()
+        # Com um pid reutilizado, os snapshots mais antigos desse pid são de processos mortos
+        recentes = {}
+        for snapshot in snapshots:
+            pid = snapshot.get('pid')
+            recentes[pid] = max(recentes.get(pid, 0), snapshot.get('started', 0))
+        for snapshot in snapshots:
+            pid = snapshot.get('pid')
+            vivo = snapshot.get('started', 0) == recentes[pid] and (
+                pid == self._pid or (bool(pid) and _pid_alive(pid))
+            )
+            for name, series in snapshot.get('metrics', {}).items():
+                definicao = self._definitions.get(name)
+                if definicao is None or (definicao['type'] == 'gauge' and not vivo):
+                    continue
+                destino = agregado.setdefault(name, {})
+                for pares, valor in series:
+                    key = tuple(tuple(p) for p in pares)
+                    if definicao['type'] == 'histogram':
+                        atual = destino.get(key)
+                        if atual is None or len(atual) != len(valor):
+                            destino[key] = list(valor)
+                        else:
+                            destino[key] = [a + b for a, b in zip(atual, valor)]
+                    else:
+                        destino[key] = destino.get(key, 0) + valor
+
+        linhas = []
+        for name in sorted(self._definitions):
+            definicao = self._definitions[name]
+            linhas.append(f"# HELP {name} {definicao['help']}")
+            linhas.append(f"# TYPE {name} {definicao['type']}")
+            for key, valor in sorted(agregado.get(name, {}).items()):
+                if definicao['type'] != 'histogram':
+                    linhas.append(f'{name}{_format_labels(key)} {_format_value(valor)}')
+                    continue
+                # Buckets cumulativos; o +Inf é o total de observações
+                acumulado = 0
+                for limite, contagem in zip(definicao['buckets'], valor[:-2]):
+                    acumulado += contagem
+                    le = (('le', _format_value(float(limite))),)
+                    linhas.append(f'{name}_bucket{_format_labels(key + le)} {acumulado}')
+                linhas.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {valor[-1]}")
+                linhas.append(f'{name}_sum{_format_labels(key)} {_format_value(float(valor[-2]))}')
+                linhas.append(f'{name}_count{_format_labels(key)} {valor[-1]}')
+        return '\n'.join(linhas) + '\n'
+
+
+class _Metric:
+    def __init__(self, registry, name):
+        self._registry = registry
+        self.name = name
+
+    def inc(self, amount=1, **labels):
+        self._registry._inc(self.name, labels, amount)
+
+    def dec(self, amount=1, **labels):
+        self._registry._inc(self.name, labels, -amount)
+
+    def set(self, value, **labels):
+        self._registry._set(self.name, labels, value)
+
+    def observe(self, value, **labels):
+        self._registry._observe(self.name, labels, value)
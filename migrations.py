@@ -0,0 +1,369 @@
+"""
+Migrações versionadas do esquema SQLite.
+
+A versão do esquema fica guardada no próprio ficheiro (`PRAGMA user_version`).
+Cada migração corre numa transação IMMEDIATE e só é aplicada se a versão atual
+for inferior à dela, por isso vários workers a arrancar ao mesmo tempo não
+aplicam a mesma migração duas vezes.
+
+Para evoluir o esquema: acrescentar uma entrada no fim de MIGRATIONS com o número
+seguinte. Os passos podem ser strings SQL ou funções `passo(conn)`. Nunca alterar
+migrações já publicadas — ficheiros `feedback.db` existentes já as aplicaram.
+"""
+import calendar
+from datetime import datetime
+
+import firestore_outbox
+
+# Esquema compacto (migração 6): grau de satisfação guardado como inteiro pequeno
+GRAU_CODES = {'insatisfeito': 0, 'satisfeito': 1, 'muito_satisfeito': 2}
+
+# strftime('%w'): 0 = domingo
+_DIAS_SEMANA_W = ('Domingo', 'Segunda-feira', 'Terça-feira', 'Quarta-feira',
+                  'Quinta-feira', 'Sexta-feira', 'Sábado')
+
+
+def _grau_texto_sql(expr):
+    casos = ' '.join(f"WHEN {codigo} THEN '{grau}'" for grau, codigo in GRAU_CODES.items())
+    return f'CASE {expr} {casos} END'
+
+
+def _grau_codigo_sql(expr):
+    casos = ' '.join(f"WHEN '{grau}' THEN {codigo}" for grau, codigo in GRAU_CODES.items())
+    return f'CASE {expr} {casos} END'
+
+
+def _dia_semana_sql(ts_expr):
+    casos = ' '.join(f"WHEN {w} THEN '{dia}'" for w, dia in enumerate(_DIAS_SEMANA_W))
+    return f"CASE CAST(strftime('%w', {ts_expr}, 'unixepoch') AS INTEGER) {casos} END"
+
+
+def _ts_sql(data_expr, hora_expr):
+    return f"CAST(strftime('%s', {data_expr} || ' ' || {hora_expr}) AS INTEGER)"
+
+
+# Colunas "antigas" (id, grau_satisfacao, data, hora, dia_semana) calculadas a partir de
+# feedback_rows. Usado pela view `feedback` e pelas consultas do histórico/exportações,
+# que filtram e ordenam por `ts` diretamente na tabela compacta.
+FEEDBACK_COLUMNS = f"""id,
+    {_grau_texto_sql('grau')} AS grau_satisfacao,
+    date(ts, 'unixepoch') AS data,
+    time(ts, 'unixepoch') AS hora,
+    {_dia_semana_sql('ts')} AS dia_semana"""
+
+
+def to_ts(quando):
+    """datetime local (sem fuso) -> inteiro guardado em feedback_rows.ts.
+
+    O valor é a hora de parede local codificada como se fosse UTC, por isso
+    date(ts, 'unixepoch') / time(ts, 'unixepoch') devolvem a data e a hora locais.
+    """
+    return calendar.timegm(quando.timetuple())
+
+
+def date_to_ts(data):
+    """'YYYY-MM-DD' -> ts do início desse dia (ValueError se a data for inválida)."""
+    return to_ts(datetime.strptime(data, '%Y-%m-%d'))
+
+
+def rebuild_daily_counts(conn):
+    """Regenera feedback_daily_counts a partir de feedback (não faz commit).
+
+    Lê `feedback` pelo nome: é a tabela original até à migração 6 e a view depois dela.
+    """
+    conn.execute('DELETE FROM feedback_daily_counts')
+    conn.execute('''
+        INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+        SELECT data, grau_satisfacao, COUNT(*)
+        FROM feedback
+        GROUP BY data, grau_satisfacao
+    ''')
+
+
+# Contagens por dia x grau de satisfação, mantidas pelos triggers em qualquer
+# escrita na tabela feedback (inclusive scripts externos, ex.: test_firebase.py).
+DAILY_COUNTS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS feedback_daily_counts (
+        data TEXT NOT NULL,
+        grau_satisfacao TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (data, grau_satisfacao)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_feedback_daily_counts_insert
+    AFTER INSERT ON feedback
+    BEGIN
+        INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+        VALUES (NEW.data, NEW.grau_satisfacao, 1)
+        ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_feedback_daily_counts_delete
+    AFTER DELETE ON feedback
+    BEGIN
+        UPDATE feedback_daily_counts SET total = total - 1
+        WHERE data = OLD.data AND grau_satisfacao = OLD.grau_satisfacao;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_feedback_daily_counts_update
+    AFTER UPDATE OF data, grau_satisfacao ON feedback
+    BEGIN
+        UPDATE feedback_daily_counts SET total = total - 1
+        WHERE data = OLD.data AND grau_satisfacao = OLD.grau_satisfacao;
+        INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+        VALUES (NEW.data, NEW.grau_satisfacao, 1)
+        ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+    END
+    ''',
+]
+
+# Versão dos dados: incrementada em cada escrita na tabela feedback. Serve para
+# invalidar caches (ver response_cache.py) em todos os processos.
+DATA_VERSION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS app_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    "INSERT OR IGNORE INTO app_meta (key, value) VALUES ('data_version', 0)",
+    # Identifica este ficheiro: um feedback.db recriado (ex.: /tmp efémero) recomeça
+    # a versão em 0 mas com outra época, por isso ETags antigos não coincidem.
+    "INSERT OR IGNORE INTO app_meta (key, value) VALUES ('data_epoch', abs(random()) % 4294967296)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_feedback_data_version_insert
+    AFTER INSERT ON feedback
+    BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_feedback_data_version_delete
+    AFTER DELETE ON feedback
+    BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_feedback_data_version_update
+    AFTER UPDATE ON feedback
+    BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    ''',
+]
+
+def _converter_para_feedback_rows(conn):
+    """Copia a tabela feedback (texto) para feedback_rows e remove-a (não faz commit)."""
+    grau = _grau_codigo_sql('grau_satisfacao')
+    ts = _ts_sql('data', 'hora')
+    invalidos = conn.execute(
+        f'SELECT COUNT(*) FROM feedback WHERE ({grau}) IS NULL OR ({ts}) IS NULL'
+    ).fetchone()[0]
+    if invalidos:
+        raise RuntimeError(
+            f'{invalidos} registo(s) em feedback com grau_satisfacao ou data/hora inválidos; '
+            'corrija-os antes de migrar para o esquema compacto'
+        )
+    conn.execute(f'INSERT INTO feedback_rows (id, ts, grau) SELECT id, {ts}, {grau} FROM feedback')
+    conn.execute('DROP TABLE feedback')
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'feedback'")
+
+
+# Esquema compacto: uma linha = 3 inteiros. `feedback` passa a ser uma view com as colunas
+# antigas (calculadas), e os INSERT/UPDATE/DELETE nela são redirecionados para feedback_rows.
+# Os triggers das contagens diárias e da versão dos dados passam para a tabela nova.
+COMPACT_SCHEMA = [
+    '''
+    CREATE TABLE feedback_rows (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        grau INTEGER NOT NULL
+    )
+    ''',
+    _converter_para_feedback_rows,
+    'CREATE INDEX idx_feedback_rows_ts ON feedback_rows(ts)',
+    'CREATE INDEX idx_feedback_rows_grau_ts ON feedback_rows(grau, ts)',
+    f'''
+    CREATE VIEW feedback AS
+    SELECT {FEEDBACK_COLUMNS},
+        datetime(ts, 'unixepoch') AS timestamp
+    FROM feedback_rows
+    ''',
+    f'''
+    CREATE TRIGGER trg_feedback_view_insert
+    INSTEAD OF INSERT ON feedback
+    BEGIN
+        INSERT INTO feedback_rows (id, ts, grau)
+        VALUES (NEW.id, {_ts_sql('NEW.data', 'NEW.hora')}, {_grau_codigo_sql('NEW.grau_satisfacao')});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_feedback_view_update
+    INSTEAD OF UPDATE ON feedback
+    BEGIN
+        UPDATE feedback_rows
+        SET ts = {_ts_sql('NEW.data', 'NEW.hora')}, grau = {_grau_codigo_sql('NEW.grau_satisfacao')}
+        WHERE id = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER trg_feedback_view_delete
+    INSTEAD OF DELETE ON feedback
+    BEGIN
+        DELETE FROM feedback_rows WHERE id = OLD.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_feedback_rows_daily_counts_insert
+    AFTER INSERT ON feedback_rows
+    BEGIN
+        INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+        VALUES (date(NEW.ts, 'unixepoch'), {_grau_texto_sql('NEW.grau')}, 1)
+        ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_feedback_rows_daily_counts_delete
+    AFTER DELETE ON feedback_rows
+    BEGIN
+        UPDATE feedback_daily_counts SET total = total - 1
+        WHERE data = date(OLD.ts, 'unixepoch') AND grau_satisfacao = {_grau_texto_sql('OLD.grau')};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_feedback_rows_daily_counts_update
+    AFTER UPDATE OF ts, grau ON feedback_rows
+    BEGIN
+        UPDATE feedback_daily_counts SET total = total - 1
+        WHERE data = date(OLD.ts, 'unixepoch') AND grau_satisfacao = {_grau_texto_sql('OLD.grau')};
+        INSERT INTO feedback_daily_counts (data, grau_satisfacao, total)
+        VALUES (date(NEW.ts, 'unixepoch'), {_grau_texto_sql('NEW.grau')}, 1)
+        ON CONFLICT (data, grau_satisfacao) DO UPDATE SET total = total + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER trg_feedback_rows_data_version_insert
+    AFTER INSERT ON feedback_rows
+    BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER trg_feedback_rows_data_version_delete
+    AFTER DELETE ON feedback_rows
+    BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER trg_feedback_rows_data_version_update
+    AFTER UPDATE ON feedback_rows
+    BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    ''',
+    # A conversão não altera os dados: a versão muda para invalidar caches/ETags antigos
+    "UPDATE app_meta SET value = value + 1 WHERE key = 'data_version'",
+    'ANALYZE feedback_rows',
+]
+
+# Chave gerada pelo kiosk para cada voto: um reenvio de um voto já gravado (resposta
+# perdida, 503 depois do commit) devolve o id existente em vez de gravar outra vez
+CLIENT_KEYS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS feedback_client_keys (
+        key TEXT PRIMARY KEY,
+        feedback_id INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_feedback_client_keys_created ON feedback_client_keys(created_at)',
+]
+
+MIGRATIONS = [
+    (1, 'tabela feedback', [
+        '''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grau_satisfacao TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            dia_semana TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, 'outbox de replicação para o Firestore', firestore_outbox.OUTBOX_SCHEMA),
+    (3, 'índices por data (filtros, agregações e ordenação do histórico)', [
+        'CREATE INDEX IF NOT EXISTS idx_feedback_data_grau ON feedback(data, grau_satisfacao)',
+        'CREATE INDEX IF NOT EXISTS idx_feedback_data_hora ON feedback(data, hora)',
+        'ANALYZE feedback',
+    ]),
+    (4, 'contagens diárias materializadas (feedback_daily_counts)', DAILY_COUNTS_SCHEMA + [
+        rebuild_daily_counts,
+    ]),
+    (5, 'versão dos dados (app_meta.data_version)', DATA_VERSION_SCHEMA),
+    (6, 'esquema compacto (feedback_rows + view feedback)', COMPACT_SCHEMA),
+    (7, 'chaves de idempotência dos votos do kiosk (feedback_client_keys)', CLIENT_KEYS_SCHEMA),
+]
+
+
+def latest_version(migrations=MIGRATIONS):
+    return max((version for version, _, _ in migrations), default=0)
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Aplica as migrações pendentes. Devolve a lista de (versão, descrição) aplicadas."""
+    applied = []
+    for version, description, steps in sorted(migrations, key=lambda m: m[0]):
+        if current_version(conn) >= version:
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Outro processo pode ter aplicado a migração enquanto esperávamos pelo lock
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def read_data_version(conn):
+    """Versão atual dos dados como '<época>.<versão>' (só serve para comparar igualdade)."""
+    rows = dict(conn.execute(
+        "SELECT key, value FROM app_meta WHERE key IN ('data_epoch', 'data_version')"
+    ).fetchall())
+    return f"{rows.get('data_epoch', 0):x}.{rows.get('data_version', 0)}"
+
+
+def status(conn, migrations=MIGRATIONS):
+    """Versão atual, mais recente e migrações por aplicar."""
+    version = current_version(conn)
+    return {
+        'version': version,
+        'latest': latest_version(migrations),
+        'pending': [
+            {'version': v, 'description': d}
+            for v, d, _ in sorted(migrations, key=lambda m: m[0]) if v > version
+        ],
+    }
@@ -0,0 +1,314 @@
+"""
+Reconciliação por dia entre o SQLite e a coleção `feedback` do Firestore.
+
+Comparar as duas bases de dados documento a documento obriga a ler tudo. Em vez disso
+cada lado calcula um resumo por período (número de votos e soma dos ids), que no
+Firestore sai de consultas de agregação (`count()` + `sum('id')`, sem ler documentos):
+
+1. um resumo por mês (intervalo no campo `data`);
+2. só nos meses diferentes, um resumo por dia e por grau (igualdades em `data` e
+   `grau_satisfacao`, servidas pelos índices simples, sem índice composto);
+3. só nos dias diferentes, os documentos desse dia são lidos e comparados voto a voto.
+
+Votos que só existem no SQLite (ou com conteúdo diferente) são escritos no Firestore com
+o BulkWriter; os que só existem no Firestore são inseridos no SQLite. Um id que já
+existe do outro lado noutro dia é um conflito: não é sobrescrito, fica no relatório.
+Dias com votos ainda na outbox são saltados (o replicador ainda os vai enviar).
+
+Com o Firestore vazio todos os dias são diferentes, por isso a mesma função serve de
+backfill inicial dos votos do SQLite para o Firestore.
+"""
+import calendar
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import csv_import
+import hydrate
+import migrations
+
+DIRECTIONS = ('both', 'to-firestore', 'to-sqlite')
+MAX_LISTED = 50
+_ALREADY_EXISTS = 6  # código gRPC
+
+
+def _mes_seguinte(mes):
+    ano, m = int(mes[:4]), int(mes[5:7])
+    return f'{ano + m // 12:04d}-{m % 12 + 1:02d}'
+
+
+def _meses_entre(primeiro, ultimo):
+    meses = []
+    mes = primeiro
+    while mes <= ultimo:
+        meses.append(mes)
+        mes = _mes_seguinte(mes)
+    return meses
+
+
+def _dias_do_mes(mes):
+    ano, m = int(mes[:4]), int(mes[5:7])
+    return [f'{mes}-{d:02d}' for d in range(1, calendar.monthrange(ano, m)[1] + 1)]
+
+
+# Resumos do SQLite ---------------------------------------------------------------
+
+def local_months(conn):
+    """{'AAAA-MM': (votos, soma dos ids)}"""
+    rows = conn.execute('''
+        SELECT strftime('%Y-%m', ts, 'unixepoch') AS mes, COUNT(*), COALESCE(SUM(id), 0)
+        FROM feedback_rows GROUP BY mes
+    ''').fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def local_days(conn, mes, graus):
+    """{'AAAA-MM-DD': {grau: (votos, soma dos ids)}} para um mês."""
+    inicio = migrations.date_to_ts(f'{mes}-01')
+    fim = migrations.date_to_ts(f'{_mes_seguinte(mes)}-01')
+    rows = conn.execute('''
+        SELECT date(ts, 'unixepoch') AS dia, grau, COUNT(*), SUM(id)
+        FROM feedback_rows WHERE ts >= ? AND ts < ? GROUP BY dia, grau
+    ''', (inicio, fim)).fetchall()
+    resumo = {}
+    for dia, grau, votos, soma in rows:
+        resumo.setdefault(dia, {})[graus[grau]] = (votos, soma)
+    return resumo
+
+
+def _dias_pendentes(conn):
+    """Dias com votos ainda por replicar (a diferença é esperada)."""
+    rows = conn.execute("SELECT DISTINCT json_extract(payload, '$.data') FROM firestore_outbox").fetchall()
+    return {r[0] for r in rows if r[0]}
+
+
+# Resumos do Firestore -------------------------------------------------------------
+
+def _agregar(query):
+    resultado = query.count(alias='votos').sum('id', alias='soma').get()
+    valores = {r.alias: r.value for r in resultado[0]}
+    return int(valores.get('votos') or 0), int(valores.get('soma') or 0)
+
+
+def _limites_remotos(colecao):
+    """Primeiro e último mês com documentos (ou None)."""
+    primeiro = colecao.order_by('data').limit(1).get()
+    ultimo = colecao.order_by('data', direction='DESCENDING').limit(1).get()
+    if not primeiro or not ultimo:
+        return None
+    return str(primeiro[0].to_dict().get('data', ''))[:7], str(ultimo[0].to_dict().get('data', ''))[:7]
+
+
+class _Firestore:
+    def __init__(self, colecao, parallelism):
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        self._filtro = FieldFilter
+        self.colecao = colecao
+        self.parallelism = parallelism
+        self.queries = 0
+
+    def _onde(self, campo, operador, valor, query=None):
+        return (query or self.colecao).where(filter=self._filtro(campo, operador, valor))
+
+    def _em_paralelo(self, funcao, itens):
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            resultados = list(executor.map(funcao, itens))
+        self.queries += len(itens)
+        return dict(zip(itens, resultados))
+
+    def months(self, meses):
+        def resumo(mes):
+            query = self._onde('data', '>=', f'{mes}-01')
+            return _agregar(self._onde('data', '<', f'{_mes_seguinte(mes)}-01', query))
+        return self._em_paralelo(resumo, meses)
+
+    def days(self, dias, graus):
+        pares = [(dia, grau) for dia in dias for grau in graus]
+
+        def resumo(par):
+            dia, grau = par
+            return _agregar(self._onde('grau_satisfacao', '==', grau, self._onde('data', '==', dia)))
+
+        resumo_dias = {}
+        for (dia, grau), valor in self._em_paralelo(resumo, pares).items():
+            if valor[0]:
+                resumo_dias.setdefault(dia, {})[grau] = valor
+        return resumo_dias
+
+    def documents(self, dia):
+        self.queries += 1
+        return [(doc.id, doc.to_dict() or {}) for doc in self._onde('data', '==', dia).get()]
+
+
+# Reconciliação ----------------------------------------------------------------------
+
+class _Sincronizador:
+    """Compara e acerta um dia de cada vez; as escritas no Firestore passam pelo BulkWriter."""
+
+    def __init__(self, conn, client, remoto, grau_labels, direction, relatorio):
+        self.conn = conn
+        self.client = client
+        self.remoto = remoto
+        self.direction = direction
+        self.relatorio = relatorio
+        self._graus = {codigo: grau for grau, codigo in migrations.GRAU_CODES.items()}
+        self._conversor = hydrate._Conversor(grau_labels)
+        self._writer = None
+        self.conflitos = set()
+
+    def _bulk_writer(self):
+        if self._writer is None:
+            self._writer = self.client.bulk_writer()
+            self._writer.on_write_error(self._erro_escrita)
+        return self._writer
+
+    def _erro_escrita(self, falha, _writer):
+        referencia = getattr(falha.operation, 'reference', None)
+        if falha.code == _ALREADY_EXISTS:
+            self.relatorio['toFirestore'] -= 1
+            self.conflitos.add(referencia.id if referencia else None)
+            return False
+        if falha.attempts < 3:
+            return True
+        self.relatorio['writeErrors'] += 1
+        self._listar('errors', {'doc': referencia.id if referencia else None, 'error': falha.message})
+        return False
+
+    def _listar(self, chave, valor):
+        if len(self.relatorio[chave]) < MAX_LISTED:
+            self.relatorio[chave].append(valor)
+
+    def dia(self, dia):
+        inicio = migrations.date_to_ts(dia)
+        locais = {
+            r[0]: (r[1], r[2]) for r in self.conn.execute(
+                'SELECT id, ts, grau FROM feedback_rows WHERE ts >= ? AND ts < ?', (inicio, inicio + 86400)
+            )
+        }
+        remotos = {}
+        for doc_id, dados in self.remoto.documents(dia):
+            try:
+                feedback_id, ts, grau = self._conversor.linha(doc_id, dados)
+            except ValueError as e:
+                self._listar('errors', {'doc': doc_id, 'error': str(e)})
+                continue
+            if doc_id != f'feedback_{feedback_id}':
+                continue  # documento fora do padrão (não foi escrito pela aplicação)
+            remotos[feedback_id] = (ts, grau)
+
+        if self.direction in ('both', 'to-firestore'):
+            colecao = self.remoto.colecao
+            for feedback_id, (ts, grau) in locais.items():
+                atual = remotos.get(feedback_id)
+                if atual == (ts, grau):
+                    continue
+                documento = colecao.document(f'feedback_{feedback_id}')
+                payload = csv_import._payload(feedback_id, ts, grau, self._graus)
+                if atual is None:
+                    # create(): se o id já existir noutro dia, é um conflito e não se sobrescreve
+                    self._bulk_writer().create(documento, payload)
+                    self.relatorio['toFirestore'] += 1
+                else:
+                    self._bulk_writer().set(documento, payload)
+                    self.relatorio['updatedFirestore'] += 1
+
+        if self.direction in ('both', 'to-sqlite'):
+            em_falta = [(i, ts, grau) for i, (ts, grau) in remotos.items() if i not in locais]
+            if em_falta:
+                with self.conn:
+                    for feedback_id, ts, grau in em_falta:
+                        inserida = self.conn.execute(
+                            'INSERT OR IGNORE INTO feedback_rows (id, ts, grau) VALUES (?, ?, ?)',
+                            (feedback_id, ts, grau)
+                        ).rowcount
+                        if inserida:
+                            self.relatorio['toSqlite'] += 1
+                        else:
+                            # O id existe no SQLite noutro dia
+                            self.conflitos.add(f'feedback_{feedback_id}')
+
+    def fechar(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def reconcile(conn, client, grau_labels, collection='feedback', direction='both', deep=False, dry_run=False,
+              parallelism=8):
+    """Compara o SQLite com o Firestore por mês/dia e acerta os dias diferentes. Devolve o relatório.
+
+    `deep` compara todos os dias (também deteta um voto com grau diferente em meses cujo
+    total bate certo); `dry_run` só lista os dias diferentes.
+    """
+    inicio = time.perf_counter()
+    graus = {codigo: grau for grau, codigo in migrations.GRAU_CODES.items()}
+    nomes_graus = sorted(migrations.GRAU_CODES)
+    remoto = _Firestore(client.collection(collection), parallelism)
+    relatorio = {
+        'direction': direction,
+        'deep': deep,
+        'dryRun': dry_run,
+        'months': 0,
+        'divergentMonths': [],
+        'days': 0,
+        'divergentDays': [],
+        'pendingDays': [],
+        'toFirestore': 0,
+        'updatedFirestore': 0,
+        'toSqlite': 0,
+        'conflicts': 0,
+        'conflictIds': [],
+        'writeErrors': 0,
+        'errors': [],
+        'firestoreQueries': 0,
+        'seconds': 0.0,
+    }
+
+    meses_locais = local_months(conn)
+    limites = _limites_remotos(remoto.colecao)
+    remoto.queries += 2
+    candidatos = sorted(set(meses_locais) | set(limites or ()))
+    if not candidatos:
+        relatorio['seconds'] = round(time.perf_counter() - inicio, 3)
+        return relatorio
+    meses = _meses_entre(candidatos[0], candidatos[-1])
+    relatorio['months'] = len(meses)
+
+    if deep:
+        divergentes = meses
+    else:
+        resumo_remoto = remoto.months(meses)
+        divergentes = [m for m in meses if meses_locais.get(m, (0, 0)) != resumo_remoto[m]]
+    relatorio['divergentMonths'] = divergentes[:MAX_LISTED] if not deep else []
+
+    pendentes = _dias_pendentes(conn)
+    sincronizador = _Sincronizador(conn, client, remoto, grau_labels, direction, relatorio)
+    try:
+        for mes in divergentes:
+            dias = _dias_do_mes(mes)
+            relatorio['days'] += len(dias)
+            locais = local_days(conn, mes, graus)
+            remotos = remoto.days(dias, nomes_graus)
+            for dia in dias:
+                if locais.get(dia, {}) == remotos.get(dia, {}):
+                    continue
+                if dia in pendentes:
+                    if len(relatorio['pendingDays']) < MAX_LISTED:
+                        relatorio['pendingDays'].append(dia)
+                    continue
+                if len(relatorio['divergentDays']) < MAX_LISTED:
+                    relatorio['divergentDays'].append({
+                        'date': dia,
+                        'sqlite': {g: list(v) for g, v in locais.get(dia, {}).items()},
+                        'firestore': {g: list(v) for g, v in remotos.get(dia, {}).items()},
+                    })
+                if not dry_run:
+                    sincronizador.dia(dia)
+    finally:
+        sincronizador.fechar()
+
+    relatorio['conflicts'] = len(sincronizador.conflitos)
+    relatorio['conflictIds'] = sorted(c for c in sincronizador.conflitos if c)[:MAX_LISTED]
+
+    relatorio['firestoreQueries'] = remoto.queries
+    relatorio['seconds'] = round(time.perf_counter() - inicio, 3)
+    return relatorio
@@ -0,0 +1,101 @@
+"""
+Cache de respostas JSON em memória, invalidada pela versão dos dados.
+
+A versão dos dados (`app_meta.data_version`) é incrementada por triggers em cada
+escrita na tabela feedback, por isso é partilhada por todos os workers. Cada processo
+guarda a última versão lida e só volta a consultá-la no SQLite depois de `ttl`
+segundos, ou logo a seguir a um voto registado neste processo (`invalidate()`).
+
+Com a versão em memória, um pedido com `If-None-Match` igual ao ETag atual
+recebe 304 sem tocar no SQLite, e um pedido sem ETag recebe o corpo já serializado.
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class DataVersion:
+    """Versão dos dados lida do SQLite, com cache de curta duração."""
+
+    def __init__(self, read_version, ttl=1.0):
+        self._read_version = read_version
+        self.ttl = ttl
+        self._value = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def get(self):
+        now = time.monotonic()
+        if self._value is not None and now - self._checked_at < self.ttl:
+            return self._value
+        with self._lock:
+            if self._value is None or time.monotonic() - self._checked_at >= self.ttl:
+                self._value = self._read_version()
+                self._checked_at = time.monotonic()
+                self.reads += 1
+            return self._value
+
+    def set(self, value):
+        """Regista uma versão já conhecida (ex.: lida por outro componente)."""
+        with self._lock:
+            self._value = value
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Força nova leitura no próximo get() (chamado após gravar votos)."""
+        self._checked_at = 0.0
+
+
+class ResponseCache:
+    """LRU de corpos JSON serializados, todos da mesma versão dos dados."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def etag(key, version):
+        return f'{version}-{zlib.crc32(repr(key).encode("utf-8")):08x}'
+
+    def get(self, key, version):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, version, body):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'notModified': self.not_modified,
+            }
@@ -0,0 +1,233 @@
+"""
+Profiling opcional das consultas SQLite (tempo, linhas e plano das consultas lentas).
+
+Com o profiler ligado, as conexões do pool devolvem cursores instrumentados: cada
+instrução conta o tempo do execute() mais o tempo gasto a ler as linhas (fetch*) e o
+número de linhas lidas. As estatísticas são agregadas pelo texto SQL (os parâmetros
+são sempre `?`, por isso cada combinação de filtros do histórico é uma entrada).
+
+Quando uma execução passa de `threshold_ms` entra no registo de consultas lentas e, na
+primeira vez que isso acontece para aquele SQL, é guardado o `EXPLAIN QUERY PLAN`
+(com os mesmos parâmetros). Planos com `SCAN` sem índice ou `USE TEMP B-TREE` ficam
+assinalados, o que ajuda a encontrar índices em falta.
+
+Tudo é por processo e fica só em memória. Desligado, o custo é uma verificação por execute().
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Instruções para as quais faz sentido pedir o plano
+_COM_PLANO = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def normalize(sql):
+    return ' '.join(sql.split())
+
+
+def _resumir_parametros(params, limite=200):
+    texto = repr(tuple(params)) if isinstance(params, (list, tuple)) else repr(params)
+    return texto if len(texto) <= limite else texto[:limite] + '...'
+
+
+def _analisar_plano(linhas):
+    """Linhas do EXPLAIN QUERY PLAN -> (texto indentado, scans completos, B-trees temporárias)."""
+    profundidade = {0: -1}
+    texto = []
+    scans = []
+    temporarias = 0
+    for id_, parent, _, detalhe in linhas:
+        nivel = profundidade.get(parent, -1) + 1
+        profundidade[id_] = nivel
+        texto.append('  ' * nivel + detalhe)
+        if detalhe.startswith('SCAN ') and 'INDEX' not in detalhe:
+            scans.append(detalhe)
+        if 'TEMP B-TREE' in detalhe:
+            temporarias += 1
+    return texto, scans, temporarias
+
+
+class SqlProfiler:
+    """Estatísticas por instrução SQL + registo das execuções lentas (por processo)."""
+
+    def __init__(self, enabled=False, threshold_ms=100.0, max_statements=500, max_slow=100):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.max_statements = max_statements
+        self.cursor_factory = ProfiledCursor
+        self._lock = threading.Lock()
+        self._max_slow = max_slow
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._statements = OrderedDict()
+            self._slow = deque(maxlen=self._max_slow)
+            self._plans = {}
+            self.started_at = time.time()
+
+    def configure(self, enabled=None, threshold_ms=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if threshold_ms is not None:
+            self.threshold_ms = max(0.0, float(threshold_ms))
+
+    # Recolha ----------------------------------------------------------------
+
+    def _entrada(self, sql):
+        chave = normalize(sql)
+        entrada = self._statements.get(chave)
+        if entrada is None:
+            if len(self._statements) >= self.max_statements:
+                chave = '<outras instruções>'
+                entrada = self._statements.get(chave)
+            if entrada is None:
+                entrada = self._statements[chave] = {
+                    'sql': chave, 'calls': 0, 'seconds': 0.0, 'maxSeconds': 0.0, 'rows': 0, 'slowCalls': 0,
+                }
+        return entrada
+
+    def start(self, conn, sql, params, segundos, many=False):
+        """Regista um execute()/executemany(). Devolve o estado da execução (para os fetch)."""
+        with self._lock:
+            entrada = self._entrada(sql)
+            entrada['calls'] += 1
+        execucao = _Execucao(self, conn, sql, params, entrada, many)
+        execucao.add(segundos, 0)
+        return execucao
+
+    def _lenta(self, execucao):
+        """Primeira vez que uma execução passa do limite: registo e (uma vez por SQL) o plano."""
+        chave = execucao.entrada['sql']
+        plano = None
+        if not execucao.many and chave not in self._plans and chave.split(' ', 1)[0].upper() in _COM_PLANO:
+            plano = self._explain(execucao.conn, execucao.sql, execucao.params)
+
+        with self._lock:
+            if plano is not None:
+                self._plans[chave] = plano
+            execucao.entrada['slowCalls'] += 1
+            registo = {
+                'at': time.time(),
+                'sql': chave,
+                'params': _resumir_parametros(execucao.params),
+                'ms': round(execucao.segundos * 1000, 3),
+                'rows': execucao.linhas,
+            }
+            self._slow.append(registo)
+        return registo
+
+    def _explain(self, conn, sql, params):
+        try:
+            # Connection.execute da classe base: o EXPLAIN não entra nas estatísticas
+            linhas = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return {'error': str(e)}
+        texto, scans, temporarias = _analisar_plano([tuple(linha) for linha in linhas])
+        return {'plan': texto, 'fullScans': scans, 'tempBTrees': temporarias}
+
+    # Relatório ----------------------------------------------------------------
+
+    def report(self, limit=50, order='seconds'):
+        with self._lock:
+            entradas = [dict(e) for e in self._statements.values()]
+            lentas = [dict(r) for r in self._slow]
+            planos = dict(self._plans)
+
+        chave = {'calls': 'calls', 'max': 'maxSeconds', 'rows': 'rows'}.get(order, 'seconds')
+        entradas.sort(key=lambda e: e[chave], reverse=True)
+        statements = []
+        for e in entradas[:limit]:
+            statements.append({
+                'sql': e['sql'],
+                'calls': e['calls'],
+                'totalMs': round(e['seconds'] * 1000, 3),
+                'avgMs': round(e['seconds'] * 1000 / e['calls'], 3) if e['calls'] else None,
+                'maxMs': round(e['maxSeconds'] * 1000, 3),
+                'rows': e['rows'],
+                'avgRows': round(e['rows'] / e['calls'], 1) if e['calls'] else None,
+                'slowCalls': e['slowCalls'],
+                'plan': planos.get(e['sql']),
+            })
+        return {
+            'enabled': self.enabled,
+            'thresholdMs': self.threshold_ms,
+            'since': self.started_at,
+            'distinctStatements': len(entradas),
+            'statements': statements,
+            'slow': list(reversed(lentas)),
+        }
+
+
+class _Execucao:
+    """Uma execução de uma instrução: tempo e linhas acumulados ao longo dos fetch."""
+
+    __slots__ = ('profiler', 'conn', 'sql', 'params', 'entrada', 'many', 'segundos', 'linhas', 'registo')
+
+    def __init__(self, profiler, conn, sql, params, entrada, many):
+        self.profiler = profiler
+        self.conn = conn
+        self.sql = sql
+        self.params = params
+        self.entrada = entrada
+        self.many = many
+        self.segundos = 0.0
+        self.linhas = 0
+        self.registo = None
+
+    def add(self, segundos, linhas):
+        profiler = self.profiler
+        with profiler._lock:
+            self.segundos += segundos
+            self.linhas += linhas
+            entrada = self.entrada
+            entrada['seconds'] += segundos
+            entrada['rows'] += linhas
+            if self.segundos > entrada['maxSeconds']:
+                entrada['maxSeconds'] = self.segundos
+            if self.registo is not None:
+                self.registo['ms'] = round(self.segundos * 1000, 3)
+                self.registo['rows'] = self.linhas
+                return
+        if self.segundos * 1000 >= profiler.threshold_ms:
+            self.registo = profiler._lenta(self)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor que soma o tempo e as linhas de cada fetch à execução em curso."""
+
+    _execucao = None
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        resultado = metodo(*args)
+        execucao = self._execucao
+        if execucao is not None:
+            if isinstance(resultado, list):
+                linhas = len(resultado)
+            else:
+                linhas = 0 if resultado is None else 1
+            execucao.add(time.perf_counter() - inicio, linhas)
+        return resultado
+
+    def fetchone(self):
+        return self._medir(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._medir(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._medir(super().fetchall)
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            if self._execucao is not None:
+                self._execucao.add(time.perf_counter() - inicio, 0)
+            raise
+        if self._execucao is not None:
+            self._execucao.add(time.perf_counter() - inicio, 1)
+        return linha
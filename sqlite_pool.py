@@ -0,0 +1,298 @@
+"""
+Pool de conexões SQLite por processo (WAL + pragmas afinados).
+
+`get_db()` em app.py devolve conexões deste pool. O `close()` de uma conexão do pool
+não fecha o ficheiro: devolve a conexão ao pool (fazendo rollback de qualquer transação
+deixada aberta), por isso o código existente que faz `conn.close()` continua correto.
+Cada empréstimo tem um `lease` próprio: `release(conn, lease)` só devolve a conexão se
+ainda estiver emprestada nesse empréstimo (rede de segurança no fim de cada pedido, sem
+tocar numa conexão que entretanto foi devolvida e emprestada a outro thread).
+
+Há dois pools separados:
+- escrita: conexões normais, usadas pelos endpoints que gravam votos;
+- leitura: conexões `mode=ro` + `query_only`, usadas pelos endpoints de análise do admin.
+  Em WAL os leitores não bloqueiam o escritor (nem o contrário).
+
+Depois de um fork (ex.: gunicorn com --preload) o pool descarta as conexões herdadas
+e recomeça vazio no processo filho.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from urllib.parse import quote
+
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',     # seguro em WAL; só o checkpoint faz fsync
+    'busy_timeout': 5000,        # ms à espera de lock antes de "database is locked"
+    'cache_size': -8000,         # ~8 MB de page cache por conexão
+    'mmap_size': 268435456,      # 256 MB mapeados (partilhados via page cache do SO)
+    'temp_store': 'MEMORY',
+}
+
+
+class PooledConnection(sqlite3.Connection):
+    """Conexão cujo close() devolve a conexão ao pool de origem."""
+
+    _pool = None
+    _readonly = False
+    _checked_out = False
+    lease = None
+    _on_query = None
+    _profiler = None
+
+    def execute(self, sql, *args):
+        profiler = self._profiler
+        if profiler is not None and profiler.enabled:
+            return self._execute_profiled(profiler, sql, args, many=False)
+        if self._on_query is None:
+            return super().execute(sql, *args)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            self._on_query(sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, *args):
+        profiler = self._profiler
+        if profiler is not None and profiler.enabled:
+            return self._execute_profiled(profiler, sql, args, many=True)
+        if self._on_query is None:
+            return super().executemany(sql, *args)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            self._on_query(sql, time.perf_counter() - inicio)
+
+    def _execute_profiled(self, profiler, sql, args, many):
+        """execute()/executemany() com um cursor do profiler (tempo e linhas até ao último fetch)."""
+        cursor = self.cursor(profiler.cursor_factory)
+        inicio = time.perf_counter()
+        try:
+            if many:
+                cursor.executemany(sql, *args)
+            else:
+                cursor.execute(sql, *args)
+        finally:
+            segundos = time.perf_counter() - inicio
+            if self._on_query is not None:
+                self._on_query(sql, segundos)
+        execucao = profiler.start(self, sql, () if many or not args else args[0], segundos, many=many)
+        if not many:
+            cursor._execucao = execucao
+        return cursor
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool._release(self)
+
+    def _close_for_real(self):
+        self._pool = None
+        super().close()
+
+
+class _PoolStats:
+    def __init__(self):
+        self.created = 0
+        self.acquired = 0
+        self.reused = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'acquired': self.acquired,
+            'reused': self.reused,
+            'waits': self.waits,
+            'waitTimeMs': round(self.wait_time * 1000, 3),
+            'timeouts': self.timeouts,
+            'discarded': self.discarded,
+        }
+
+
+class _Pool:
+    """Pool de um tipo de conexão (leitura ou escrita)."""
+
+    def __init__(self, factory, max_size, timeout):
+        self._factory = factory
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self._idle = deque()
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = _PoolStats()
+
+    def acquire(self):
+        with self._cond:
+            waited_since = None
+            while not self._idle and self._in_use >= self.max_size:
+                if waited_since is None:
+                    waited_since = time.perf_counter()
+                    self.stats.waits += 1
+                remaining = self.timeout - (time.perf_counter() - waited_since)
+                if remaining <= 0:
+                    self.stats.timeouts += 1
+                    raise sqlite3.OperationalError(
+                        f'Pool SQLite esgotado ({self.max_size} conexões em uso há {self.timeout}s)'
+                    )
+                self._cond.wait(remaining)
+            if waited_since is not None:
+                self.stats.wait_time += time.perf_counter() - waited_since
+
+            self._in_use += 1
+            self.stats.acquired += 1
+            if self._idle:
+                self.stats.reused += 1
+                conn = self._idle.pop()
+                conn._checked_out = True
+                conn.lease = object()
+                return conn
+
+        try:
+            conn = self._factory()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        self.stats.created += 1
+        conn._checked_out = True
+        conn.lease = object()
+        return conn
+
+    def release(self, conn, lease=None):
+        with self._cond:
+            # close() repetido não pode devolver a mesma conexão duas vezes
+            if not conn._checked_out or (lease is not None and conn.lease is not lease):
+                return
+            conn._checked_out = False
+            conn.lease = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = True
+        except sqlite3.Error:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append(conn)
+            else:
+                self.stats.discarded += 1
+            self._cond.notify()
+        if not healthy:
+            try:
+                conn._close_for_real()
+            except sqlite3.Error:
+                pass
+
+    def close_idle(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            conn._close_for_real()
+
+    def snapshot(self):
+        with self._cond:
+            data = {
+                'maxSize': self.max_size,
+                'inUse': self._in_use,
+                'idle': len(self._idle),
+            }
+        data.update(self.stats.as_dict())
+        return data
+
+
+class SQLitePool:
+    """Pools de leitura e escrita para um ficheiro SQLite."""
+
+    def __init__(self, path, max_size=8, readonly_max_size=8, timeout=10.0, pragmas=None, row_factory=sqlite3.Row,
+                 on_query=None, profiler=None):
+        self.path = path
+        # on_query(sql, segundos): chamado após cada conn.execute/executemany (métricas)
+        self.on_query = on_query
+        # Profiler de SQL opcional (sql_profiler.SqlProfiler); só atua com profiler.enabled
+        self.profiler = profiler
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.row_factory = row_factory
+        self._max_size = max_size
+        self._readonly_max_size = readonly_max_size
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._orphans = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._writers = _Pool(lambda: self._connect(readonly=False), self._max_size, self._timeout)
+        self._readers = _Pool(lambda: self._connect(readonly=True), self._readonly_max_size, self._timeout)
+
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Não fechar conexões herdadas do processo pai: apenas esquecê-las.
+                self._orphans.append((self._writers, self._readers))
+                self._reset()
+
+    def _connect(self, readonly):
+        if readonly:
+            uri = f'file:{quote(os.path.abspath(self.path))}?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, factory=PooledConnection, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        if readonly:
+            conn.execute('PRAGMA query_only=ON')
+
+        conn.row_factory = self.row_factory
+        conn._on_query = self.on_query
+        conn._profiler = self.profiler
+        conn._readonly = readonly
+        conn._pool = self
+        return conn
+
+    def connection(self, readonly=False):
+        """Obtém uma conexão do pool. Devolver com `conn.close()`."""
+        self._check_fork()
+        pool = self._readers if readonly else self._writers
+        return pool.acquire()
+
+    def _release(self, conn, lease=None):
+        if conn._pool is not self or self._pid != os.getpid():
+            # Conexão de um pool antigo (antes do fork): não reaproveitar.
+            return
+        pool = self._readers if conn._readonly else self._writers
+        pool.release(conn, lease)
+
+    def release(self, conn, lease):
+        """Devolve `conn` se ainda estiver emprestada com `lease` (senão não faz nada)."""
+        self._release(conn, lease)
+
+    def close_all(self):
+        """Fecha as conexões livres (as que estão em uso fecham ao serem devolvidas)."""
+        self._writers.close_idle()
+        self._readers.close_idle()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'pid': self._pid,
+            'pragmas': self.pragmas,
+            'write': self._writers.snapshot(),
+            'read': self._readers.snapshot(),
+        }
@@ -0,0 +1,93 @@
+"""
+Arranque medido: tempo de cada fase do cold start, reportado em /api/health.
+
+É o primeiro módulo importado por app.py, por isso `T0` marca o início da importação
+da aplicação. Cada fase (imports, base de dados, Firebase, warm-up...) regista a
+duração e, para as que correm fora da importação (em background ou no primeiro uso),
+também o instante em que terminou relativamente a `T0`.
+
+Modos (STARTUP_MODE):
+- eager: tudo é inicializado durante o import (comportamento antigo);
+- background: o import só faz o essencial e uma thread de warm-up inicializa o
+  Firebase e pré-carrega os módulos pesados (openpyxl, NumPy) logo a seguir;
+- lazy: nada de opcional no import; o Firebase é inicializado no primeiro uso
+  (replicador, login admin) e os módulos pesados quando um endpoint precisa deles.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+T0 = time.perf_counter()
+
+MODES = ('eager', 'background', 'lazy')
+
+
+def process_age_seconds():
+    """Segundos desde o arranque do processo (Linux: /proc), ou None se não for possível."""
+    try:
+        with open('/proc/self/stat', encoding='ascii') as f:
+            # O 2.º campo (nome do executável) pode ter espaços: contar a partir do ')'
+            campos = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', encoding='ascii') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(campos[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """Durações das fases do arranque deste processo."""
+
+    def __init__(self, mode):
+        self.mode = mode if mode in MODES else 'eager'
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._ready_ms = None
+        self._first_request_ms = None
+        # Tempo entre o exec do interpretador e o import de app.py (Python + gunicorn)
+        idade = process_age_seconds()
+        self._before_import_ms = round(idade * 1000, 1) if idade is not None else None
+
+    @staticmethod
+    def _ms_desde_t0():
+        return round((time.perf_counter() - T0) * 1000, 1)
+
+    def record(self, name, seconds, **extra):
+        with self._lock:
+            self._phases[name] = dict(
+                extra,
+                ms=round(seconds * 1000, 1),
+                endedAtMs=self._ms_desde_t0(),
+                thread=threading.current_thread().name,
+            )
+
+    @contextmanager
+    def phase(self, name, **extra):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - inicio, **extra)
+
+    def ready(self):
+        """Fim da importação da aplicação (o worker pode começar a aceitar pedidos)."""
+        self._ready_ms = self._ms_desde_t0()
+
+    def first_request(self):
+        if self._first_request_ms is None:
+            with self._lock:
+                if self._first_request_ms is None:
+                    self._first_request_ms = self._ms_desde_t0()
+
+    def report(self):
+        with self._lock:
+            phases = {name: dict(p) for name, p in self._phases.items()}
+        return {
+            'mode': self.mode,
+            'pid': os.getpid(),
+            'beforeImportMs': self._before_import_ms,
+            'importMs': self._ready_ms,
+            'firstRequestMs': self._first_request_ms,
+            'phases': phases,
+        }
@@ -3,6 +3,8 @@ let barChart = null;
 let pieChart = null;
 let comparisonChart = null;
 let currentPage = 1;
+// Cursores da paginação por chave: historyCursors[n] = cursor que devolve a página n
+let historyCursors = { 1: null };
 let historyFilters = {
     q: '',
     grau: '',
@@ -311,9 +313,13 @@ async function loadAvailableDates() {
 // Carregar histórico
 async function loadHistory(page = 1) {
     try {
+        // Página 1 (ou filtros novos): recomeçar os cursores
+        if (page === 1) historyCursors = { 1: null };
+
         const params = new URLSearchParams();
         params.set('page', String(page));
         params.set('per_page', '50');
+        if (historyCursors[page]) params.set('cursor', historyCursors[page]);
         if (historyFilters.q) params.set('q', historyFilters.q);
         if (historyFilters.grau) params.set('grau', historyFilters.grau);
         if (historyFilters.data_inicio) params.set('data_inicio', historyFilters.data_inicio);
@@ -358,6 +364,7 @@ async function loadHistory(page = 1) {
         }).join('');
         
         // Atualizar paginação
+        if (data.next_cursor) historyCursors[page + 1] = data.next_cursor;
         updatePagination(data);
         currentPage = page;
         
@@ -385,17 +392,19 @@ function updatePagination(data) {
         <button ${data.page <= 1 ? 'disabled' : ''} onclick="loadHistory(${data.page - 1})">
             ← Anterior
         </button>
-        <span>Página ${data.page} de ${data.total_pages}</span>
-        <button ${data.page >= data.total_pages ? 'disabled' : ''} onclick="loadHistory(${data.page + 1})">
+        <span>Página ${data.page} de ${data.total_pages ?? '—'}</span>
+        <button ${!data.has_more ? 'disabled' : ''} onclick="loadHistory(${data.page + 1})">
             Próxima →
         </button>
     `;
 }
 
-// Exportar CSV
-function exportCSV() {
+// Exportar Excel (job em background: criar, acompanhar o progresso e descarregar)
+async function exportCSV() {
     const dataInicio = document.getElementById('export-date-inicio').value;
     const dataFim = document.getElementById('export-date-fim').value;
+    const button = document.getElementById('export-csv');
+    const label = button.textContent;
     
     let url = '/api/admin/export/csv';
     
@@ -403,7 +412,38 @@ function exportCSV() {
         url += `?data_inicio=${dataInicio}&data_fim=${dataFim}`;
     }
     
-    window.location.href = url;
+    try {
+        button.disabled = true;
+        const resp = await fetch('/api/admin/export/jobs', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                format: 'xlsx',
+                data_inicio: dataInicio && dataFim ? dataInicio : null,
+                data_fim: dataInicio && dataFim ? dataFim : null
+            })
+        });
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+        let job = await resp.json();
+        
+        while (job.status === 'queued' || job.status === 'running') {
+            button.textContent = `⏳ A gerar... ${Math.round((job.progress || 0) * 100)}%`;
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const poll = await fetch(`/api/admin/export/jobs/${job.id}`, { cache: 'no-store' });
+            if (!poll.ok) throw new Error(`HTTP ${poll.status}`);
+            job = await poll.json();
+        }
+        
+        if (job.status !== 'done') throw new Error(job.error || job.status);
+        window.location.href = job.downloadUrl;
+    } catch (error) {
+        // Sem jobs disponíveis: exportação direta (no próprio pedido)
+        console.error('Erro no job de exportação:', error);
+        window.location.href = url;
+    } finally {
+        button.disabled = false;
+        button.textContent = label;
+    }
 }
 
 // Exportar TXT
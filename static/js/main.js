@@ -126,38 +126,74 @@ function saveQueue(queue) {
     } catch (e) {}
 }
 
-function enqueueFeedback(grau_satisfacao) {
+// Id de cada voto gerado no kiosk: o servidor ignora reenvios de um voto já gravado
+// (resposta perdida), por isso reenviar a fila nunca conta o mesmo voto duas vezes
+function newClientId() {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+        return window.crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+}
+
+function enqueueFeedback(grau_satisfacao, clientId) {
     const queue = loadQueue();
-    queue.push({ grau_satisfacao, createdAt: new Date().toISOString() });
+    queue.push({ grau_satisfacao, createdAt: new Date().toISOString(), clientId: clientId || newClientId() });
     saveQueue(queue);
     updateOnlineStatus();
 }
 
+const FLUSH_BATCH_SIZE = 200;
+
+// 429 (servidor sobrecarregado) e 503 (a restaurar dados): o voto fica na fila e é
+// reenviado depois do Retry-After indicado pelo servidor
+function isRetryLater(response) {
+    return response.status === 429 || response.status === 503;
+}
+
+let flushTimer = null;
+function scheduleFlush(response) {
+    const seconds = parseInt(response.headers.get('Retry-After'), 10);
+    if (flushTimer) clearTimeout(flushTimer);
+    flushTimer = setTimeout(() => {
+        flushTimer = null;
+        flushQueue();
+    }, (Number.isFinite(seconds) && seconds > 0 ? seconds : 5) * 1000);
+}
+
 let flushing = false;
 async function flushQueue() {
     if (flushing) return;
     if (!navigator.onLine) return;
-    const queue = loadQueue();
+    let queue = loadQueue();
     if (!queue.length) return;
 
     flushing = true;
     try {
+        // Reenvia a fila em blocos: um pedido por bloco em vez de um por voto
         while (queue.length) {
-            const item = queue[0];
-            const response = await fetch('/api/feedback', {
+            const chunk = queue.slice(0, FLUSH_BATCH_SIZE);
+            const response = await fetch('/api/feedback/batch', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ grau_satisfacao: item.grau_satisfacao })
+                body: JSON.stringify({
+                    items: chunk.map(item => ({
+                        grau_satisfacao: item.grau_satisfacao,
+                        createdAt: item.createdAt,
+                        clientId: item.clientId
+                    }))
+                })
             });
             if (!response.ok) {
                 // para e tenta mais tarde
+                if (isRetryLater(response)) scheduleFlush(response);
                 break;
             }
-            queue.shift();
+            // Itens inválidos também saem da fila (nunca seriam aceites)
+            queue = loadQueue().slice(chunk.length);
             saveQueue(queue);
             updateOnlineStatus();
-            await fetchSummary();
         }
+        await fetchSummary();
     } catch (e) {
         // ignora
     } finally {
@@ -165,29 +201,61 @@ async function flushQueue() {
     }
 }
 
+function renderSummary(data) {
+    if (sumToday) sumToday.textContent = String(data.todayTotal ?? '—');
+    if (sumTotal) sumTotal.textContent = String(data.total ?? '—');
+    if (sumLastId) sumLastId.textContent = (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId);
+    if (sumFirebase) sumFirebase.textContent = data.firebaseAvailable ? 'Online' : 'Offline';
+
+    if (sumTodayBreakdown && data.today) {
+        const ms = data.today.muito_satisfeito ?? 0;
+        const s = data.today.satisfeito ?? 0;
+        const i = data.today.insatisfeito ?? 0;
+        sumTodayBreakdown.textContent = `😊 ${ms}  ·  🙂 ${s}  ·  😞 ${i}`;
+    }
+}
+
 async function fetchSummary() {
     if (!sumToday && !sumTotal && !sumLastId && !sumFirebase) return;
     try {
-        const resp = await fetch('/api/public/summary', { cache: 'no-store' });
+        // 'no-cache' revalida com ETag: o servidor responde 304 se nada mudou
+        const resp = await fetch('/api/public/summary', { cache: 'no-cache' });
         const data = await resp.json();
         if (!resp.ok) return;
-
-        if (sumToday) sumToday.textContent = String(data.todayTotal ?? '—');
-        if (sumTotal) sumTotal.textContent = String(data.total ?? '—');
-        if (sumLastId) sumLastId.textContent = (data.lastId === null || data.lastId === undefined) ? '—' : String(data.lastId);
-        if (sumFirebase) sumFirebase.textContent = data.firebaseAvailable ? 'Online' : 'Offline';
-
-        if (sumTodayBreakdown && data.today) {
-            const ms = data.today.muito_satisfeito ?? 0;
-            const s = data.today.satisfeito ?? 0;
-            const i = data.today.insatisfeito ?? 0;
-            sumTodayBreakdown.textContent = `😊 ${ms}  ·  🙂 ${s}  ·  😞 ${i}`;
-        }
+        renderSummary(data);
     } catch (e) {
         // ignora
     }
 }
 
+// Atualizações em tempo real (SSE). Enquanto o stream estiver aberto o polling é desligado.
+let summaryStream = null;
+function openSummaryStream() {
+    if (!window.EventSource) return;
+    if (!sumToday && !sumTotal && !sumLastId && !sumFirebase) return;
+    if (summaryStream && summaryStream.readyState !== EventSource.CLOSED) return;
+
+    summaryStream = new EventSource('/api/stream/summary');
+    summaryStream.addEventListener('summary', (event) => {
+        try {
+            renderSummary(JSON.parse(event.data));
+        } catch (e) {
+            // ignora
+        }
+    });
+    // Se o servidor recusar (ex.: 503 por excesso de streams), o EventSource fecha e
+    // o polling volta a assumir; tenta de novo mais tarde.
+    summaryStream.addEventListener('error', () => {
+        if (summaryStream.readyState === EventSource.CLOSED) {
+            setTimeout(openSummaryStream, 60000);
+        }
+    });
+}
+
+function summaryStreamOpen() {
+    return !!(summaryStream && summaryStream.readyState === EventSource.OPEN);
+}
+
 // Estado online/offline
 function updateOnlineStatus() {
     if (!statusPill) return;
@@ -211,9 +279,12 @@ window.addEventListener('online', () => {
     fetchSummary();
 });
 
-// Carregar resumo ao iniciar e periodicamente
+// Carregar resumo ao iniciar; depois via SSE, com polling só quando o stream não está aberto
 fetchSummary();
-setInterval(fetchSummary, 30000);
+openSummaryStream();
+setInterval(() => {
+    if (!summaryStreamOpen()) fetchSummary();
+}, 30000);
 
 // Adicionar event listeners aos botões
 feedbackButtons.forEach(button => {
@@ -228,6 +299,7 @@ async function handleFeedbackClick(event) {
     
     const button = event.currentTarget;
     const feedbackType = button.getAttribute('data-feedback');
+    const clientId = newClientId();
     
     // Desabilitar cliques temporariamente
     disableButtons();
@@ -236,7 +308,7 @@ async function handleFeedbackClick(event) {
         showMessage('A enviar…', 'loading');
 
         if (!navigator.onLine) {
-            enqueueFeedback(feedbackType);
+            enqueueFeedback(feedbackType, clientId);
             showMessage('Sem internet: guardado e será enviado automaticamente.', 'success');
             beep(520, 0.06);
             vibrate(20);
@@ -250,10 +322,21 @@ async function handleFeedbackClick(event) {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                grau_satisfacao: feedbackType
+                grau_satisfacao: feedbackType,
+                clientId
             })
         });
 
+        if (isRetryLater(response)) {
+            enqueueFeedback(feedbackType, clientId);
+            scheduleFlush(response);
+            updateOnlineStatus();
+            showMessage('Obrigado! O seu feedback será enviado dentro de momentos.', 'success');
+            beep(520, 0.06);
+            vibrate(20);
+            return;
+        }
+
         const data = await response.json();
 
         if (response.ok) {
@@ -279,7 +362,7 @@ async function handleFeedbackClick(event) {
         }
     } catch (error) {
         console.error('Erro:', error);
-        enqueueFeedback(feedbackType);
+        enqueueFeedback(feedbackType, clientId);
         showMessage('Falha de conexão: guardado e será enviado automaticamente.', 'success');
         beep(520, 0.06);
         vibrate(20);
@@ -48,7 +48,8 @@ async function tryWakeLock() {
 }
 
 async function fetchJSON(url) {
-    const resp = await fetch(url, { cache: 'no-store' });
+    // 'no-cache' revalida com ETag: o servidor responde 304 se nada mudou
+    const resp = await fetch(url, { cache: 'no-cache' });
     const data = await resp.json().catch(() => ({}));
     if (!resp.ok) throw new Error(data.error || `HTTP ${resp.status}`);
     return data;
@@ -163,6 +164,34 @@ async function refreshAll() {
     }
 }
 
+// Atualizações em tempo real: cada voto gravado (em qualquer worker) chega como evento SSE
+// e dispara um refresh (os endpoints respondem 304 se nada mudou).
+let liveStream = null;
+let liveRefreshTimer = null;
+function openLiveStream() {
+    if (!window.EventSource) return;
+    if (liveStream && liveStream.readyState !== EventSource.CLOSED) return;
+
+    liveStream = new EventSource('/api/stream/summary');
+    liveStream.addEventListener('summary', () => {
+        // Agrupa rajadas de votos num único refresh
+        if (liveRefreshTimer) return;
+        liveRefreshTimer = setTimeout(() => {
+            liveRefreshTimer = null;
+            refreshAll();
+        }, 500);
+    });
+    liveStream.addEventListener('error', () => {
+        if (liveStream.readyState === EventSource.CLOSED) {
+            setTimeout(openLiveStream, 60000);
+        }
+    });
+}
+
+function liveStreamOpen() {
+    return !!(liveStream && liveStream.readyState === EventSource.OPEN);
+}
+
 function setupActions() {
     const fsBtn = $('tv-fullscreen');
     const refreshBtn = $('tv-refresh');
@@ -210,4 +239,7 @@ tickClock();
 setInterval(tickClock, 1000);
 tryWakeLock();
 refreshAll();
-setInterval(refreshAll, 15000);
+openLiveStream();
+setInterval(() => {
+    if (!liveStreamOpen()) refreshAll();
+}, 15000);
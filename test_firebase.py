@@ -104,11 +104,13 @@ def test_create_feedback():
                        'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
         dia_semana = dias_semana[now.weekday()]
         
-        # Guardar no SQLite
+        # Guardar no SQLite (tabela compacta: `feedback` é uma view e o INSERT nela
+        # não devolve o lastrowid)
+        import migrations
         conn = sqlite3.connect('feedback.db')
         cursor = conn.execute(
-            'INSERT INTO feedback (grau_satisfacao, data, hora, dia_semana) VALUES (?, ?, ?, ?)',
-            (grau_satisfacao, data_str, hora_str, dia_semana)
+            'INSERT INTO feedback_rows (ts, grau) VALUES (?, ?)',
+            (migrations.to_ts(now), migrations.GRAU_CODES[grau_satisfacao])
         )
         conn.commit()
         feedback_id = cursor.lastrowid
@@ -136,6 +138,56 @@ def test_create_feedback():
         print(f"✗ Erro ao criar feedback: {e}")
         return False
 
+def test_hydrate_emulator():
+    """Teste 5: Hidratação do SQLite a partir do Firestore (emulador)"""
+    print("\n" + "=" * 60)
+    print("TESTE 5: Hidratação a partir do Firestore (emulador)")
+    print("=" * 60)
+    if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        print("ℹ FIRESTORE_EMULATOR_HOST não definido (firebase emulators:start --only firestore); teste ignorado")
+        return True
+    try:
+        import sqlite3
+        import tempfile
+        import time
+        from google.cloud import firestore
+        import hydrate
+        import migrations
+
+        client = firestore.Client(project=os.environ.get('GCLOUD_PROJECT', 'demo-feedback'))
+        colecao = f'feedback_hydrate_{int(time.time())}'
+        total = 2500
+        batch = client.batch()
+        for i in range(1, total + 1):
+            batch.set(client.collection(colecao).document(f'feedback_{i}'), {
+                'grau_satisfacao': ['insatisfeito', 'satisfeito', 'muito_satisfeito'][i % 3],
+                'data': f'2025-01-{1 + i % 28:02d}',
+                'hora': '12:00:00',
+                'id': i,
+            })
+            if i % 500 == 0:
+                batch.commit()
+                batch = client.batch()
+
+        with tempfile.TemporaryDirectory() as pasta:
+            conn = sqlite3.connect(os.path.join(pasta, 'hydrate.db'))
+            migrations.migrate(conn)
+            r = hydrate.hydrate(conn, client, {}, collection=colecao, page_size=300, parallelism=4)
+            print(f"✓ {r['inserted']} votos hidratados em {r['seconds']}s ({r['pages']} páginas)")
+            assert r['hydrated'] and r['inserted'] == total and r['maxId'] == total, r
+            assert conn.execute('SELECT SUM(total) FROM feedback_daily_counts').fetchone()[0] == total
+            assert conn.execute('INSERT INTO feedback_rows (ts, grau) VALUES (0, 0)').lastrowid == total + 1
+            conn.rollback()
+            assert hydrate.hydrate(conn, client, {}, collection=colecao)['reason'] == 'up-to-date'
+            conn.close()
+
+        for doc in client.collection(colecao).list_documents():
+            doc.delete()
+        return True
+    except Exception as e:
+        print(f"✗ Erro na hidratação: {e!r}")
+        return False
+
 def main():
     """Executar todos os testes"""
     print("\n")
@@ -149,6 +201,7 @@ def main():
     results.append(("SQLite", test_database()))
     results.append(("Firebase", test_firebase()))
     results.append(("Criar Feedback", test_create_feedback()))
+    results.append(("Hidratação (emulador)", test_hydrate_emulator()))
     
     # Resumo
     print("\n" + "=" * 60)